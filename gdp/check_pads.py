@@ -12,13 +12,27 @@ Examples of produced keys:
 Usage:
   python kicad_pcb_pad_via_stats.py path/to/board.kicad_pcb
   python kicad_pcb_pad_via_stats.py path/to/board.kicad_pcb --csv stats.csv
+  python kicad_pcb_pad_via_stats.py path/to/board.kicad_pcb --mmap
+  python kicad_pcb_pad_via_stats.py rev1.kicad_pcb rev2.kicad_pcb --csv stats.csv
+  python kicad_pcb_pad_via_stats.py boards/ "archive/*.kicad_pcb" --jobs 4
+  python kicad_pcb_pad_via_stats.py huge.kicad_pcb --split --jobs 8
+  python kicad_pcb_pad_via_stats.py board.kicad_pcb --stats --profile=scan.prof
+  python kicad_pcb_pad_via_stats.py board.kicad_pcb --lib --lib Package_DIP.pretty
 """
 
 from __future__ import annotations
 import argparse
 import collections
+import concurrent.futures
+import functools
+import glob
+import mmap
+import os
 import re
-from typing import Tuple, Dict, List, Optional
+from typing import Tuple, Dict, List, NamedTuple, Optional, Union
+
+import perf
+import sexpr
 
 PadKey = str
 ViaKey = str
@@ -45,205 +59,351 @@ def _join_size(a: Optional[str], b: Optional[str]) -> str:
         return _norm_num(a)
     return ""
 
-def _extract_block(text: str, start_idx: int) -> Tuple[str, int]:
+# One scan per block for the fields we need. Field bodies may hold quoted
+# strings (with parentheses in net names) and one nested level such as
+# (drill (offset x y) 0.8). Strings and bodies are written as unrolled loops,
+# X*(?:Y X*)*, so a body that never closes cannot backtrack exponentially.
+_STR = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+_HEADER_RE = re.compile(r'\(\s*(pad|via)((?:\s+(?:' + _STR + r'|[^\s()"]+))*)')
+_FIELD_RE = re.compile(r'\((size|drill|layers|net)\s([^()"]*(?:(?:' + _STR + r'|\([^()]*\))[^()"]*)*)\)')
+_VALUE_RE = re.compile(r'(' + _STR + r')|([^\s()"]+)|\([^()]*\)')
+
+@functools.lru_cache(maxsize=4096)
+def _values(s: str) -> Tuple[str, ...]:
     """
-    Given text and an index pointing at '(' of a (pad ...) or (via ...),
-    return the full S-expression block and the index just after it.
+    Atoms and unquoted strings of a field body; nested (...) groups are dropped.
+    Bodies repeat a lot across a board (sizes, layers, net names), hence the cache.
     """
-    depth = 0
-    i = start_idx
-    while i < len(text):
-        c = text[i]
-        if c == '(':
-            depth += 1
-        elif c == ')':
-            depth -= 1
-            if depth == 0:
-                # include this ')'
-                return text[start_idx:i+1], i+1
-        i += 1
-    # If we get here, parentheses were unbalanced; return to end
-    return text[start_idx:], len(text)
-
-def _first_tokens(expr: str, n: int = 5) -> List[str]:
+    if '"' not in s and "(" not in s:
+        return tuple(s.split())
+    out = []
+    for m in _VALUE_RE.finditer(s):
+        if m.group(1) is not None:
+            out.append(sexpr.unquote(m.group(1)))
+        elif m.group(2) is not None:
+            out.append(m.group(2))
+    return tuple(out)
+
+def _is_num(s: str) -> bool:
+    try:
+        float(s)
+        return True
+    except ValueError:
+        return False
+
+@functools.lru_cache(maxsize=1024)
+def _drill_key(body: str) -> str:
     """
-    Tokenize the first line-ish of an S-expression to get early fields.
-    For pads, we want tokens like: (pad "1" thru_hole circle ...
+    Normalize the body of a (drill ...) field:
+      (drill 0.8)                  -> '0.8'
+      (drill oval 1.0 0.6)         -> 'oval 1x0.6'
+      (drill (offset x y) 0.8)     -> '0.8'   (nested groups are ignored)
+      (drill oval 1.0 0.6 (offset x y)) -> 'oval 1x0.6'
+    A drill with an offset gets the same key as without it; the old regexes
+    keyed the oval form as '1x0.6' and the round form as 'e' (from 'offset').
     """
-    # Replace newlines to avoid accidental line truncation
-    head = expr[:200].replace("\n", " ")
-    # crude tokenization respecting simple quotes
-    tokens = re.findall(r'"[^"]*"|\S+', head)
-    return tokens[:n]
+    values = _values(body)
+    nums = [v for v in values if _is_num(v)]
+    if "oval" in values and len(nums) >= 2:
+        return f"oval {_norm_num(nums[0])}x{_norm_num(nums[1])}"
+    if len(nums) >= 2:
+        return f"{_norm_num(nums[0])}x{_norm_num(nums[1])}"
+    if nums:
+        return _norm_num(nums[0])
+    return ""
 
 # ---------- Extractors ----------
 
-def parse_pad(expr: str) -> Optional[PadKey]:
+class BlockFields(NamedTuple):
+    kind: str                       # 'pad' or 'via'
+    name: str                       # pad number, '' for vias
+    type: str                       # thru_hole, smd, np_thru_hole, connect, '' for vias
+    shape: str                      # circle, oval, rect, ..., '' for vias
+    size: Tuple[str, ...]           # raw (size ...) values
+    drill: str                      # normalized drill, see _drill_key
+    layers: Tuple[str, ...]
+    net: str                        # net name (or number if unnamed), '' if none
+
+def extract_fields(text: str, start: int = 0, end: Optional[int] = None) -> Optional[BlockFields]:
     """
-    Build a normalized key for a (pad ...) block.
+    Pull everything needed from a (pad ...) or (via ...) block in one scan of
+    text[start:end]: the header, then size, drill, layers and net fields.
+    The first size and drill found win.
     Pad header format (v6/v7/v8):
       (pad "<number>" <type> <shape> ... (size a b) ... (drill ...) ...)
-    We’ll key by: "<shape> size:<AxB> drill:<...>" (drill omitted if absent).
-    """
-    tokens = _first_tokens(expr, n=6)
-    if not tokens or tokens[0] != "(pad":
-        return None
-
-    # Expect something like: (pad "1" thru_hole circle
-    # shape is usually tokens[4], but pad names can contain spaces in quotes.
-    # Tokens: 0:(pad 1:"…"? 2:type 3:shape ...
-    # We’ll scan the first few tokens after (pad and quoted name to find type+shape.
-    # Find first non-quoted after (pad and name
-    i = 1
-    # name (quoted or not)
-    if i < len(tokens) and tokens[i].startswith('"'):
-        i += 1
-    # type
-    pad_type = tokens[i] if i < len(tokens) else ""
-    i += 1
-    # shape
-    shape = tokens[i] if i < len(tokens) else ""
-    shape = shape.strip(')"(')
-
-    # size (size a b)
-    m_size = re.search(r"\(size\s+([^\s\)]+)(?:\s+([^\s\)]+))?\)", expr)
-    size_a = size_b = None
-    if m_size:
-        size_a, size_b = m_size.group(1), m_size.group(2) or m_size.group(1)
-
-    # drill forms:
-    # (drill 0.8)
-    # (drill oval 0.8 1.0)
-    # (drill (offset x y) 0.8)  -> rare; we’ll still try to capture numbers
-    drill_str = ""
-    m_drill_simple = re.search(r"\(drill\s+([0-9eE\.\+\-]+)\s*\)", expr)
-    m_drill_oval = re.search(r"\(drill\s+oval\s+([^\s\)]+)\s+([^\s\)]+)\s*\)", expr)
-    if m_drill_oval:
-        d1, d2 = m_drill_oval.group(1), m_drill_oval.group(2)
-        drill_str = f"oval {_norm_num(d1)}x{_norm_num(d2)}"
-    elif m_drill_simple:
-        d = m_drill_simple.group(1)
-        drill_str = _norm_num(d)
-    else:
-        # try any two numbers in (drill ...) if odd form
-        m_drill_any = re.search(r"\(drill[^\)]*?([0-9eE\.\+\-]+)(?:\s+([0-9eE\.\+\-]+))?", expr)
-        if m_drill_any:
-            if m_drill_any.group(2):
-                drill_str = f"{_norm_num(m_drill_any.group(1))}x{_norm_num(m_drill_any.group(2))}"
-            else:
-                drill_str = _norm_num(m_drill_any.group(1))
-
-    size_key = _join_size(size_a, size_b) if (size_a or size_b) else ""
-    parts = [shape.lower() if shape else "unknown",]
-    if size_key:
-        parts.append(f"size:{size_key}")
-    if drill_str:
-        parts.append(f"drill:{drill_str}")
-    return " ".join(parts) if parts else None
-
-
-def parse_via(expr: str) -> Optional[ViaKey]:
-    """
-    Build a normalized key for a (via ...) block.
-    Typical:
+    Via:
       (via (at x y) (size 0.8) (drill 0.4) (layers "F.Cu" "B.Cu"))
-    Keyed as: 'via size:<s> drill:<d>'
     """
-    if not expr.lstrip().startswith("(via"):
+    if end is None:
+        end = len(text)
+    m = _HEADER_RE.match(text, start, end)
+    if not m:
         return None
+    kind = m.group(1)
+    header = _values(m.group(2))
+
+    size: Tuple[str, ...] = ()
+    drill = ""
+    layers: Tuple[str, ...] = ()
+    net = ""
+    seen_size = seen_drill = False
+    for f in _FIELD_RE.finditer(text, m.end(), end):
+        field = f.group(1)
+        if field == "size":
+            if not seen_size:
+                size = _values(f.group(2))
+                seen_size = True
+        elif field == "drill":
+            if not seen_drill:
+                drill = _drill_key(f.group(2))
+                seen_drill = True
+        elif field == "layers":
+            layers = _values(f.group(2))
+        else:
+            values = _values(f.group(2))
+            net = values[-1] if values else ""
 
-    # size
-    m_size = re.search(r"\(size\s+([^\s\)]+)\s*\)", expr)
-    size_str = _norm_num(m_size.group(1)) if m_size else ""
-
-    # drill
-    drill_str = ""
-    m_drill_simple = re.search(r"\(drill\s+([0-9eE\.\+\-]+)\s*\)", expr)
-    m_drill_oval = re.search(r"\(drill\s+oval\s+([^\s\)]+)\s+([^\s\)]+)\s*\)", expr)
-    if m_drill_oval:
-        d1, d2 = m_drill_oval.group(1), m_drill_oval.group(2)
-        drill_str = f"oval {_norm_num(d1)}x{_norm_num(d2)}"
-    elif m_drill_simple:
-        d = m_drill_simple.group(1)
-        drill_str = _norm_num(d)
+    if kind == "pad":
+        name = header[0] if len(header) > 0 else ""
+        pad_type = header[1] if len(header) > 1 else ""
+        shape = header[2] if len(header) > 2 else ""
     else:
-        m_drill_any = re.search(r"\(drill[^\)]*?([0-9eE\.\+\-]+)(?:\s+([0-9eE\.\+\-]+))?", expr)
-        if m_drill_any:
-            if m_drill_any.group(2):
-                drill_str = f"{_norm_num(m_drill_any.group(1))}x{_norm_num(m_drill_any.group(2))}"
-            else:
-                drill_str = _norm_num(m_drill_any.group(1))
+        name = pad_type = shape = ""
+    return BlockFields(kind, name, pad_type, shape, size, drill, layers, net)
+
+def pad_key(fields: BlockFields) -> PadKey:
+    """Key a pad by: "<shape> size:<AxB> drill:<...>" (drill omitted if absent)."""
+    parts = [fields.shape.lower() if fields.shape else "unknown"]
+    if fields.size:
+        size_a = fields.size[0]
+        size_b = fields.size[1] if len(fields.size) > 1 else size_a
+        parts.append(f"size:{_join_size(size_a, size_b)}")
+    if fields.drill:
+        parts.append(f"drill:{fields.drill}")
+    return " ".join(parts)
 
+def via_key(fields: BlockFields) -> ViaKey:
+    """Key a via as: 'via size:<s> drill:<d>'."""
     parts = ["via"]
-    if size_str:
-        parts.append(f"size:{size_str}")
-    if drill_str:
-        parts.append(f"drill:{drill_str}")
+    if len(fields.size) == 1:
+        parts.append(f"size:{_norm_num(fields.size[0])}")
+    if fields.drill:
+        parts.append(f"drill:{fields.drill}")
     return " ".join(parts)
 
+def parse_pad(expr: str) -> Optional[PadKey]:
+    """Build a normalized key for a (pad ...) block."""
+    fields = extract_fields(expr)
+    if not fields or fields.kind != "pad":
+        return None
+    return pad_key(fields)
+
+def parse_via(expr: str) -> Optional[ViaKey]:
+    """Build a normalized key for a (via ...) block."""
+    fields = extract_fields(expr)
+    if not fields or fields.kind != "via":
+        return None
+    return via_key(fields)
+
 
 # ---------- Scanner ----------
 
-def scan_file(text: str) -> Tuple[Dict[PadKey, int], Dict[ViaKey, int]]:
+def scan_file(text: Union[str, bytes, mmap.mmap], pos: int = 0, endpos: Optional[int] = None,
+              footprints: Optional[Dict[str, Dict[PadKey, int]]] = None
+              ) -> Tuple[Dict[PadKey, int], Dict[ViaKey, int]]:
     """
     Scan the entire file text, pull out (pad ...) and (via ...) blocks, and count keys.
+    text may also be raw bytes or an mmap of the file; then only the pad and
+    via blocks are decoded. pos/endpos restrict the scan to one range.
+    footprints maps library footprint names to the pad counts of one copy
+    (see library.py); placed copies of those are counted from it, unscanned,
+    unless their number of pads differs.
     """
+    if footprints:
+        return _scan_with_library(text, pos, endpos, footprints)
     pad_counts = collections.Counter()
     via_counts = collections.Counter()
+    binary = not isinstance(text, str)
 
-    i = 0
-    while i < len(text):
-        # Quick find next '(' to avoid scanning every char
-        j = text.find('(', i)
-        if j == -1:
-            break
-
-        # Look ahead to decide type
-        # We accept whitespace between '(' and token
-        k = j + 1
-        while k < len(text) and text[k].isspace():
-            k += 1
-
-        # Fetch next few letters
-        token = text[k:k+3].lower()  # 'pad' or 'via'
-        if token.startswith("pad") or token.startswith("via"):
-            expr, end_idx = _extract_block(text, j)
-
-            if token.startswith("pad"):
-                key = parse_pad(expr)
-                if key:
-                    pad_counts[key] += 1
-            elif token.startswith("via"):
-                key = parse_via(expr)
-                if key:
-                    via_counts[key] += 1
-
-            i = end_idx
+    for head, start, end in sexpr.find_blocks(text, ("pad", "via"), pos, endpos):
+        if binary:
+            fields = extract_fields(text[start:end].decode("utf-8"))
+        else:
+            fields = extract_fields(text, start, end)
+        if fields is None:
+            continue
+        if head == "pad":
+            pad_counts[pad_key(fields)] += 1
         else:
-            i = j + 1
+            via_counts[via_key(fields)] += 1
 
     return dict(pad_counts), dict(via_counts)
 
 
+# A placed footprint, one indent level deep like every top-level item
+_FOOTPRINT_RE = re.compile(r'\n(?:\t| {2})\(footprint\s+"([^"]*)"')
+_FOOTPRINT_RE_B = re.compile(rb'\n(?:\t| {2})\(footprint\s+"([^"]*)"')
+_ITEM_RE = re.compile(r'\n(?:\t| {2})\(')
+_ITEM_RE_B = re.compile(rb'\n(?:\t| {2})\(')
+
+def _scan_with_library(text: Union[str, bytes, mmap.mmap], pos: int, endpos: Optional[int],
+                       footprints: Dict[str, Dict[PadKey, int]]) -> Tuple[Dict[PadKey, int], Dict[ViaKey, int]]:
+    """
+    scan_file() with library footprints taken from `footprints`: a placed
+    copy is skipped up to the next top-level item and counted as its library
+    footprint. A copy with a different number of pads than the library
+    entry (edited on the board, or out of date) is scanned like any other;
+    only the count is compared, so pad geometry edited on the board with the
+    same number of pads is still reported from the library.
+    """
+    if endpos is None:
+        endpos = len(text)
+    binary = not isinstance(text, str)
+    footprint_re, item_re = (_FOOTPRINT_RE_B, _ITEM_RE_B) if binary else (_FOOTPRINT_RE, _ITEM_RE)
+    pad_head = b"(pad " if binary else "(pad "
+    pads = collections.Counter()
+    vias = collections.Counter()
+    done = pos
+    for m in footprint_re.finditer(text, pos, endpos):
+        name = m.group(1).decode("utf-8", errors="ignore") if binary else m.group(1)
+        library_pads = footprints.get(name)
+        if library_pads is None or m.start() < done:
+            continue
+        nxt = item_re.search(text, m.end(), endpos)
+        end = nxt.start() if nxt else endpos
+        if text[m.end():end].count(pad_head) != sum(library_pads.values()):
+            continue
+        range_pads, range_vias = scan_file(text, done, m.start())
+        pads.update(range_pads)
+        vias.update(range_vias)
+        pads.update(library_pads)
+        done = end
+    range_pads, range_vias = scan_file(text, done, endpos)
+    pads.update(range_pads)
+    vias.update(range_vias)
+    return dict(pads), dict(vias)
+
+def scan_path(path: str, use_mmap: bool = False,
+              footprints: Optional[Dict[str, Dict[PadKey, int]]] = None) -> Tuple[Dict[PadKey, int], Dict[ViaKey, int]]:
+    """Read (or map) one board file and scan it."""
+    if use_mmap:
+        with sexpr.map_file(path) as buf:
+            return scan_file(buf, footprints=footprints)
+    with open(path, "r", encoding="utf-8") as fh:
+        text = fh.read()
+    return scan_file(text, footprints=footprints)
+
+# ---------- Chunked scan of one board ----------
+
+# Start of a top-level board item: KiCad writes them one indent level deep
+# (a tab, or two spaces before v7), nested items are indented further.
+_TOP_LEVEL_RE = re.compile(rb'\n(?:\t| {2})\((?:footprint|via|segment)[\s(]')
+
+def split_points(buf: Union[bytes, mmap.mmap], parts: int) -> List[int]:
+    """
+    Offsets that cut buf into about `parts` ranges, each cut placed at the
+    start of a top-level footprint, via or segment, so no pad or via block
+    is ever split. Returns [0, cut1, ..., len(buf)].
+    """
+    size = len(buf)
+    points = [0]
+    for i in range(1, parts):
+        m = _TOP_LEVEL_RE.search(buf, max(size * i // parts, points[-1]))
+        if not m:
+            break
+        cut = m.start() + 1
+        if cut > points[-1]:
+            points.append(cut)
+    points.append(size)
+    return points
+
+def _scan_range(path: str, start: int, end: int,
+                footprints: Optional[Dict[str, Dict[PadKey, int]]] = None) -> Tuple[Dict[PadKey, int], Dict[ViaKey, int]]:
+    # Each worker maps the file itself, so the text is never copied between processes
+    with sexpr.map_file(path) as buf:
+        return scan_file(buf, start, end, footprints)
+
+def scan_file_parallel(path: str, jobs: Optional[int] = None,
+                       footprints: Optional[Dict[str, Dict[PadKey, int]]] = None
+                       ) -> Tuple[Dict[PadKey, int], Dict[ViaKey, int]]:
+    """
+    Scan one large board with several worker processes. The mapped file is
+    cut at top-level item boundaries and the per-range counts are merged, so
+    the result is identical to scan_path(path).
+    """
+    jobs = jobs or available_cores()
+    with sexpr.map_file(path) as buf:
+        points = split_points(buf, jobs)
+    ranges = list(zip(points, points[1:]))
+    if len(ranges) <= 1:
+        return scan_path(path, True, footprints)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        results = pool.map(_scan_range, [path] * len(ranges), *zip(*ranges), [footprints] * len(ranges))
+        return merge_counts(dict(enumerate(results)))
+
+# ---------- Batch ----------
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:      # not on Linux
+        return os.cpu_count() or 1
+
+def expand_inputs(specs: List[str]) -> List[str]:
+    """
+    Turn command line arguments into board paths: directories contribute
+    their *.kicad_pcb files, glob patterns are expanded, plain paths are kept.
+    Order is preserved and duplicates are dropped.
+    """
+    paths: List[str] = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            paths.extend(sorted(glob.glob(os.path.join(spec, "*.kicad_pcb"))))
+        elif glob.has_magic(spec):
+            paths.extend(sorted(glob.glob(spec, recursive=True)))
+        else:
+            paths.append(spec)
+    return list(dict.fromkeys(paths))
+
+def scan_many(paths: List[str], use_mmap: bool = False, jobs: Optional[int] = None,
+              footprints: Optional[Dict[str, Dict[PadKey, int]]] = None
+              ) -> Dict[str, Tuple[Dict[PadKey, int], Dict[ViaKey, int]]]:
+    """
+    Scan several boards, one per worker process (at most `jobs`, default:
+    the available cores). Returns {path: (pads, vias)} in input order.
+    """
+    jobs = min(jobs or available_cores(), len(paths))
+    if jobs <= 1:
+        return {p: scan_path(p, use_mmap, footprints) for p in paths}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(scan_path, paths, [use_mmap] * len(paths), [footprints] * len(paths))
+        return dict(zip(paths, results))
+
+def merge_counts(per_board: Dict[str, Tuple[Dict[PadKey, int], Dict[ViaKey, int]]]
+                 ) -> Tuple[Dict[PadKey, int], Dict[ViaKey, int]]:
+    pads = collections.Counter()
+    vias = collections.Counter()
+    for board_pads, board_vias in per_board.values():
+        pads.update(board_pads)
+        vias.update(board_vias)
+    return dict(pads), dict(vias)
+
 # ---------- Output ----------
 
-def print_report(pads: Dict[PadKey, int], vias: Dict[ViaKey, int]) -> None:
-    def sorted_items(d):
-        # Sort by count desc, then key asc
-        return sorted(d.items(), key=lambda kv: (-kv[1], kv[0]))
+def print_section(title: str, counts: Dict[str, int]) -> None:
+    """Print one titled block of counts, sorted by count desc, then key asc."""
+    print(title)
+    print("=" * len(title))
+    for key, count in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])):
+        print(f"{count:6}  {key}")
 
+def print_report(pads: Dict[PadKey, int], vias: Dict[ViaKey, int]) -> None:
     if pads:
-        print("PAD STATISTICS")
-        print("==============")
-        for key, count in sorted_items(pads):
-            print(f"{count:6}  {key}")
+        print_section("PAD STATISTICS", pads)
         print()
 
     if vias:
-        print("VIA STATISTICS")
-        print("==============")
-        for key, count in sorted_items(vias):
-            print(f"{count:6}  {key}")
+        print_section("VIA STATISTICS", vias)
 
 def write_csv(path: str, pads: Dict[PadKey, int], vias: Dict[ViaKey, int]) -> None:
     import csv
@@ -255,23 +415,110 @@ def write_csv(path: str, pads: Dict[PadKey, int], vias: Dict[ViaKey, int]) -> No
         for k, c in sorted(vias.items(), key=lambda kv: (-kv[1], kv[0])):
             w.writerow(["via", k, c])
 
+def write_csv_boards(path: str, per_board: Dict[str, Tuple[Dict[PadKey, int], Dict[ViaKey, int]]]) -> None:
+    """Like write_csv for the combined counts, plus one count column per board."""
+    import csv
+    pads, vias = merge_counts(per_board)
+    boards = list(per_board)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["type", "key", "count"] + boards)
+        for kind, totals, index in (("pad", pads, 0), ("via", vias, 1)):
+            for k, c in sorted(totals.items(), key=lambda kv: (-kv[1], kv[0])):
+                w.writerow([kind, k, c] + [per_board[b][index].get(k, 0) for b in boards])
+
 # ---------- Main ----------
 
-def main():
-    ap = argparse.ArgumentParser(description="Extract pad and via statistics from a KiCad .kicad_pcb file.")
-    ap.add_argument("pcb", help="Path to .kicad_pcb file")
-    ap.add_argument("--csv", help="Optional path to write CSV summary")
-    args = ap.parse_args()
+def _counted(stage, result: Tuple[Dict[PadKey, int], Dict[ViaKey, int]]):
+    stage.blocks = sum(result[0].values()) + sum(result[1].values())
+    return result
+
+def load_footprints(specs: List[str], board: str) -> Dict[str, Dict[PadKey, int]]:
+    """Pad tables of the libraries given with --lib; an empty spec is the board's project directory."""
+    import library     # library.py builds its pad keys with this module
+    paths = [spec or os.path.dirname(os.path.abspath(board)) for spec in specs]
+    return library.load_library(paths).pad_tables()
+
+def run(args, paths: List[str], stats: perf.Stats) -> None:
+    footprints = None
+    if args.lib:
+        with stats.stage("library") as st:
+            footprints = load_footprints(args.lib, paths[0])
+            st.blocks = len(footprints)
+
+    if len(paths) == 1:
+        size = os.path.getsize(paths[0])
+        if args.split:
+            with stats.stage("scan (split)", size) as st:
+                pads, vias = _counted(st, scan_file_parallel(paths[0], args.jobs, footprints))
+        elif args.mmap:
+            with stats.stage("scan (mmap)", size) as st:
+                pads, vias = _counted(st, scan_path(paths[0], True, footprints))
+        else:
+            with stats.stage("read", size):
+                with open(paths[0], "r", encoding="utf-8") as fh:
+                    text = fh.read()
+            with stats.stage("scan", size) as st:
+                pads, vias = _counted(st, scan_file(text, footprints=footprints))
+        with stats.stage("report"):
+            print_report(pads, vias)
+            if args.csv:
+                write_csv(args.csv, pads, vias)
+                print(f"\nCSV written to: {args.csv}")
+        return
+
+    with stats.stage("scan", sum(os.path.getsize(p) for p in paths)) as st:
+        per_board = scan_many(paths, args.mmap, args.jobs, footprints)
+        st.blocks = sum(sum(p.values()) + sum(v.values()) for p, v in per_board.values())
+    with stats.stage("merge") as st:
+        pads, vias = _counted(st, merge_counts(per_board))
+    with stats.stage("report"):
+        print(f"{len(paths)} boards: " + ", ".join(paths))
+        print()
+        print_report(pads, vias)
 
-    with open(args.pcb, "r", encoding="utf-8") as fh:
-        text = fh.read()
+        if args.csv:
+            write_csv_boards(args.csv, per_board)
+            print(f"\nCSV written to: {args.csv}")
 
-    pads, vias = scan_file(text)
-    print_report(pads, vias)
+def main():
+    ap = argparse.ArgumentParser(description="Extract pad and via statistics from KiCad .kicad_pcb files.")
+    ap.add_argument("pcb", nargs="+",
+                    help="Path to .kicad_pcb file; several paths, directories or glob patterns "
+                         "give a combined report")
+    ap.add_argument("--csv", help="Optional path to write CSV summary (per-board columns for several boards)")
+    ap.add_argument("--mmap", action="store_true",
+                    help="Memory-map the file and scan raw bytes instead of reading it as text")
+    ap.add_argument("--split", action="store_true",
+                    help="Scan a single large board in parallel chunks (implies --mmap; one board only)")
+    ap.add_argument("--jobs", type=int, default=None,
+                    help="Worker processes for several boards or --split (default: available cores)")
+    ap.add_argument("--lib", action="append", nargs="?", const="", metavar="PATH",
+                    help="Count placed library footprints from the library instead of scanning their pads "
+                         "(copies with a different pad count are still scanned, but pad sizes or drills "
+                         "edited on the board are not seen): "
+                         "a project directory with fp-lib-table (default: the board's), or a .pretty "
+                         "directory; repeatable")
+    ap.add_argument("--stats", action="store_true",
+                    help="Print time, bytes, blocks, throughput and peak RSS per stage on stderr")
+    ap.add_argument("--stats-json", metavar="PATH", help="Write the per-stage statistics as JSON")
+    ap.add_argument("--profile", metavar="PATH",
+                    help="Run under cProfile; save pstats to PATH (hot functions as JSON if PATH ends in .json)")
+    args = ap.parse_args()
 
-    if args.csv:
-        write_csv(args.csv, pads, vias)
-        print(f"\nCSV written to: {args.csv}")
+    paths = expand_inputs(args.pcb)
+    if not paths:
+        ap.error("no .kicad_pcb files found")
+    if args.split and len(paths) > 1:
+        ap.error(f"--split scans a single board, got {len(paths)}")
+
+    stats = perf.Stats()
+    with perf.profiled(args.profile):
+        run(args, paths, stats)
+    if args.stats:
+        stats.report()
+    if args.stats_json:
+        stats.write_json(args.stats_json)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+drill_stats.py
+
+Parse Excellon drill files (as written by KiCad's drill export) and report
+hole statistics in the same format as check_pads.py. Optionally cross-check
+the drill counts against the pad and via drills of the .kicad_pcb.
+
+The file is read in one pass. The tool table (T1C0.600) gives the
+diameters; each run of hit lines (X..Y..) between two control lines is
+matched with a single findall, and the coordinates of all hits and slots
+(G85, or G00/M15/G01/M16 routing) are converted to one NumPy array in bulk,
+then split per tool. All sizes and coordinates are in millimetres.
+
+Examples of produced keys:
+- Holes: 'drill:0.8'
+- Slots: 'drill:oval 2.2x1'      (length x width)
+
+Usage:
+  python drill_stats.py gerber/gdp-PTH.drl gerber/gdp-NPTH.drl
+  python drill_stats.py gerber/ --pcb gdp.kicad_pcb
+"""
+
+from __future__ import annotations
+import argparse
+import collections
+import glob
+import os
+import re
+import sys
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from check_pads import _norm_num, print_section, scan_path
+
+DrillKey = str
+
+# Entry kinds in the coordinate stream
+_HIT, _MOVE, _SLOT_END = 0, 1, 2
+
+_TOOL_DEF_RE = re.compile(r'T(\d+)[^C]*C([\d.]+)')
+_TOOL_SEL_RE = re.compile(r'T(\d+)$')
+_COORD_RE = re.compile(r'(?:X([+-]?[\d.]+))?(?:Y([+-]?[\d.]+))?')
+
+# Every line that is not a hit is a control line (tools, units, routing, ...)
+_CONTROL_RE = re.compile(r'^[ \t]*([^XY\s].*?)[ \t\r]*$', re.M)
+
+# Hit lines 'X..Y..', optionally followed by the far end of a G85 slot.
+# An empty group means the coordinate was not given (modal).
+_HIT_RE = re.compile(r'^[ \t]*(?=[XY])(?:X([+-]?[\d.]+))?(?:Y([+-]?[\d.]+))?'
+                     r'(?:(G85)(?:X([+-]?[\d.]+))?(?:Y([+-]?[\d.]+))?)?[ \t\r]*$', re.M)
+
+_FORMAT_RE = re.compile(r'FORMAT=\{(\d+):(\d+)')
+
+# A line with X but no Y, or with Y only: such runs cannot take the fast path
+_INCOMPLETE_RE = re.compile(r'X[^Y\n]*(?:\n|$)|(?:^|\n)[ \t]*Y')
+_XY_TO_SPACE = str.maketrans("XY", "  ")
+
+# ---------- Parser ----------
+
+class DrillFile(NamedTuple):
+    path: str
+    plated: Optional[bool]              # from TF.FileFunction, None if unknown
+    tools: Dict[int, float]             # tool number -> diameter
+    hits: Dict[int, np.ndarray]         # tool number -> (n, 2) hole centres
+    slots: Dict[int, np.ndarray]        # tool number -> (n, 4) x1 y1 x2 y2
+
+class _Format:
+    """Units and, for coordinates without a decimal point, the implied digits."""
+
+    def __init__(self):
+        self.scale = 1.0                # 25.4 for inch files
+        self.decimals = 3
+        self.leading_zeros = False      # LZ: trailing zeros are the ones left out
+        self.int_digits = 3
+
+    def units(self, line: str) -> None:
+        inch = line.startswith("INCH")
+        self.scale = 25.4 if inch else 1.0
+        self.int_digits, self.decimals = (2, 4) if inch else (3, 3)
+        self.leading_zeros = ",LZ" in line
+
+    def value(self, s: str) -> float:
+        if "." in s:
+            return float(s)
+        sign = -1.0 if s.startswith("-") else 1.0
+        digits = s.lstrip("+-")
+        if self.leading_zeros:
+            digits = digits.ljust(self.int_digits + self.decimals, "0")
+        return sign * int(digits) / 10 ** self.decimals
+
+def _coords(values: List[str], fmt: _Format) -> np.ndarray:
+    """Convert coordinate strings in bulk; '' (modal, not given) becomes NaN."""
+    for i, v in enumerate(values):
+        if v and "." not in v:
+            values[i] = repr(fmt.value(v))
+    arr = np.array(values)
+    arr[arr == ""] = "nan"
+    return arr.astype(np.float64)
+
+def _fill_modal(col: np.ndarray) -> np.ndarray:
+    """Replace NaNs with the last given value before them (0 at the start)."""
+    missing = np.isnan(col)
+    if not missing.any():
+        return col
+    idx = np.where(missing, 0, np.arange(len(col)))
+    np.maximum.accumulate(idx, out=idx)
+    filled = col[idx]
+    filled[np.isnan(filled)] = 0.0
+    return filled
+
+def _hit_run(run: str, fmt: _Format) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Coordinates (n, 2), NaN where modal, and entry kinds of a run of hit lines.
+    A run where every line is a plain 'X<decimal>Y<decimal>' hit is converted
+    by NumPy directly; anything else goes through _HIT_RE.
+    """
+    n = run.count("X")
+    if (n == run.count("Y") and 2 * n == run.count(".") and "G85" not in run
+            and not _INCOMPLETE_RE.search(run)):
+        xy = np.fromstring(run.translate(_XY_TO_SPACE), sep=" ").reshape(-1, 2)
+        return xy, np.full(len(xy), _HIT, dtype=np.int8)
+    xs: List[str] = []
+    ys: List[str] = []
+    kinds: List[int] = []
+    for x, y, g85, x2, y2 in _HIT_RE.findall(run):
+        xs.append(x); ys.append(y)
+        kinds.append(_MOVE if g85 else _HIT)
+        if g85:
+            # G85 slot: the line gives both ends
+            xs.append(x2); ys.append(y2)
+            kinds.append(_SLOT_END)
+    return np.column_stack((_coords(xs, fmt), _coords(ys, fmt))), np.array(kinds, dtype=np.int8)
+
+def parse_drill(path: str) -> DrillFile:
+    """Read one Excellon file; see DrillFile for the result."""
+    fmt = _Format()
+    plated: Optional[bool] = None
+    tools: Dict[int, float] = {}
+    coords: List[np.ndarray] = []       # per run of entries, in file order
+    kinds: List[np.ndarray] = []
+    owners: List[np.ndarray] = []
+    tool = 0
+    in_header = False
+    routing = plunged = False
+
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        text = fh.read()
+
+    def add(xy, kind):
+        coords.append(xy * fmt.scale)
+        kinds.append(kind)
+        owners.append(np.full(len(kind), tool, dtype=np.int32))
+
+    pos = 0
+    for m in _CONTROL_RE.finditer(text):
+        if m.start() > pos and not text[pos:m.start()].isspace():
+            add(*_hit_run(text[pos:m.start()], fmt))
+        pos = m.end()
+        line = m.group(1)
+        c = line[0]
+        if c == "T":
+            t = _TOOL_DEF_RE.match(line)
+            if t:
+                tools[int(t.group(1))] = float(t.group(2)) * fmt.scale
+            else:
+                t = _TOOL_SEL_RE.match(line)
+                if t:
+                    tool = int(t.group(1))
+        elif c == "G" and line[:3] in ("G00", "G01"):
+            # Routed slot: G00 moves to the start, G01 cuts to the end
+            routing = True
+            xy = _COORD_RE.match(line, 3)
+            add(np.column_stack((_coords([xy.group(1) or ""], fmt), _coords([xy.group(2) or ""], fmt))),
+                np.array([_SLOT_END if line[2] == "1" and plunged else _MOVE], dtype=np.int8))
+        elif line == "M15":
+            plunged = routing
+        elif line in ("M16", "M17", "G05"):
+            plunged = False
+            routing = line != "G05" and routing
+        elif line == "M48":
+            in_header = True
+        elif line in ("%", "M95"):
+            in_header = False
+        elif in_header and (line.startswith("METRIC") or line.startswith("INCH")):
+            fmt.units(line)
+        elif line in ("M71", "M72"):
+            fmt.units("METRIC" if line == "M71" else "INCH")
+        elif c == ";":
+            if "TF.FileFunction" in line:
+                plated = ",NonPlated," not in line
+            f = _FORMAT_RE.search(line)
+            if f:
+                fmt.int_digits, fmt.decimals = int(f.group(1)), int(f.group(2))
+    if text[pos:].strip():
+        add(*_hit_run(text[pos:], fmt))
+
+    if plated is None and "NPTH" in os.path.basename(path).upper():
+        plated = False
+
+    if coords:
+        xy = np.concatenate(coords)
+        pos_xy = np.column_stack((_fill_modal(xy[:, 0]), _fill_modal(xy[:, 1])))
+        kind = np.concatenate(kinds)
+        owner = np.concatenate(owners)
+    else:
+        pos_xy = np.zeros((0, 2))
+        kind = np.zeros(0, dtype=np.int8)
+        owner = np.zeros(0, dtype=np.int32)
+
+    hits: Dict[int, np.ndarray] = {}
+    slots: Dict[int, np.ndarray] = {}
+    ends = np.flatnonzero(kind == _SLOT_END)
+    ends = ends[ends > 0]
+    for t in np.unique(owner):
+        mask = (owner == t) & (kind == _HIT)
+        if mask.any():
+            hits[int(t)] = pos_xy[mask]
+        slot_ends = ends[owner[ends] == t]
+        if len(slot_ends):
+            slots[int(t)] = np.hstack((pos_xy[slot_ends - 1], pos_xy[slot_ends]))
+    return DrillFile(path, plated, tools, hits, slots)
+
+# ---------- Statistics ----------
+
+def _size(v: float) -> str:
+    # Drill files carry micrometres at best; inch conversions leave noise below that
+    return _norm_num(f"{v:.3f}")
+
+def drill_counts(drill: DrillFile) -> Dict[DrillKey, int]:
+    """Count holes per drill key; slots are keyed by their length x width."""
+    counts = collections.Counter()
+    for t, xy in drill.hits.items():
+        counts[f"drill:{_size(drill.tools.get(t, 0.0))}"] += len(xy)
+    for t, seg in drill.slots.items():
+        width = drill.tools.get(t, 0.0)
+        lengths = np.round(np.hypot(seg[:, 2] - seg[:, 0], seg[:, 3] - seg[:, 1]) + width, 3)
+        for length, n in zip(*np.unique(lengths, return_counts=True)):
+            counts[f"drill:oval {_size(length)}x{_size(width)}"] += int(n)
+    return dict(counts)
+
+def file_title(drill: DrillFile) -> str:
+    kind = {True: "PTH ", False: "NPTH ", None: ""}[drill.plated]
+    return f"{kind}DRILL STATISTICS ({os.path.basename(drill.path)})"
+
+# ---------- Cross-check ----------
+
+_KEY_DRILL_RE = re.compile(r'drill:(?:oval )?([\d.]+)(?:x([\d.]+))?$')
+
+def compare_key(key: str) -> Optional[DrillKey]:
+    """
+    Reduce a check_pads.py pad/via key or a drill key to its drill part, with
+    slot sizes ordered larger x smaller (the drill file does not say which
+    way the pad is turned). None for keys without a drill.
+    """
+    m = _KEY_DRILL_RE.search(key)
+    if not m:
+        return None
+    if not m.group(2):
+        return f"drill:{m.group(1)}" if float(m.group(1)) > 0 else None
+    a, b = sorted((m.group(1), m.group(2)), key=float, reverse=True)
+    return f"drill:oval {a}x{b}"
+
+def board_drills(pads: Dict[str, int], vias: Dict[str, int]) -> Dict[DrillKey, int]:
+    """Drill counts implied by check_pads.py pad and via keys."""
+    counts = collections.Counter()
+    for d in (pads, vias):
+        for key, n in d.items():
+            k = compare_key(key)
+            if k:
+                counts[k] += n
+    return dict(counts)
+
+def cross_check(board: Dict[DrillKey, int], drilled: Dict[DrillKey, int]) -> int:
+    """Print board vs drill-file counts per key; return the number of mismatching keys."""
+    files = collections.Counter()
+    for key, n in drilled.items():
+        files[compare_key(key) or key] += n
+    keys = sorted(set(board) | set(files), key=lambda k: (-max(board.get(k, 0), files[k]), k))
+
+    print("DRILL CROSS-CHECK")
+    print("=================")
+    print(f"{'board':>6}  {'drill':>6}  key")
+    bad = 0
+    for k in keys:
+        b, f = board.get(k, 0), files[k]
+        mark = "" if b == f else "   <-- mismatch"
+        bad += b != f
+        print(f"{b:6}  {f:6}  {k}{mark}")
+    print()
+    print("All drill counts match." if not bad else f"{bad} drill sizes differ.")
+    return bad
+
+# ---------- Main ----------
+
+def expand_inputs(specs: List[str]) -> List[str]:
+    """Directories contribute their *.drl files; other paths are kept."""
+    paths: List[str] = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            paths.extend(sorted(glob.glob(os.path.join(spec, "*.drl"))))
+        else:
+            paths.append(spec)
+    return list(dict.fromkeys(paths))
+
+def main():
+    ap = argparse.ArgumentParser(description="Hole statistics from Excellon drill files.")
+    ap.add_argument("drl", nargs="+", help="Excellon .drl files or directories holding them")
+    ap.add_argument("--pcb", help="Cross-check the counts against the pads and vias of this .kicad_pcb")
+    args = ap.parse_args()
+
+    paths = expand_inputs(args.drl)
+    if not paths:
+        ap.error("no .drl files found")
+
+    total = collections.Counter()
+    for path in paths:
+        drill = parse_drill(path)
+        counts = drill_counts(drill)
+        total.update(counts)
+        print_section(file_title(drill), counts)
+        if not counts:
+            print("     0  (no holes)")
+        print()
+
+    if args.pcb:
+        pads, vias = scan_path(args.pcb)
+        sys.exit(1 if cross_check(board_drills(pads, vias), dict(total)) else 0)
+
+if __name__ == "__main__":
+    main()
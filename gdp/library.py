@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+library.py
+
+Index of the project's footprint and symbol libraries (GDP.pretty and
+GDP.kicad_sym, or whatever fp-lib-table and sym-lib-table list): every
+footprint as a table of its pads, every symbol as a table of its pins, both
+by library name ('GDP:R_S', 'GDP:74LS85').
+
+Each library is parsed once and kept next to it in '<library>.cache'. An
+entry is reused while its file keeps the same mtime and size, so after an
+edit only the changed .kicad_mod files are parsed again.
+
+check_pads.py and output_bom.py take pads and pin counts of indexed
+footprints from here (--lib) instead of deriving them from every placed
+copy. --check compares the pin numbers of every symbol with the pad numbers
+of its footprint, for the library symbols and for every symbol placed in the
+schematic.
+
+Usage:
+  python library.py
+  python library.py --lib /usr/share/kicad/footprints/Package_DIP.pretty --check
+"""
+
+from __future__ import annotations
+import argparse
+import collections
+import os
+import pickle
+import sys
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import check_pads
+import schematic
+import sexpr
+
+# Bump whenever the parsers change what they return, so stale caches are ignored
+LIBRARY_VERSION = 1
+
+class Pad(NamedTuple):
+    number: str                         # '' for unnumbered (mounting) holes
+    type: str                           # thru_hole, smd, np_thru_hole, connect
+    key: str                            # check_pads pad key: shape, size and drill
+
+class Footprint(NamedTuple):
+    name: str                           # 'GDP:R_S'
+    pads: Tuple[Pad, ...]
+
+    @property
+    def pad_numbers(self) -> frozenset:
+        return frozenset(p.number for p in self.pads if p.number)
+
+    @property
+    def pad_keys(self) -> Dict[str, int]:
+        """Pad key -> count, as check_pads counts one copy of the footprint."""
+        return dict(collections.Counter(p.key for p in self.pads))
+
+class LibPin(NamedTuple):
+    number: str
+    name: str
+    type: str
+    unit: int                           # 0: common to all units
+
+class LibSymbol(NamedTuple):
+    name: str                           # 'GDP:74LS85'
+    units: int
+    footprint: str                      # default Footprint property, may be ''
+    power: bool
+    pins: Tuple[LibPin, ...]
+
+    @property
+    def pin_numbers(self) -> frozenset:
+        return frozenset(p.number for p in self.pins if p.number)
+
+class Library(NamedTuple):
+    footprints: Dict[str, Footprint]
+    symbols: Dict[str, LibSymbol]
+
+    def pad_tables(self) -> Dict[str, Dict[str, int]]:
+        """Footprint name -> pad key counts, for check_pads.scan_file."""
+        return {name: fp.pad_keys for name, fp in self.footprints.items()}
+
+    def pin_counts(self) -> Dict[str, int]:
+        """Footprint name -> number of distinct pad numbers, as output_bom counts IC pins."""
+        return {name: len(fp.pad_numbers) for name, fp in self.footprints.items()}
+
+# ---------- Parsers ----------
+
+def parse_footprint_file(path: str, nickname: str) -> Footprint:
+    """Parse one .kicad_mod file; the footprint is named '<nickname>:<file stem>'."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    pads = []
+    for _, start, end in sexpr.find_blocks(text, ("pad",)):
+        fields = check_pads.extract_fields(text, start, end)
+        if fields is not None:
+            pads.append(Pad(fields.name, fields.type, check_pads.pad_key(fields)))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return Footprint(f"{nickname}:{stem}", tuple(pads))
+
+def _pins(node) -> Tuple[Tuple[LibPin, ...], int]:
+    """Pins of a library symbol over all units (first body style only), and the unit count."""
+    pins = []
+    units = 1
+    prefix = node[1].split(":")[-1] + "_"
+    for sub in sexpr.find_all(node, "symbol"):
+        parts = sub[1][len(prefix):].split("_") if sub[1].startswith(prefix) else []
+        if len(parts) != 2 or not all(p.isdigit() for p in parts):
+            continue
+        unit, style = int(parts[0]), int(parts[1])
+        units = max(units, unit)
+        if style > 1:
+            continue        # a De Morgan body repeats the pins of the first one
+        for pin in sexpr.find_all(sub, "pin"):
+            number = sexpr.find(pin, "number")
+            name = sexpr.find(pin, "name")
+            pins.append(LibPin(number[1] if number else "", name[1] if name else "",
+                               pin[1] if len(pin) > 1 else "", unit))
+    return tuple(pins), units
+
+def symbols_of(node, nickname: Optional[str] = None) -> Dict[str, LibSymbol]:
+    """
+    Symbols defined directly in node: a kicad_symbol_lib, or the lib_symbols
+    of a schematic (names there already carry the library nickname).
+    Derived symbols ('extends') get the pins of their parent.
+    """
+    symbols: Dict[str, LibSymbol] = {}
+    parents: Dict[str, str] = {}
+    for sym in sexpr.find_all(node, "symbol"):
+        name = f"{nickname}:{sym[1]}" if nickname else sym[1]
+        props = {p[1]: p[2] for p in sexpr.find_all(sym, "property") if len(p) > 2}
+        pins, units = _pins(sym)
+        extends = sexpr.find(sym, "extends")
+        if extends:
+            parents[name] = f"{nickname}:{extends[1]}" if nickname else extends[1]
+        symbols[name] = LibSymbol(name, units, props.get("Footprint", ""),
+                                  sexpr.find(sym, "power") is not None, pins)
+    for name, parent in parents.items():
+        if parent in symbols:
+            base = symbols[parent]
+            symbols[name] = symbols[name]._replace(pins=base.pins, units=base.units)
+    return symbols
+
+def parse_symbol_file(path: str, nickname: str) -> Dict[str, LibSymbol]:
+    """Parse one .kicad_sym library."""
+    with open(path, "r", encoding="utf-8") as f:
+        root = sexpr.parse(f.read())
+    if not root or root[0] != "kicad_symbol_lib":
+        raise ValueError(f"{path}: not a KiCad symbol library")
+    return symbols_of(root, nickname)
+
+def embedded_symbols(path: str) -> Dict[str, LibSymbol]:
+    """The library symbols a schematic sheet carries in its lib_symbols section."""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    for _, start, end in sexpr.find_blocks(text, ("lib_symbols",)):
+        return symbols_of(sexpr.parse(text, start, end))
+    return {}
+
+# ---------- Cache ----------
+
+def _stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+def _load_entries(cache_path: str) -> dict:
+    try:
+        with open(cache_path, "rb") as f:
+            version, entries = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, AttributeError, ImportError,
+            pickle.UnpicklingError):
+        return {}
+    return entries if version == LIBRARY_VERSION else {}
+
+def _store_entries(cache_path: str, entries: dict) -> None:
+    try:
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((LIBRARY_VERSION, entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass    # a read-only checkout just runs without a cache
+
+def _cached_parse(paths: List[str], cache_path: str, parse, use_cache: bool, parsed: Optional[List[str]]):
+    """parse(path) for every path, reusing the entries in cache_path whose file has the same mtime and size."""
+    previous = _load_entries(cache_path) if use_cache else {}
+    entries = {}
+    for path in paths:
+        stamp = _stamp(path)
+        entry = previous.get(os.path.basename(path))
+        if entry is None or entry[0] != stamp:
+            entry = (stamp, parse(path))
+            if parsed is not None:
+                parsed.append(path)
+        entries[os.path.basename(path)] = entry
+    if use_cache and entries != previous:
+        _store_entries(cache_path, entries)
+    return [entry[1] for entry in entries.values()]
+
+def load_footprints(pretty: str, nickname: Optional[str] = None, use_cache: bool = True,
+                    parsed: Optional[List[str]] = None) -> Dict[str, Footprint]:
+    """Index a .pretty directory; the nickname defaults to its name without '.pretty'."""
+    pretty = os.path.abspath(pretty)
+    nickname = nickname or os.path.splitext(os.path.basename(pretty))[0]
+    paths = sorted(os.path.join(pretty, name) for name in os.listdir(pretty) if name.endswith(".kicad_mod"))
+    footprints = _cached_parse(paths, f"{pretty}.cache", lambda p: parse_footprint_file(p, nickname),
+                               use_cache, parsed)
+    return {fp.name: fp for fp in footprints}
+
+def load_symbols(path: str, nickname: Optional[str] = None, use_cache: bool = True,
+                 parsed: Optional[List[str]] = None) -> Dict[str, LibSymbol]:
+    """Index a .kicad_sym library; the nickname defaults to its file stem."""
+    path = os.path.abspath(path)
+    nickname = nickname or os.path.splitext(os.path.basename(path))[0]
+    (symbols,) = _cached_parse([path], f"{path}.cache", lambda p: parse_symbol_file(p, nickname),
+                               use_cache, parsed)
+    return symbols
+
+# ---------- Library tables ----------
+
+def lib_table(path: str) -> List[Tuple[str, str]]:
+    """(nickname, path) of the KiCad libraries in an fp-lib-table or sym-lib-table."""
+    with open(path, "r", encoding="utf-8") as f:
+        root = sexpr.parse(f.read()) or []
+    project = os.path.dirname(os.path.abspath(path))
+    libs = []
+    for lib in sexpr.find_all(root, "lib"):
+        name, kind, uri = sexpr.find(lib, "name"), sexpr.find(lib, "type"), sexpr.find(lib, "uri")
+        if not (name and uri) or (kind and kind[1] != "KiCad"):
+            continue
+        location = os.path.expandvars(uri[1].replace("${KIPRJMOD}", project))
+        libs.append((name[1], os.path.normpath(location)))
+    return libs
+
+def load_library(paths: Iterable[str], use_cache: bool = True, parsed: Optional[List[str]] = None) -> Library:
+    """
+    Index libraries given as project directories (their fp-lib-table and
+    sym-lib-table are read), .pretty directories or .kicad_sym files.
+    Libraries that cannot be found are reported on stderr and skipped.
+    """
+    footprints: Dict[str, Footprint] = {}
+    symbols: Dict[str, LibSymbol] = {}
+    for path in paths:
+        if path.endswith(".kicad_sym"):
+            libs = [(None, path)]
+        elif path.rstrip("/\\").endswith(".pretty"):
+            libs = [(None, path)]
+        else:
+            libs = []
+            for table in ("fp-lib-table", "sym-lib-table"):
+                if os.path.exists(os.path.join(path, table)):
+                    libs.extend(lib_table(os.path.join(path, table)))
+        for nickname, location in libs:
+            if not os.path.exists(location):
+                print(f"Library {nickname or location} not found: {location}", file=sys.stderr)
+            elif location.endswith(".kicad_sym"):
+                symbols.update(load_symbols(location, nickname, use_cache, parsed))
+            else:
+                footprints.update(load_footprints(location, nickname, use_cache, parsed))
+    return Library(footprints, symbols)
+
+# ---------- Consistency check ----------
+
+class Mismatch(NamedTuple):
+    symbol: str
+    footprint: str
+    refs: Tuple[str, ...]               # placed references, () for a library symbol
+    missing_pads: Tuple[str, ...]       # pin numbers without a pad
+    unused_pads: Tuple[str, ...]        # pad numbers without a pin
+
+def _numeric(numbers: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(sorted(numbers, key=lambda n: (not n.isdigit(), int(n) if n.isdigit() else 0, n)))
+
+def _compare(sym: LibSymbol, fp: Footprint, refs: Tuple[str, ...]) -> Optional[Mismatch]:
+    missing = sym.pin_numbers - fp.pad_numbers
+    unused = fp.pad_numbers - sym.pin_numbers
+    if not (missing or unused):
+        return None
+    return Mismatch(sym.name, fp.name, refs, _numeric(missing), _numeric(unused))
+
+def check(library: Library, root: Optional[str] = None, use_cache: bool = True
+          ) -> Tuple[List[Mismatch], int, collections.Counter]:
+    """
+    Compare symbol pins with footprint pads: every library symbol with a
+    default footprint, and with root every symbol placed in that schematic,
+    using the symbol copies embedded in each sheet. Returns (mismatches,
+    pairs checked, placed symbols skipped per footprint library that is not
+    indexed). use_cache is passed on to schematic.load_schematic().
+    """
+    mismatches: List[Mismatch] = []
+    checked = 0
+    skipped: collections.Counter = collections.Counter()
+
+    for sym in library.symbols.values():
+        fp = library.footprints.get(sym.footprint)
+        if fp is not None:
+            checked += 1
+            mismatch = _compare(sym, fp, ())
+            if mismatch:
+                mismatches.append(mismatch)
+
+    if root:
+        sch = schematic.load_schematic(root, use_cache=use_cache)
+        embedded = {path: embedded_symbols(path) for path in sch.sheets}
+        placed: Dict[Tuple[str, str, str], List[str]] = {}     # (sheet, lib id, footprint) -> refs
+        for inst, _link, sheet in schematic.walk(sch):
+            for symbol in sheet.symbols:
+                if symbol.power or not symbol.on_board or not symbol.footprint:
+                    continue
+                if symbol.footprint not in library.footprints:
+                    skipped[symbol.footprint.split(":")[0]] += 1
+                    continue
+                refs = placed.setdefault((sheet.path, symbol.lib_id, symbol.footprint), [])
+                ref = schematic.reference(symbol, inst)
+                if ref not in refs:
+                    refs.append(ref)
+        for (path, lib_id, footprint), refs in sorted(placed.items(), key=lambda kv: kv[0][1:]):
+            sym = embedded[path].get(lib_id)
+            if sym is None:
+                continue
+            checked += 1
+            mismatch = _compare(sym, library.footprints[footprint], tuple(refs))
+            if mismatch:
+                mismatches.append(mismatch)
+    return mismatches, checked, skipped
+
+# ---------- Main ----------
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    ap = argparse.ArgumentParser(description="Index the KiCad footprint and symbol libraries of a project.")
+    ap.add_argument("--project", default=here,
+                    help="Project directory with fp-lib-table and sym-lib-table (default: this directory)")
+    ap.add_argument("--lib", action="append", default=[],
+                    help="Additional .pretty directory or .kicad_sym library (repeatable)")
+    ap.add_argument("--check", nargs="?", const="", metavar="ROOT",
+                    help="Compare symbol pins with footprint pads; with the placed symbols of the ROOT "
+                         "schematic (default: gdp.kicad_sch in the project directory)")
+    ap.add_argument("--no-cache", action="store_true", help="Parse every library file instead of using .cache files")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    parsed: List[str] = []
+    library = load_library([args.project] + args.lib, not args.no_cache, parsed)
+    dt = time.perf_counter() - t0
+
+    if args.check is None:
+        for fp in library.footprints.values():
+            keys = ", ".join(f"{n}x {k}" for k, n in sorted(fp.pad_keys.items()))
+            print(f"{fp.name:32} {len(fp.pad_numbers):3} pads  {keys}")
+        for sym in library.symbols.values():
+            print(f"{sym.name:32} {len(sym.pin_numbers):3} pins  {sym.units} unit(s)  {sym.footprint}")
+        print(f"\n{len(library.footprints)} footprints, {len(library.symbols)} symbols "
+              f"loaded in {dt * 1000:.0f} ms, {len(parsed)} files parsed")
+        return
+
+    root = args.check or os.path.join(args.project, "gdp.kicad_sch")
+    mismatches, checked, skipped = check(library, root if os.path.exists(root) else None, not args.no_cache)
+    for m in mismatches:
+        where = f" ({', '.join(m.refs)})" if m.refs else ""
+        print(f"{m.symbol} / {m.footprint}{where}")
+        if m.missing_pads:
+            print(f"  pins without a pad: {' '.join(m.missing_pads)}")
+        if m.unused_pads:
+            print(f"  pads without a pin: {' '.join(m.unused_pads)}")
+    print(f"\n{checked} symbol/footprint pairs checked, {len(mismatches)} with differences")
+    if skipped:
+        print("Not indexed, not checked: " + ", ".join(f"{lib} ({n})" for lib, n in skipped.most_common()))
+
+if __name__ == "__main__":
+    # Run through the importable module, so that cached entries pickle as
+    # library.Footprint and not __main__.Footprint
+    import library
+    library.main()
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
+import argparse
+import hashlib
+import os
+import pickle
 import re
 import sys
 from pathlib import Path
-from collections import defaultdict, Counter
+from collections import defaultdict, namedtuple, Counter
+
+import perf
+import sexpr
 
 def natural_key(s: str):
     """Return a comparison key that avoids int<->str comparisons."""
@@ -16,77 +23,257 @@ def natural_key(s: str):
     return tuple(out)
 
 def extract_footprints(text):
-    """Yield each complete '(footprint ... )' block from file text."""
-    i, n = 0, len(text)
-    while True:
-        start = text.find('(footprint', i)
-        if start == -1:
-            break
-        depth = 0
-        j = start
-        in_str = False
-        while j < n:
-            c = text[j]
-            if c == '"' and text[j-1] != '\\':
-                in_str = not in_str
-            elif not in_str:
-                if c == '(':
-                    depth += 1
-                elif c == ')':
-                    depth -= 1
-                    if depth == 0:
-                        yield text[start:j+1]
-                        i = j + 1
-                        break
-            j += 1
+    """
+    Yield each complete '(footprint ... )' block from file text.
+    text may also be raw bytes or an mmap; then only the blocks are decoded.
+    """
+    binary = not isinstance(text, str)
+    for _, start, end in sexpr.find_blocks(text, ("footprint",)):
+        if binary:
+            yield text[start:end].decode('utf-8', errors='ignore')
         else:
-            yield text[start:]
-            break
-
-def parse_ref_val(block):
-    """Return (ref, val) from a footprint block, or (None, None)."""
-    # KiCad 6/7/8+: properties
-    mref = re.search(r'\(property\s+"Reference"\s+"([^"]*)"', block)
-    mval = re.search(r'\(property\s+"Value"\s+"([^"]*)"', block)
-    if mref and mval:
-        return mref.group(1).strip(), mval.group(1).strip()
-    # Older: fp_text
-    mref = re.search(r'\(fp_text\s+reference\s+([^\s\)]+)', block)
-    mval = re.search(r'\(fp_text\s+value\s+([^\s\)]+)', block)
-    if mref and mval:
-        return mref.group(1).strip('"'), mval.group(1).strip('"')
-    return None, None
-
-def count_pads(block):
+            yield text[start:end]
+
+# ---------- Footprint visitor ----------
+
+Footprint = namedtuple("Footprint", "name ref value pads attrs start end")
+
+_STR = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+_ATOM = r'[^\s()"]+'
+_NAME = '(' + _STR + '|' + _ATOM + ')'
+_LEAF = r'\([^()"]*(?:' + _STR + r'[^()"]*)*\)'
+# A string or a leaf list whose head none of the alternatives below looks at
+_OTHER = '(?:' + _STR + r'|\((?!\s*(?:footprint|module|property|fp_text|pad|attr)[\s()"])[^()"]*(?:' + _STR + r'[^()"]*)*\))'
+_VISIT_PATTERN = (
+    _OTHER + r'(?:\s*' + _OTHER + ')*'                                       # skipped as one run
+    + r'|\(\s*(?:footprint|module)\s+' + _NAME                              # 1: footprint name
+    + r'|\(\s*property\s+"(Reference|Value)"\s+(' + _STR + ')'              # 2, 3
+    + r'|\(\s*fp_text\s+(reference|value)\s+' + _NAME                       # 4, 5
+    + r'|\(\s*pad\s+' + _NAME + r'[^()"]*(?:(?:' + _STR + '|' + _LEAF + r')[^()"]*)*\)'  # 6: whole pad of leaf lists
+    + r'|\(\s*pad\s+' + _NAME                                               # 7: pad name, nested lists follow
+    + r'|\(\s*attr((?:\s+' + _ATOM + r')*)\s*\)'                              # 8: whole (attr ...)
+    + r'|' + _LEAF                                                          # any other leaf list
+    + r'|(\()|(\))'                                                         # 9, 10
+)
+_VISIT_RE = re.compile(_VISIT_PATTERN)
+_VISIT_RE_B = re.compile(_VISIT_PATTERN.encode())
+
+def _value(token, binary=False):
+    if binary:
+        token = token.decode('utf-8', errors='ignore')
+    return sexpr.unquote(token) if token.startswith('"') else token
+
+def _visit_footprint(text, pos, pattern, binary):
+    """Footprint for the block whose head is at pos, or None if it is unterminated."""
+    depth = 0
+    name, props, texts, pads, attrs = None, {}, {}, set(), ()
+    for m in pattern.finditer(text, pos):
+        kind = m.lastindex
+        if kind is None:
+            continue        # strings and leaf lists, no nesting to track
+        if kind == 10:
+            depth -= 1
+            if depth == 0:
+                if "Reference" in props and "Value" in props:
+                    ref, value = props["Reference"], props["Value"]
+                else:
+                    ref, value = texts.get("reference"), texts.get("value")
+                return Footprint(name, ref, value, pads, attrs, pos, m.end())
+            continue
+        if kind == 8:
+            if depth == 1:
+                body = m.group(8).decode() if binary else m.group(8)
+                attrs = tuple(body.split())
+            continue
+        if kind in (6, 7):
+            if depth == 1:
+                pad = _value(m.group(kind), binary).strip()
+                if pad:
+                    pads.add(pad)
+            if kind == 7:
+                depth += 1
+            continue
+        depth += 1      # every other alternative opened a block
+        if depth == 1:
+            if kind == 1:
+                name = _value(m.group(1), binary)
+        elif depth == 2:
+            if kind == 3:
+                props[m.group(2).decode() if binary else m.group(2)] = _value(m.group(3), binary).strip()
+            elif kind == 5:
+                texts[m.group(4).decode() if binary else m.group(4)] = _value(m.group(5), binary)
+    return None
+
+def iter_footprints(text):
     """
-    Count unique, non-empty pad names in a footprint block.
-    Matches quoted and unquoted pad names, e.g. (pad "1" ...), (pad 1 ...), (pad A1 ...).
+    Yield a Footprint for every footprint block of the file text: footprint
+    name, reference, value, pad names (set), attributes and the block's
+    start/end offsets. Properties (KiCad 6+) win over fp_text reference/value
+    (older files); both are only taken from direct children.
+    The next footprint head is found with sexpr.next_head(), and only the
+    footprint blocks are walked with the visitor regex.
+    text may also be raw bytes or an mmap; then only the captured names are decoded.
     """
-    pad_names = set()
-    for name in re.findall(r'\(pad\s+"?([^"\s\)]+)"?\s', block):
-        name = name.strip()
-        if name:
-            pad_names.add(name)
-    return len(pad_names)
+    binary = not isinstance(text, str)
+    pattern = _VISIT_RE_B if binary else _VISIT_RE
+    pos = 0
+    while True:
+        head = sexpr.next_head(text, ("footprint", "module"), pos)
+        if head is None:
+            return
+        fp = _visit_footprint(text, head.start(), pattern, binary)
+        if fp is None:
+            return
+        yield fp
+        pos = fp.end
 
-def main():
-    if len(sys.argv) != 2:
-        print(f"Usage: {Path(sys.argv[0]).name} path/to/board.kicad_pcb", file=sys.stderr)
-        sys.exit(1)
+def parse_footprint(block):
+    """Return (ref, val, pins) for a footprint block; pins is only counted for IC* references."""
+    for fp in iter_footprints(block):
+        return footprint_record(fp)
+    return None, None, None
+
+def footprint_record(fp, pin_counts=None, differing=None):
+    """
+    Return (ref, val, pins) for a Footprint; pins is only counted for IC* references,
+    from the placed copy. pin_counts maps library footprint names to their pad
+    counts (see library.py); the references of placed copies that differ from
+    their library footprint are appended to the list `differing`.
+    """
+    if not (fp.ref and fp.value):
+        return None, None, None
+    if not fp.ref.upper().startswith("IC"):
+        return fp.ref, fp.value, None
+    pins = len(fp.pads)
+    if pin_counts and fp.name in pin_counts and pins != pin_counts[fp.name] and differing is not None:
+        differing.append(fp.ref)
+    return fp.ref, fp.value, pins
+
+# ---------- Incremental mode ----------
+
+# Bump whenever footprint_record changes what it returns
+BOM_CACHE_VERSION = 3
+
+# KiCad writes top-level items one indent level deep; a footprint's span runs
+# from its head to the next top-level item
+_TOP_LEVEL_RE = re.compile(rb'\n(?:\t| {2})\(')
+_TOP_FOOTPRINT_RE = re.compile(rb'\n(?:\t| {2})\((?:footprint|module)[\s(]')
 
-    pcb_path = Path(sys.argv[1])
-    text = pcb_path.read_text(encoding='utf-8', errors='ignore')
+def footprint_spans(data):
+    """Yield the (start, end) span of every top-level footprint in the raw bytes."""
+    for m in _TOP_FOOTPRINT_RE.finditer(data):
+        start = m.start() + 1
+        nxt = _TOP_LEVEL_RE.search(data, m.end())
+        yield start, (nxt.start() if nxt else len(data))
 
+def parse_footprints_incremental(text, cache_path, pin_counts=None, differing=None):
+    """
+    Yield footprint_record() records, re-parsing only footprints whose text
+    changed since the previous run. Records are kept in cache_path (a pickle
+    keyed by the hash of each footprint's span), which is rewritten at the end.
+    text may be str, bytes or an mmap; str is encoded once to find the spans.
+    """
+    previous = {}
+    try:
+        with open(cache_path, 'rb') as f:
+            version, entries = pickle.load(f)
+        if version == BOM_CACHE_VERSION:
+            previous = entries
+    except (OSError, EOFError, ValueError, TypeError, AttributeError, pickle.UnpicklingError):
+        pass
+
+    data = text.encode('utf-8', errors='ignore') if isinstance(text, str) else text
+    current = {}
+    reparsed = total = 0
+    for start, end in footprint_spans(data):
+        total += 1
+        digest = hashlib.blake2b(data[start:end], digest_size=16).digest()
+        entry = previous.get(digest)
+        if entry is None:
+            fp = _visit_footprint(data, start, _VISIT_RE_B, True)
+            if fp is None:
+                break
+            entry = fp.name, footprint_record(fp)
+            reparsed += 1
+        current[digest] = entry
+        name, record = entry
+        if pin_counts and record[2] is not None and name in pin_counts \
+                and record[2] != pin_counts[name] and differing is not None:
+            differing.append(record[0])
+        yield record
+    if not total:
+        # No footprint one indent level deep: not laid out by KiCad, parse it all
+        yield from (footprint_record(fp, pin_counts, differing) for fp in iter_footprints(text))
+        return
+
+    try:
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((BOM_CACHE_VERSION, current), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    print(f"Re-parsed {reparsed} of {total} footprints", file=sys.stderr)
+
+# ---------- Grouping ----------
+
+def collect_parts(records):
+    """Group references by value; also return pin counts for IC* references."""
     by_value = defaultdict(list)  # value -> [refs]
     ic_pins = {}                  # ref -> pin count for IC* only
 
-    for fp in extract_footprints(text):
-        ref, val = parse_ref_val(fp)
+    for ref, val, pins in records:
         if ref and val:
             by_value[val].append(ref)
-            if ref.upper().startswith("IC"):
-                ic_pins[ref] = count_pads(fp)
+            if pins is not None:
+                ic_pins[ref] = pins
+
+    return by_value, ic_pins
+
+def _counted(records, stage):
+    for record in records:
+        stage.blocks += 1
+        yield record
+
+def load_pin_counts(spec, pcb_path):
+    """Pad counts of the library footprints; spec is a project or .pretty directory, '' for the board's project."""
+    import library
+    return library.load_library([spec or str(pcb_path.resolve().parent)]).pin_counts()
 
+def run(args, stats):
+    pcb_path = Path(args.pcb)
+    size = pcb_path.stat().st_size
+    pin_counts = None
+    if args.lib is not None:
+        with stats.stage("library") as st:
+            pin_counts = load_pin_counts(args.lib, pcb_path)
+            st.blocks = len(pin_counts)
+
+    differing = []      # IC references whose placed pad count differs from the library
+
+    def parse_all(text):
+        if args.incremental:
+            return parse_footprints_incremental(text, f"{pcb_path}.bom.cache", pin_counts, differing)
+        # One pass over the whole text finds and parses every footprint
+        return (footprint_record(fp, pin_counts, differing) for fp in iter_footprints(text))
+
+    if args.mmap:
+        # Scan the mapped bytes; only footprint blocks or captured names are decoded
+        with sexpr.map_file(str(pcb_path)) as text, stats.stage("parse (mmap)", size) as st:
+            by_value, ic_pins = collect_parts(_counted(parse_all(text), st))
+    else:
+        with stats.stage("read", size):
+            text = pcb_path.read_text(encoding='utf-8', errors='ignore')
+        with stats.stage("parse", size) as st:
+            by_value, ic_pins = collect_parts(_counted(parse_all(text), st))
+
+    if differing:
+        print(f"Warning: {len(differing)} placed footprints have another pad count than their library "
+              f"footprint: {', '.join(sorted(differing, key=natural_key))}", file=sys.stderr)
+    with stats.stage("report"):
+        report(by_value, ic_pins)
+
+def report(by_value, ic_pins):
     # Sort references within each value group naturally
     for v in by_value:
         by_value[v].sort(key=natural_key)
@@ -115,5 +302,31 @@ def main():
         # Output: <Refs>\t<Count>\t<Value>[\tpins=N]
         print(f"{ref_list}\t{count}\t{value}{pins_suffix}")
 
+def main():
+    ap = argparse.ArgumentParser(description="Print the BOM of a KiCad board: references grouped by value.")
+    ap.add_argument("pcb", help="Path to .kicad_pcb file")
+    ap.add_argument("--mmap", action="store_true",
+                    help="Memory-map the file and scan raw bytes instead of reading it as text")
+    ap.add_argument("--incremental", action="store_true",
+                    help="Re-parse only the footprints changed since the last run (cache next to the board)")
+    ap.add_argument("--lib", nargs="?", const="", metavar="PATH",
+                    help="Warn about IC footprints whose pad count differs from the library footprint "
+                         "(the placed count is used): a project directory with "
+                         "fp-lib-table (default: the board's), or a .pretty directory")
+    ap.add_argument("--stats", action="store_true",
+                    help="Print time, bytes, blocks, throughput and peak RSS per stage on stderr")
+    ap.add_argument("--stats-json", metavar="PATH", help="Write the per-stage statistics as JSON")
+    ap.add_argument("--profile", metavar="PATH",
+                    help="Run under cProfile; save pstats to PATH (hot functions as JSON if PATH ends in .json)")
+    args = ap.parse_args()
+
+    stats = perf.Stats()
+    with perf.profiled(args.profile):
+        run(args, stats)
+    if args.stats:
+        stats.report()
+    if args.stats_json:
+        stats.write_json(args.stats_json)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+perf.py
+
+Opt-in instrumentation for the board and netlist scripts (--stats,
+--stats-json, --profile). Stats times named stages and what each of them
+processed (bytes, blocks); its report gives wall time, throughput and the
+peak RSS reached by the end of every stage. profiled() runs a block under
+cProfile and saves the result for pstats, or as JSON listing the hottest
+functions.
+"""
+
+from __future__ import annotations
+import contextlib
+import cProfile
+import json
+import pstats
+import sys
+import time
+from typing import Iterator, List, Optional, TextIO
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes, None where it is not known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024     # macOS reports bytes, Linux KiB
+
+class Stage:
+    """One timed stage; bytes and blocks may be set while it runs or after."""
+
+    __slots__ = ("name", "seconds", "bytes", "blocks", "peak_rss")
+
+    def __init__(self, name: str, nbytes: int = 0, blocks: int = 0):
+        self.name = name
+        self.seconds = 0.0
+        self.bytes = nbytes
+        self.blocks = blocks
+        self.peak_rss: Optional[int] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "stage": self.name, "seconds": self.seconds, "bytes": self.bytes, "blocks": self.blocks,
+            "mb_per_s": self.bytes / self.seconds / 1e6 if self.bytes and self.seconds else None,
+            "blocks_per_s": self.blocks / self.seconds if self.blocks and self.seconds else None,
+            "peak_rss": self.peak_rss,
+        }
+
+class Stats:
+    """Stages in the order they ran."""
+
+    def __init__(self):
+        self.stages: List[Stage] = []
+
+    @contextlib.contextmanager
+    def stage(self, name: str, nbytes: int = 0, blocks: int = 0) -> Iterator[Stage]:
+        st = Stage(name, nbytes, blocks)
+        t0 = time.perf_counter()
+        try:
+            yield st
+        finally:
+            st.seconds = time.perf_counter() - t0
+            st.peak_rss = peak_rss()
+            self.stages.append(st)
+
+    def as_dict(self) -> dict:
+        return {"stages": [st.as_dict() for st in self.stages],
+                "total_seconds": sum(st.seconds for st in self.stages),
+                "peak_rss": peak_rss()}
+
+    def report(self, out: Optional[TextIO] = None) -> None:
+        out = out or sys.stderr
+        print(f"\n{'stage':24} {'time ms':>10} {'MB':>8} {'MB/s':>8} {'blocks':>9} {'blocks/s':>10} {'peak RSS MB':>12}",
+              file=out)
+        for st in self.stages:
+            d = st.as_dict()
+            mb = f"{st.bytes / 1e6:.2f}" if st.bytes else "-"
+            mbs = f"{d['mb_per_s']:.1f}" if d["mb_per_s"] else "-"
+            blocks = str(st.blocks) if st.blocks else "-"
+            bps = f"{d['blocks_per_s']:.0f}" if d["blocks_per_s"] else "-"
+            rss = f"{st.peak_rss / 1e6:.1f}" if st.peak_rss is not None else "-"
+            print(f"{st.name:24} {st.seconds * 1000:10.1f} {mb:>8} {mbs:>8} {blocks:>9} {bps:>10} {rss:>12}",
+                  file=out)
+        total = sum(st.seconds for st in self.stages)
+        print(f"{'total':24} {total * 1000:10.1f}", file=out)
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, indent=1)
+            f.write("\n")
+
+def hot_functions(stats: pstats.Stats, top: int) -> List[dict]:
+    """The `top` functions with the most time spent in their own code."""
+    rows = []
+    for (filename, line, func), (primitive, calls, tottime, cumtime, _callers) in stats.stats.items():
+        rows.append({"function": func, "file": filename, "line": line, "calls": calls,
+                     "primitive_calls": primitive, "tottime": tottime, "cumtime": cumtime})
+    rows.sort(key=lambda r: r["tottime"], reverse=True)
+    return rows[:top]
+
+@contextlib.contextmanager
+def profiled(path: Optional[str], top: int = 20) -> Iterator[None]:
+    """
+    Run the block under cProfile if path is given. The profile is saved to
+    path (load it with 'python -m pstats path'), or as a JSON list of the
+    hottest functions when path ends in '.json'; the top functions by
+    cumulative time are printed on stderr.
+    """
+    if not path:
+        yield
+        return
+    prof = cProfile.Profile()
+    prof.enable()
+    try:
+        yield
+    finally:
+        prof.disable()
+        stats = pstats.Stats(prof, stream=sys.stderr)
+        if path.endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(hot_functions(stats, 50), f, indent=1)
+                f.write("\n")
+        else:
+            stats.dump_stats(path)
+        stats.sort_stats("cumulative").print_stats(top)
+        print(f"Profile written to: {path}", file=sys.stderr)
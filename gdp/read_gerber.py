@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+read_gerber.py
+
+Read Gerber RS-274X layer files (as written by KiCad's plot dialog) into flat
+NumPy arrays: flashes, draws/arcs and region contours, each with its
+aperture and polarity. All coordinates and sizes are in millimetres.
+
+Only the control statements (apertures, G/D codes, polarity, regions) go
+through Python. The operations between two of them ('X..Y..D01*' and so on)
+are converted in bulk: a run where every operation gives X, Y and D is read
+by NumPy directly, other runs with a single findall. Modal coordinates are
+filled in afterwards over the whole layer.
+
+Not supported (KiCad does not write them): step and repeat (%SR), block
+apertures (%AB), incremental coordinates. Arcs inside regions are kept as
+their end points only.
+
+Usage:
+  python read_gerber.py gerber/gdp-F_Cu.gbr
+  python read_gerber.py gerber/*.gbr
+"""
+
+from __future__ import annotations
+import argparse
+import re
+import time
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+# Interpolation modes, stored per draw
+LINEAR, CW, CCW = 1, 2, 3
+
+# Control statements: extended commands '%...%' and word commands that do not
+# start with a coordinate. Everything in between is a run of operations.
+# Statements are expected at the start of a line, as KiCad writes them;
+# anchoring on lines keeps the search several times faster.
+_CONTROL_RE = re.compile(r'^(?:%[^%]*%|[^XYIJ%*\s][^*%]*\*)', re.M)
+
+# One operation; an empty group means the coordinate was not given
+_OP_RE = re.compile(r'(?:X([+-]?\d+))?(?:Y([+-]?\d+))?(?:I([+-]?\d+))?(?:J([+-]?\d+))?D0*([123])\*')
+
+_FORMAT_RE = re.compile(r'%FS([LT])([AI])X(\d)(\d)Y(\d)(\d)\*%')
+_APERTURE_RE = re.compile(r'%ADD(\d+)([^,*]+),?([^*]*)\*%')
+_XYD_TO_SPACE = str.maketrans("XYD*", "    ")
+
+class Aperture(NamedTuple):
+    shape: str                          # 'C', 'R', 'O', 'P' or a macro name
+    params: Tuple[float, ...]           # sizes in mm (counts and angles as written)
+
+class GerberLayer(NamedTuple):
+    path: str
+    function: str                       # TF.FileFunction, e.g. 'Copper,L1,Top'
+    apertures: Dict[int, Aperture]
+    flashes: np.ndarray                 # (n, 2) x y
+    flash_aperture: np.ndarray          # (n,) D code
+    flash_dark: np.ndarray              # (n,) bool, False for LPC
+    draws: np.ndarray                   # (m, 4) x1 y1 x2 y2
+    draw_aperture: np.ndarray           # (m,) D code
+    draw_dark: np.ndarray               # (m,)
+    draw_mode: np.ndarray               # (m,) LINEAR, CW or CCW
+    draw_center: np.ndarray             # (m, 2) arc centre, NaN for lines
+    regions: np.ndarray                 # (p, 2) contour vertices, all regions
+    region_offsets: np.ndarray          # (r + 1,) contour k is regions[off[k]:off[k + 1]]
+    region_dark: np.ndarray             # (r,)
+
+    def summary(self) -> str:
+        arcs = int(np.count_nonzero(self.draw_mode != LINEAR))
+        return (f"{len(self.apertures)} apertures, {len(self.flashes)} flashes, "
+                f"{len(self.draws) - arcs} lines, {arcs} arcs, "
+                f"{len(self.region_offsets) - 1} contours ({len(self.regions)} vertices)")
+
+# ---------- Operation runs ----------
+
+def _ints(values: List[str]) -> np.ndarray:
+    arr = np.array(values)
+    arr[arr == ""] = "nan"
+    return arr.astype(np.float64)
+
+def _ops(run: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (coords (n, 2), centre offsets (n, 2), D codes (n,)) of a run of
+    operations, in integer file units. Coordinates not given are NaN,
+    offsets not given are 0.
+    """
+    n = run.count("D")
+    if n == run.count("X") == run.count("Y") and "I" not in run and "J" not in run:
+        v = np.fromstring(run.translate(_XYD_TO_SPACE), sep=" ")
+        if len(v) == 3 * n:
+            v = v.reshape(-1, 3)
+            return v[:, :2], np.zeros((n, 2)), v[:, 2].astype(np.int8)
+    rows = _OP_RE.findall(run)
+    if not rows:
+        return np.zeros((0, 2)), np.zeros((0, 2)), np.zeros(0, dtype=np.int8)
+    x, y, i, j, d = zip(*rows)
+    xy = np.column_stack((_ints(x), _ints(y)))
+    ij = np.nan_to_num(np.column_stack((_ints(i), _ints(j))))
+    return xy, ij, np.array(d, dtype=np.int8)
+
+def _fill_modal(col: np.ndarray) -> np.ndarray:
+    """Replace NaNs with the last given value before them (0 at the start)."""
+    missing = np.isnan(col)
+    if not missing.any():
+        return col
+    idx = np.where(missing, 0, np.arange(len(col)))
+    np.maximum.accumulate(idx, out=idx)
+    filled = col[idx]
+    filled[np.isnan(filled)] = 0.0
+    return filled
+
+# ---------- Reader ----------
+
+def read_gerber(path: str) -> GerberLayer:
+    """Read one Gerber file; see GerberLayer for the result."""
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        text = fh.read()
+
+    function = ""
+    apertures: Dict[int, Aperture] = {}
+    scale = 1e-6                        # file units -> mm, from %FS and %MO
+    decimals = 6
+    inch = False
+
+    # Graphics state, and per run of operations: the state it was read in
+    aperture = 0
+    mode = LINEAR
+    dark = True
+    region = -1                         # index of the open G36 region, -1 if none
+    regions_seen = 0
+    runs: List[Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+    states: List[Tuple[int, int, bool, int]] = []
+
+    def add(run):
+        ops = _ops(run)
+        if len(ops[2]):
+            runs.append(ops)
+            states.append((aperture, mode, dark, region))
+
+    pos = 0
+    for m in _CONTROL_RE.finditer(text):
+        if m.start() > pos:
+            add(text[pos:m.start()])
+        pos = m.end()
+        s = m.group()
+        if s[0] == "%":
+            if s.startswith("%AD"):
+                a = _APERTURE_RE.match(s)
+                if a:
+                    params = tuple(float(p) for p in a.group(3).split("X") if p)
+                    apertures[int(a.group(1))] = Aperture(a.group(2), params)
+            elif s.startswith("%LP"):
+                dark = s[3] == "D"
+            elif s.startswith("%FS"):
+                f = _FORMAT_RE.match(s)
+                if f:
+                    decimals = int(f.group(4))
+            elif s.startswith("%MO"):
+                inch = s.startswith("%MOIN")
+            elif s.startswith("%TF.FileFunction,"):
+                function = s[len("%TF.FileFunction,"):-2]
+            elif s.startswith(("%SR", "%AB")) and s not in ("%SR*%", "%AB*%"):
+                raise ValueError(f"{path}: {s[:3]} blocks are not supported")
+            scale = (25.4 if inch else 1.0) / 10 ** decimals
+            continue
+        word = s[:-1]
+        if word[0] == "D":
+            d = int(word[1:])
+            if d >= 10:
+                aperture = d
+            else:
+                add(s)          # a bare D01/D02/D03 at the current point
+        elif word[0] == "G":
+            g = word[1:3]
+            if g == "04":
+                if word.startswith("G04 #@! TF.FileFunction,"):
+                    function = word[len("G04 #@! TF.FileFunction,"):]
+            elif g == "36":
+                region = regions_seen
+                regions_seen += 1
+            elif g == "37":
+                region = -1
+            elif g in ("01", "02", "03"):
+                mode = int(g)
+                if len(word) > 3:
+                    add(word[3:] + "*")     # deprecated 'G01X..Y..D01*'
+            elif g in ("54", "55") and len(word) > 3 and word[3] == "D":
+                aperture = int(word[4:])    # deprecated 'G54D10*'
+    if pos < len(text):
+        add(text[pos:])
+
+    return _build(path, function, apertures, runs, states, scale)
+
+def _build(path, function, apertures, runs, states, scale) -> GerberLayer:
+    if runs:
+        xy = np.concatenate([r[0] for r in runs])
+        ij = np.concatenate([r[1] for r in runs]) * scale
+        d = np.concatenate([r[2] for r in runs])
+    else:
+        xy = ij = np.zeros((0, 2))
+        d = np.zeros(0, dtype=np.int8)
+    xy = np.column_stack((_fill_modal(xy[:, 0]), _fill_modal(xy[:, 1]))) * scale
+    counts = [len(r[2]) for r in runs]
+    st = np.array(states, dtype=np.int64).reshape(-1, 4)
+    aperture, mode, dark, region = (np.repeat(st[:, k], counts) for k in range(4))
+    dark = dark.astype(bool)
+    prev = np.vstack((xy[:1] * 0, xy[:-1]))         # current point before each operation
+
+    flash = (d == 3) & (region < 0)
+    draw = (d == 1) & (region < 0)
+    draws = np.hstack((prev[draw], xy[draw]))
+    draw_mode = mode[draw].astype(np.int8)
+    center = prev[draw] + ij[draw]
+    center[draw_mode == LINEAR] = np.nan
+
+    # Contours: a D02 inside a region starts one, D01s extend it
+    inside = region >= 0
+    r_xy, r_d, r_region = xy[inside], d[inside], region[inside]
+    start = r_d == 2
+    if len(r_d):
+        start[0] = True
+        start[1:] |= r_region[1:] != r_region[:-1]
+    keep = r_d != 3
+    starts = np.flatnonzero(start[keep])
+    offsets = np.append(starts, np.count_nonzero(keep)).astype(np.int64)
+    region_dark = dark[inside][keep][starts]
+
+    return GerberLayer(path, function, apertures,
+                       xy[flash], aperture[flash].astype(np.int32), dark[flash],
+                       draws, aperture[draw].astype(np.int32), dark[draw], draw_mode, center,
+                       r_xy[keep], offsets, region_dark)
+
+# ---------- Main ----------
+
+def main():
+    ap = argparse.ArgumentParser(description="Read Gerber RS-274X files and summarize their contents.")
+    ap.add_argument("gerber", nargs="+", help="Gerber files (.gbr)")
+    args = ap.parse_args()
+
+    for path in args.gerber:
+        t0 = time.perf_counter()
+        layer = read_gerber(path)
+        dt = time.perf_counter() - t0
+        print(f"{path}: {layer.function or '?'}")
+        print(f"  {layer.summary()}  [{dt * 1000:.0f} ms]")
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,234 @@
+import argparse
+import os
 import re
+import shutil
 import sys
+import tempfile
 
-def remove_nets_from_kicad_pcb(input_file, output_file):
-    with open(input_file, 'r', encoding='utf-8') as file:
-        pcb_data = file.readlines()
+import perf
+import sexpr
 
-    # Regular expression to match net attributes (e.g., (net 5 "GND") or (net 11))
-    net_pattern = re.compile(r'\(net\s+\d+(\s+".*?")?\)')
+# Net attributes look like (net 5 "GND") or (net 11)
+net_pattern = re.compile(r'\(net\s+\d+(?:\s+(?:"(?:[^"\\]|\\.)*"|[^\s()"]+))?\s*\)')
+_NET_PATTERN_B = re.compile(net_pattern.pattern.encode())
 
-    modified_lines = []
-    for line in pcb_data:
-        # Remove net attributes
-        line = net_pattern.sub("", line).rstrip()
-        modified_lines.append(line)
+# Whitespace left between a removed attribute and the end of its line
+_BLANK_REST_RE = re.compile(rb'[ \t]*(?=\r?\n|\Z)')
+
+# While streaming, a '(net' head this close to the end of a chunk may not be
+# complete yet, so that part of the chunk is carried over to the next read.
+# The carried part starts at a line start: KiCad writes no newline inside a
+# string, so the next scan never starts inside one.
+_HEAD_GUARD = 64
+
+def remove_nets_from_kicad_pcb(input_file, output_file, stats=None):
+    stats = stats or perf.Stats()
+    with stats.stage("read", os.path.getsize(input_file)):
+        with open(input_file, 'r', encoding='utf-8') as file:
+            pcb_data = file.read()
+
+    # Cut every net attribute out of the text, keeping everything in between
+    with stats.stage("cut", os.path.getsize(input_file)) as st:
+        pcb_data, removed = net_pattern.subn("", pcb_data)
+        st.blocks = removed
+
+        modified_lines = [line.rstrip() for line in pcb_data.split("\n")]
+        if modified_lines and not modified_lines[-1]:
+            modified_lines.pop()
 
     # Save the modified PCB file
-    with open(output_file, 'w', encoding='utf-8') as file:
-        file.writelines(line + '\n' for line in modified_lines)
+    with stats.stage("write") as st:
+        with open(output_file, 'w', encoding='utf-8') as file:
+            file.writelines(line + '\n' for line in modified_lines)
+    st.bytes = os.path.getsize(output_file)
 
-    print(f"Removed all nets from {input_file} and saved to {output_file}")
+    print(f"Removed {removed} net references from {input_file} and saved to {output_file}")
+    return removed
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print("Usage: python remove_nets.py input.kicad_pcb output.kicad_pcb")
+class _LineTailWriter:
+    """
+    Passes bytes through to a binary file but holds back the current,
+    unfinished line, so its trailing whitespace can still be trimmed.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.tail = b""
+
+    def write(self, data):
+        nl = data.rfind(b"\n")
+        if nl < 0:
+            self.tail += data
+            return
+        self.out.write(self.tail)
+        self.out.write(data[:nl + 1])
+        self.tail = data[nl + 1:]
+
+    def trim(self):
+        self.tail = self.tail.rstrip(b" \t")
+
+    def close(self):
+        self.out.write(self.tail)
+        self.tail = b""
+
+def _strip_nets(buf, writer, final):
+    """
+    Write buf to writer without its net attributes and return
+    (bytes consumed, attributes removed). Unless final, stop before anything
+    that may continue past the end of buf: a block running up to the end,
+    the line holding the last _HEAD_GUARD bytes, or a line whose end is not in
+    buf yet. The caller passes the unconsumed rest again with the next chunk.
+    """
+    pos = 0
+    removed = 0
+    cut = len(buf) if final else buf.rfind(b"\n", 0, max(0, len(buf) - _HEAD_GUARD)) + 1
+    for _, start, end in sexpr.find_blocks(buf, ("net",)):
+        if not final and (start >= cut or end >= len(buf)):
+            cut = min(start, cut)
+            break
+        if not _NET_PATTERN_B.fullmatch(buf, start, end):
+            continue
+        # If the attribute ended its line, drop the whitespace it leaves behind
+        m = _BLANK_REST_RE.match(buf, end)
+        if m and not final and m.end() >= len(buf):
+            cut = min(start, cut)
+            break
+        writer.write(buf[pos:start])
+        pos = end
+        removed += 1
+        if m:
+            writer.trim()
+            pos = m.end()
+    cut = max(cut, pos)
+    writer.write(buf[pos:cut])
+    return cut, removed
+
+def remove_nets_mapped(input_file, output_file):
+    """
+    Same as remove_nets_from_kicad_pcb, but the input is memory-mapped and
+    scanned as bytes: only the (net ...) blocks are decoded, and the output
+    is written piece by piece. Lines that lose a net attribute have their
+    trailing whitespace trimmed; all other bytes are copied unchanged.
+    Returns the number of net attributes removed.
+    """
+    if os.path.exists(output_file) and os.path.samefile(input_file, output_file):
+        raise ValueError("input and output must be different files")
+
+    with sexpr.map_file(input_file) as buf, open(output_file, 'wb') as out:
+        writer = _LineTailWriter(out)
+        _, removed = _strip_nets(buf, writer, final=True)
+        writer.close()
+
+    print(f"Removed {removed} net references from {input_file} and saved to {output_file}")
+    return removed
+
+def _stream(src, out, chunk_size):
+    writer = _LineTailWriter(out)
+    removed = 0
+    buf = b""
+    while True:
+        chunk = src.read(chunk_size)
+        final = not chunk
+        buf += chunk
+        consumed, n = _strip_nets(buf, writer, final)
+        removed += n
+        buf = buf[consumed:]
+        if final:
+            break
+    writer.close()
+    return removed
+
+def remove_nets_streaming(input_file, output_file=None, chunk_size=1 << 20):
+    """
+    Same output as remove_nets_mapped, but the input is read in chunks of
+    chunk_size bytes, so memory stays at about one chunk whatever the board
+    size. Attributes cut by a chunk boundary are carried over and handled
+    with the next chunk.
+
+    The result is written to a temporary file next to the target and renamed
+    over it once complete, so a failed run never leaves a half-written board.
+    With output_file None the input is rewritten in place. '-' reads stdin or
+    writes stdout directly (no temporary file).
+    Returns the number of net attributes removed.
+    """
+    target = input_file if output_file is None else output_file
+    log = sys.stderr if target == "-" else sys.stdout
+
+    if input_file == "-":
+        src = sys.stdin.buffer
+    else:
+        src = open(input_file, 'rb')
+    try:
+        if target == "-":
+            removed = _stream(src, sys.stdout.buffer, chunk_size)
+            sys.stdout.buffer.flush()
+        else:
+            fd, tmp_path = tempfile.mkstemp(prefix=".remove_nets-", suffix=".tmp",
+                                            dir=os.path.dirname(os.path.abspath(target)))
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    removed = _stream(src, out, chunk_size)
+                if input_file != "-":
+                    shutil.copymode(input_file, tmp_path)
+                os.replace(tmp_path, target)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+    finally:
+        if src is not sys.stdin.buffer:
+            src.close()
+
+    print(f"Removed {removed} net references from {input_file} and saved to {target}", file=log)
+    return removed
+
+def main():
+    ap = argparse.ArgumentParser(description="Remove all net attributes from a KiCad .kicad_pcb file.")
+    ap.add_argument("input", help="Path to .kicad_pcb file ('-' for stdin with --stream)")
+    ap.add_argument("output", nargs="?", help="Output path ('-' for stdout with --stream)")
+    mode = ap.add_mutually_exclusive_group()
+    mode.add_argument("--mmap", action="store_true",
+                      help="Memory-map the input and scan raw bytes")
+    mode.add_argument("--stream", action="store_true",
+                      help="Read the input in chunks with constant memory; write via a temp file")
+    ap.add_argument("--in-place", action="store_true",
+                    help="Rewrite the input file (streams through a temp file)")
+    ap.add_argument("--chunk-size", type=int, default=1 << 20,
+                    help="Chunk size in bytes for --stream (default: 1 MiB)")
+    ap.add_argument("--stats", action="store_true",
+                    help="Print time, bytes, blocks, throughput and peak RSS per stage on stderr")
+    ap.add_argument("--stats-json", metavar="PATH", help="Write the per-stage statistics as JSON")
+    ap.add_argument("--profile", metavar="PATH",
+                    help="Run under cProfile; save pstats to PATH (hot functions as JSON if PATH ends in .json)")
+    args = ap.parse_args()
+
+    if args.in_place:
+        if args.output or args.mmap or args.input == "-":
+            ap.error("--in-place takes only an input file and cannot be combined with --mmap")
+    elif not args.output:
+        ap.error("an output path is required unless --in-place is given")
+
+    stats = perf.Stats()
+    with perf.profiled(args.profile):
+        run(args, stats)
+    if args.stats:
+        stats.report()
+    if args.stats_json:
+        stats.write_json(args.stats_json)
+
+def run(args, stats):
+    size = os.path.getsize(args.input) if args.input != "-" else 0
+    if args.in_place:
+        with stats.stage("strip (stream)", size) as st:
+            st.blocks = remove_nets_streaming(args.input, None, args.chunk_size)
+    elif args.stream:
+        with stats.stage("strip (stream)", size) as st:
+            st.blocks = remove_nets_streaming(args.input, args.output, args.chunk_size)
+    elif args.mmap:
+        with stats.stage("strip (mmap)", size) as st:
+            st.blocks = remove_nets_mapped(args.input, args.output)
     else:
-        remove_nets_from_kicad_pcb(sys.argv[1], sys.argv[2])
+        remove_nets_from_kicad_pcb(args.input, args.output, stats)
+
+if __name__ == "__main__":
+    main()
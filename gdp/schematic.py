@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+schematic.py
+
+Load a hierarchical KiCad schematic (.kicad_sch root sheet and all sheets it
+references) into plain tuples: placed symbols with their pins in sheet
+coordinates, wires, buses, junctions, no-connect flags, labels and the links
+to sub-sheets.
+
+Sheets are parsed in parallel worker processes, one level of the hierarchy
+at a time. Every parsed sheet is cached next to it as '<sheet>.cache'; a
+sheet is only parsed again when its cache was written by another version of
+this loader, or when its mtime/size changed and its content hash did too.
+
+Usage:
+  python schematic.py gdp.kicad_sch
+  python schematic.py gdp.kicad_sch --jobs 4 --no-cache
+"""
+
+from __future__ import annotations
+import argparse
+import concurrent.futures
+import hashlib
+import os
+import pickle
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import sexpr
+
+# Bump whenever parse_sheet() changes what it returns, so stale caches are ignored
+SCHEMATIC_VERSION = 2
+
+Point = Tuple[float, float]
+
+class Pin(NamedTuple):
+    number: str
+    name: str
+    type: str                           # input, output, power_in, passive, ...
+    hidden: bool
+    x: float                            # connection point in sheet coordinates
+    y: float
+
+class Symbol(NamedTuple):
+    ref: str                            # Reference property (see instances)
+    value: str
+    lib_id: str
+    unit: int
+    units: int                          # units of the library symbol
+    footprint: str
+    in_bom: bool
+    on_board: bool
+    dnp: bool
+    power: bool                         # power symbol: Value names a global net
+    pins: Tuple[Pin, ...]
+    instances: Tuple[Tuple[str, str, int], ...]     # (sheet path, reference, unit)
+
+class Label(NamedTuple):
+    kind: str                           # 'local', 'global', 'hierarchical' or 'sheet_pin'
+    name: str
+    x: float
+    y: float
+
+class SheetLink(NamedTuple):
+    name: str                           # Sheetname
+    file: str                           # Sheetfile, relative to the parent sheet
+    uuid: str
+    pins: Tuple[Label, ...]             # sheet pins, kind 'sheet_pin'
+
+class Sheet(NamedTuple):
+    path: str
+    uuid: str
+    symbols: Tuple[Symbol, ...]
+    wires: Tuple[Tuple[float, float, float, float], ...]
+    buses: Tuple[Tuple[float, float, float, float], ...]
+    junctions: Tuple[Point, ...]
+    no_connects: Tuple[Point, ...]
+    labels: Tuple[Label, ...]
+    sheets: Tuple[SheetLink, ...]
+
+class Schematic(NamedTuple):
+    root: str
+    sheets: Dict[str, Sheet]            # by absolute path
+
+# ---------- Parser ----------
+
+_LABEL_KINDS = {"label": "local", "global_label": "global", "hierarchical_label": "hierarchical"}
+
+def _at(node) -> Tuple[float, float, float]:
+    at = sexpr.find(node, "at")
+    if not at:
+        return 0.0, 0.0, 0.0
+    angle = float(at[3]) if len(at) > 3 else 0.0
+    return float(at[1]), float(at[2]), angle
+
+def _flag(node, head: str, default: bool = False) -> bool:
+    """Value of a '(head yes|no)' child; '(head)', '(head <other>)' or a bare 'head' atom count as yes."""
+    for child in node:
+        if child == head:
+            return True
+        if isinstance(child, list) and child and child[0] == head:
+            return len(child) < 2 or child[1] != "no"
+    return default
+
+def _properties(node) -> Dict[str, str]:
+    return {p[1]: p[2] for p in sexpr.find_all(node, "property") if len(p) > 2}
+
+def _lib_pins(lib, unit: int, style: int) -> List[Tuple[str, str, str, bool, float, float]]:
+    """Pins of a library symbol for one unit and body style, in library coordinates (y up)."""
+    pins = []
+    prefix = lib[1].split(":")[-1] + "_"
+    for sub in sexpr.find_all(lib, "symbol"):
+        parts = sub[1][len(prefix):].split("_") if sub[1].startswith(prefix) else []
+        if len(parts) != 2 or not all(p.isdigit() for p in parts):
+            continue
+        sub_unit, sub_style = int(parts[0]), int(parts[1])
+        if sub_unit not in (0, unit) or sub_style not in (0, style):
+            continue
+        for pin in sexpr.find_all(sub, "pin"):
+            x, y, _ = _at(pin)
+            number = sexpr.find(pin, "number")
+            name = sexpr.find(pin, "name")
+            hidden = _flag(pin, "hide")
+            pins.append((number[1] if number else "", name[1] if name else "",
+                         pin[1] if len(pin) > 1 else "", hidden, x, y))
+    return pins
+
+def _unit_count(lib) -> int:
+    prefix = lib[1].split(":")[-1] + "_"
+    units = [int(sub[1][len(prefix):].split("_")[0]) for sub in sexpr.find_all(lib, "symbol")
+             if sub[1].startswith(prefix) and sub[1][len(prefix):].split("_")[0].isdigit()]
+    return max(units + [1])
+
+def _place(px: float, py: float, x: float, y: float, angle: float, mirror: str) -> Point:
+    """
+    Library point (y up) to sheet coordinates (y down) for a symbol at (x, y)
+    rotated counter-clockwise by `angle` and then mirrored ('x' flips y,
+    'y' flips x), as Eeschema places it.
+    """
+    dx, dy = px, -py
+    for _ in range(int(round(angle / 90)) % 4):
+        dx, dy = dy, -dx
+    if mirror == "x":
+        dy = -dy
+    elif mirror == "y":
+        dx = -dx
+    return round(x + dx, 4), round(y + dy, 4)
+
+def _symbol(node, libs) -> Symbol:
+    lib_name = sexpr.find(node, "lib_name")
+    lib_id = sexpr.find(node, "lib_id")
+    lib = libs.get(lib_name[1] if lib_name else lib_id[1] if lib_id else "")
+    props = _properties(node)
+    x, y, angle = _at(node)
+    mirror = sexpr.find(node, "mirror")
+    unit = sexpr.find(node, "unit")
+    style = sexpr.find(node, "body_style") or sexpr.find(node, "convert")
+    unit = int(unit[1]) if unit else 1
+
+    pins = []
+    if lib is not None:
+        for number, name, ptype, hidden, px, py in _lib_pins(lib, unit, int(style[1]) if style else 1):
+            sx, sy = _place(px, py, x, y, angle, mirror[1] if mirror else "")
+            pins.append(Pin(number, name, ptype, hidden, sx, sy))
+
+    instances = []
+    for project in sexpr.find_all(sexpr.find(node, "instances") or [], "project"):
+        for path in sexpr.find_all(project, "path"):
+            ref = sexpr.find(path, "reference")
+            inst_unit = sexpr.find(path, "unit")
+            instances.append((path[1], ref[1] if ref else "", int(inst_unit[1]) if inst_unit else unit))
+
+    return Symbol(props.get("Reference", ""), props.get("Value", ""), lib_id[1] if lib_id else "",
+                  unit, _unit_count(lib) if lib is not None else 1, props.get("Footprint", ""),
+                  _flag(node, "in_bom", True), _flag(node, "on_board", True), _flag(node, "dnp"),
+                  lib is not None and _flag(lib, "power"), tuple(pins), tuple(instances))
+
+def _segment(node) -> Tuple[float, float, float, float]:
+    pts = sexpr.find(node, "pts") or []
+    xy = [(float(p[1]), float(p[2])) for p in sexpr.find_all(pts, "xy")]
+    (x1, y1), (x2, y2) = xy[0], xy[-1]
+    return x1, y1, x2, y2
+
+def parse_sheet(path: str) -> Sheet:
+    """Parse one .kicad_sch file."""
+    with open(path, "r", encoding="utf-8") as f:
+        root = sexpr.parse(f.read())
+    if not root or root[0] != "kicad_sch":
+        raise ValueError(f"{path}: not a KiCad schematic")
+
+    libs = {}
+    for lib in sexpr.find_all(sexpr.find(root, "lib_symbols") or [], "symbol"):
+        libs[lib[1]] = lib
+
+    uuid = sexpr.find(root, "uuid")
+    symbols, wires, buses, junctions, no_connects, labels, sheets = [], [], [], [], [], [], []
+    for node in root:
+        if not isinstance(node, list) or not node:
+            continue
+        head = node[0]
+        if head == "symbol":
+            symbols.append(_symbol(node, libs))
+        elif head == "wire":
+            wires.append(_segment(node))
+        elif head == "bus":
+            buses.append(_segment(node))
+        elif head == "junction":
+            junctions.append(_at(node)[:2])
+        elif head == "no_connect":
+            no_connects.append(_at(node)[:2])
+        elif head in _LABEL_KINDS:
+            x, y, _ = _at(node)
+            labels.append(Label(_LABEL_KINDS[head], node[1], x, y))
+        elif head == "sheet":
+            props = _properties(node)
+            sheet_uuid = sexpr.find(node, "uuid")
+            pins = tuple(Label("sheet_pin", p[1], *_at(p)[:2]) for p in sexpr.find_all(node, "pin"))
+            sheets.append(SheetLink(props.get("Sheetname", props.get("Sheet name", "")),
+                                    props.get("Sheetfile", props.get("Sheet file", "")),
+                                    sheet_uuid[1] if sheet_uuid else "", pins))
+
+    return Sheet(path, uuid[1] if uuid else "", tuple(symbols), tuple(wires), tuple(buses),
+                 tuple(junctions), tuple(no_connects), tuple(labels), tuple(sheets))
+
+# ---------- Cache ----------
+
+def _digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _cached(path: str) -> Optional[Sheet]:
+    """The cached Sheet for path if it is still valid, else None."""
+    try:
+        with open(f"{path}.cache", "rb") as f:
+            version, mtime_ns, size, digest, sheet = pickle.load(f)
+    except (OSError, EOFError, ValueError, TypeError, AttributeError, ImportError,
+            pickle.UnpicklingError):
+        return None     # missing, truncated or written by another version
+    if version != SCHEMATIC_VERSION:
+        return None
+    st = os.stat(path)
+    if (st.st_mtime_ns, st.st_size) == (mtime_ns, size):
+        return sheet
+    if _digest(path) != digest:
+        return None
+    # Touched but unchanged: keep the entry, with the new mtime
+    _store(path, sheet, digest)
+    return sheet
+
+def _store(path: str, sheet: Sheet, digest: Optional[str] = None) -> None:
+    st = os.stat(path)
+    entry = (SCHEMATIC_VERSION, st.st_mtime_ns, st.st_size, digest or _digest(path), sheet)
+    try:
+        tmp_path = f"{path}.cache.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, f"{path}.cache")
+    except OSError:
+        pass    # a read-only checkout just runs without a cache
+
+def _parse_and_store(path: str) -> Sheet:
+    sheet = parse_sheet(path)
+    _store(path, sheet)
+    return sheet
+
+# ---------- Loader ----------
+
+def _parse_many(paths: List[str], use_cache: bool, jobs: int) -> Dict[str, Sheet]:
+    parse = _parse_and_store if use_cache else parse_sheet
+    if jobs <= 1 or len(paths) <= 1:
+        return {p: parse(p) for p in paths}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(paths))) as pool:
+        return dict(zip(paths, pool.map(parse, paths)))
+
+def load_schematic(root: str, jobs: Optional[int] = None, use_cache: bool = True,
+                   parsed: Optional[List[str]] = None, known: Optional[Dict[str, Sheet]] = None) -> Schematic:
+    """
+    Load the root sheet and every sheet below it. Sheets given in `known`
+    (by absolute path) or with a valid cache are not read again; the others
+    are parsed in up to `jobs` worker processes (default: the available
+    cores). The paths that had to be parsed are appended to `parsed` if given.
+    """
+    if jobs is None:
+        try:
+            jobs = len(os.sched_getaffinity(0))
+        except AttributeError:      # not on Linux
+            jobs = os.cpu_count() or 1
+
+    sheets: Dict[str, Sheet] = {}
+    level = [os.path.abspath(root)]
+    while level:
+        todo = []
+        for path in level:
+            sheet = known.get(path) if known else None
+            if sheet is None and use_cache:
+                sheet = _cached(path)
+            if sheet is None:
+                todo.append(path)
+            else:
+                sheets[path] = sheet
+        sheets.update(_parse_many(todo, use_cache, jobs))
+        if parsed is not None:
+            parsed.extend(todo)
+
+        nxt = []
+        for path in level:
+            for link in sheets[path].sheets:
+                child = os.path.abspath(os.path.join(os.path.dirname(path), link.file))
+                if child not in sheets and child not in nxt:
+                    nxt.append(child)
+        level = nxt
+    return Schematic(os.path.abspath(root), sheets)
+
+def walk(schematic: Schematic) -> Iterator[Tuple[str, SheetLink, Sheet]]:
+    """
+    Yield (instance path, link, sheet) for every sheet instance, root first,
+    depth first. The instance path is '/<root uuid>/<sheet uuid>/...', as in
+    the symbol instances; the root gets a link with an empty name.
+    """
+    root = schematic.sheets[schematic.root]
+    stack = [(f"/{root.uuid}", SheetLink("", os.path.basename(schematic.root), root.uuid, ()),
+              schematic.root)]
+    while stack:
+        inst, link, path = stack.pop()
+        sheet = schematic.sheets[path]
+        yield inst, link, sheet
+        for child in reversed(sheet.sheets):
+            child_path = os.path.abspath(os.path.join(os.path.dirname(path), child.file))
+            stack.append((f"{inst}/{child.uuid}", child, child_path))
+
+def reference(symbol: Symbol, instance: str) -> str:
+    """Reference of a symbol in one sheet instance (the instance path of its sheet)."""
+    for path, ref, _unit in symbol.instances:
+        if path == instance:
+            return ref
+    return symbol.ref
+
+# ---------- Main ----------
+
+def main():
+    ap = argparse.ArgumentParser(description="Load a hierarchical KiCad schematic and summarize its sheets.")
+    ap.add_argument("root", help="Root .kicad_sch file")
+    ap.add_argument("--jobs", type=int, default=None, help="Worker processes (default: available cores)")
+    ap.add_argument("--no-cache", action="store_true", help="Parse every sheet instead of using .cache files")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    parsed: List[str] = []
+    sch = load_schematic(args.root, args.jobs, not args.no_cache, parsed)
+    dt = time.perf_counter() - t0
+
+    for inst, link, sheet in walk(sch):
+        name = link.name or "(root)"
+        print(f"{name:10} {os.path.basename(sheet.path):16} {len(sheet.symbols):4} symbols  "
+              f"{len(sheet.wires):4} wires  {len(sheet.junctions):4} junctions  "
+              f"{len(sheet.labels):4} labels  {len(sheet.sheets):3} sheets")
+    print(f"\n{len(sch.sheets)} sheets loaded in {dt * 1000:.0f} ms, {len(parsed)} parsed")
+
+if __name__ == "__main__":
+    # Run through the importable module, so that cached sheets pickle as
+    # schematic.Sheet and not __main__.Sheet
+    import schematic
+    schematic.main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+sexpr.py
+
+Shared S-expression reader for KiCad files (.kicad_pcb, .kicad_sch,
+.kicad_mod, .kicad_sym and exported .net netlists).
+
+The text is tokenized with one compiled regex in a single linear pass.
+Quoted strings (including escaped quotes) are a single token, so parentheses
+inside names such as "Net-(IC1-Pad3)" never disturb the nesting.
+
+Built on top of the tokenizer:
+- parse():       build a compact tree of nested lists and strings
+                 '(pad "1" thru_hole circle (size 1.6 1.6))' ->
+                 ['pad', '1', 'thru_hole', 'circle', ['size', '1.6', '1.6']]
+- iter_blocks(): report (head, start, end) spans of blocks whose head is
+                 one of the requested names, without building a tree
+- iter_nodes():  stream a file and build only the nodes at a given path,
+                 e.g. ("export", "nets", "net") of a netlist
+- find_blocks(): like iter_blocks(), but jumps from one candidate block
+                 straight to the next; also works on bytes and on an mmap
+                 from map_file(), so only the reported slices get decoded
+- next_head():   the quote-aware search for the next '(head' that
+                 find_blocks() uses, for callers walking blocks themselves
+
+Usage from other scripts:
+  import sexpr
+  for head, start, end in sexpr.iter_blocks(text, ("pad", "via")):
+      node = sexpr.parse(text[start:end])
+"""
+
+from __future__ import annotations
+import contextlib
+import functools
+import mmap
+import re
+from typing import Collection, Container, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+
+Node = Union[str, List["Node"]]
+
+# One token: a paren, a quoted string (backslash escapes allowed) or a bare atom.
+_TOKEN_RE = re.compile(r'[()]|"(?:[^"\\]|\\.)*"|[^\s()"]+', re.S)
+
+# Same as _TOKEN_RE, but a string cut off at the end of a chunk is still one token.
+_STREAM_TOKEN_RE = re.compile(r'[()]|"(?:[^"\\]|\\.)*"?|[^\s()"]+', re.S)
+
+# Block scanner: only parens and strings matter; the atom after '(' is captured.
+_SCAN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|\(\s*([^\s()"]*)|\)', re.S)
+
+# Paren matcher for find_blocks, in str and bytes flavours: group 1 is '(',
+# group 2 is ')', no group is a quoted string.
+_PAREN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|(\()|(\))', re.S)
+_PAREN_RE_B = re.compile(rb'"(?:[^"\\]|\\.)*"|(\()|(\))', re.S)
+
+# A quoted string, for telling whether a '(head' found by find_blocks is text
+_STRING_RE = re.compile(r'"(?:[^"\\]|\\.)*"', re.S)
+_STRING_RE_B = re.compile(rb'"(?:[^"\\]|\\.)*"', re.S)
+
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+_ESCAPE_RE = re.compile(r"\\(.)", re.S)
+
+# ---------- Tokens ----------
+
+def unquote(token: str) -> str:
+    """Strip the quotes of a string token and resolve backslash escapes."""
+    body = token[1:-1]
+    if "\\" not in body:
+        return body
+    return _ESCAPE_RE.sub(lambda m: _ESCAPES.get(m.group(1), m.group(1)), body)
+
+def tokenize(text: str, pos: int = 0, endpos: Optional[int] = None) -> Iterator[str]:
+    """Yield raw tokens: '(', ')', quoted strings (still quoted) and atoms."""
+    if endpos is None:
+        endpos = len(text)
+    for m in _TOKEN_RE.finditer(text, pos, endpos):
+        yield m.group()
+
+def iter_file_tokens(fh: TextIO, chunk_size: int = 1 << 16) -> Iterator[str]:
+    """
+    Yield raw tokens from a text file object, reading it in chunks so the
+    whole file is never held in memory. Tokens split across chunks are
+    carried over to the next read.
+    """
+    buf = ""
+    while True:
+        chunk = fh.read(chunk_size)
+        at_eof = not chunk
+        buf += chunk
+        # A token touching the end of the buffer may continue in the next chunk
+        limit = len(buf) - 1
+        rest = len(buf)
+        for m in _STREAM_TOKEN_RE.finditer(buf):
+            if not at_eof and m.end() >= limit:
+                rest = m.start()
+                break
+            yield m.group()
+        if at_eof:
+            return
+        buf = buf[rest:]
+
+# ---------- Tree ----------
+
+def parse(text: str, pos: int = 0, endpos: Optional[int] = None) -> Optional[Node]:
+    """
+    Parse the first S-expression in text[pos:endpos] into nested lists.
+    Quoted strings are unquoted; atoms are kept as strings.
+    Returns None if there is no expression.
+    """
+    if endpos is None:
+        endpos = len(text)
+    stack: List[List[Node]] = [[]]
+    for m in _TOKEN_RE.finditer(text, pos, endpos):
+        tok = m.group()
+        if tok == "(":
+            node: List[Node] = []
+            stack[-1].append(node)
+            stack.append(node)
+        elif tok == ")":
+            if len(stack) > 1:
+                stack.pop()
+                if len(stack) == 1:
+                    break
+        elif tok[0] == '"':
+            stack[-1].append(unquote(tok))
+        else:
+            stack[-1].append(tok)
+    top = stack[0]
+    return top[0] if top else None
+
+def find(node: Node, head: str) -> Optional[List[Node]]:
+    """Return the first direct child list of node whose head is `head`."""
+    for child in node:
+        if isinstance(child, list) and child and child[0] == head:
+            return child
+    return None
+
+def find_all(node: Node, head: str) -> Iterator[List[Node]]:
+    """Yield every direct child list of node whose head is `head`."""
+    for child in node:
+        if isinstance(child, list) and child and child[0] == head:
+            yield child
+
+def iter_nodes(tokens: Iterable[str], path: Tuple[str, ...]) -> Iterator[List[Node]]:
+    """
+    Build and yield only the nodes found at `path` (heads from the root down,
+    e.g. ("export", "nets", "net")) in a stream of raw tokens. Everything
+    outside those nodes is skipped without building a tree.
+    """
+    heads: List[str] = []                  # heads of the open blocks above us
+    building: Optional[List[List[Node]]] = None
+    expect_head = False
+    for tok in tokens:
+        if building is not None:
+            if tok == "(":
+                node: List[Node] = []
+                building[-1].append(node)
+                building.append(node)
+            elif tok == ")":
+                done = building.pop()
+                if not building:
+                    building = None
+                    heads.pop()
+                    yield done
+            elif tok[0] == '"':
+                building[-1].append(unquote(tok))
+            else:
+                building[-1].append(tok)
+            continue
+
+        if expect_head:
+            expect_head = False
+            if tok not in ("(", ")"):
+                head = unquote(tok) if tok[0] == '"' else tok
+                heads.append(head)
+                if len(heads) == len(path) and tuple(heads) == path:
+                    building = [[head]]
+                continue
+            heads.append("")
+        if tok == "(":
+            expect_head = True
+        elif tok == ")" and heads:
+            heads.pop()
+
+# ---------- Block scanner ----------
+
+def iter_blocks(text: str, heads: Container[str], pos: int = 0,
+                endpos: Optional[int] = None) -> Iterator[Tuple[str, int, int]]:
+    """
+    Yield (head, start, end) for every block '(head ...)' in text[pos:endpos]
+    whose head is in `heads`, so that text[start:end] is the whole block.
+    Matching blocks are not searched for nested matches; all other blocks are.
+    An unterminated matching block is reported up to endpos.
+    """
+    if endpos is None:
+        endpos = len(text)
+    depth = 0
+    open_depth = -1   # depth of the currently open matching block, -1 if none
+    head = ""
+    start = 0
+    for m in _SCAN_RE.finditer(text, pos, endpos):
+        c = text[m.start()]
+        if c == "(":
+            depth += 1
+            if open_depth < 0 and m.group(1) in heads:
+                open_depth = depth
+                head = m.group(1)
+                start = m.start()
+        elif c == ")":
+            if depth == open_depth:
+                yield head, start, m.end()
+                open_depth = -1
+            depth -= 1
+    if open_depth >= 0:
+        yield head, start, endpos
+
+def _string_end(buf, pos: int, at: int, binary: bool) -> Optional[int]:
+    """
+    End of the quoted string that buf[at] lies in, None if it lies outside
+    any string. buf[pos] must be outside a string.
+    """
+    gap = buf[pos:at]
+    quote, backslash = (b'"', b"\\") if binary else ('"', "\\")
+    if backslash not in gap:
+        # No escapes: an odd number of quotes leaves a string open
+        if gap.count(quote) % 2 == 0:
+            return None
+        m = (_STRING_RE_B if binary else _STRING_RE).match(buf, pos + gap.rfind(quote))
+        return m.end() if m else len(buf)
+    for m in (_STRING_RE_B if binary else _STRING_RE).finditer(buf, pos):
+        if m.start() >= at:
+            return None
+        if m.end() > at:
+            return m.end()
+    return None
+
+@functools.lru_cache(maxsize=32)
+def _head_re(heads: Tuple[str, ...], binary: bool):
+    alternatives = "|".join(re.escape(h) for h in heads)
+    pattern = r'\(\s*(' + alternatives + r')(?=[\s()"])'
+    return re.compile(pattern.encode() if binary else pattern)
+
+def next_head(buf, heads: Collection[str], pos: int = 0,
+              endpos: Optional[int] = None) -> Optional[re.Match]:
+    """
+    Match of the next '(head' in buf[pos:endpos] that is not inside a quoted
+    string, or None; buf[pos] must be outside a string. The head is group 1.
+    """
+    if endpos is None:
+        endpos = len(buf)
+    binary = not isinstance(buf, str)
+    head_re = _head_re(tuple(heads), binary)
+    while True:
+        m = head_re.search(buf, pos, endpos)
+        if not m:
+            return None
+        quoted = _string_end(buf, pos, m.start(), binary)
+        if quoted is None:
+            return m
+        pos = quoted
+
+def find_blocks(buf, heads: Collection[str], pos: int = 0,
+                endpos: Optional[int] = None) -> Iterator[Tuple[str, int, int]]:
+    """
+    Yield (head, start, end) like iter_blocks(), for a str, bytes or mmap buffer.
+
+    Instead of walking every parenthesis of the file, the next '(head' is
+    found with a regex search and only the inside of each reported block is
+    walked to find its end. A '(head' found inside a quoted string between
+    two blocks is skipped, as iter_blocks() would.
+    """
+    if endpos is None:
+        endpos = len(buf)
+    binary = not isinstance(buf, str)
+    paren_re = _PAREN_RE_B if binary else _PAREN_RE
+    while True:
+        m = next_head(buf, heads, pos, endpos)
+        if not m:
+            return
+        head = m.group(1).decode() if binary else m.group(1)
+        depth = 0
+        end = endpos
+        for t in paren_re.finditer(buf, m.start(), endpos):
+            if t.lastindex == 1:
+                depth += 1
+            elif t.lastindex == 2:
+                depth -= 1
+                if depth == 0:
+                    end = t.end()
+                    break
+        yield head, m.start(), end
+        pos = end
+
+@contextlib.contextmanager
+def map_file(path: str):
+    """Map a file read-only; yields an mmap (or b"" for an empty file)."""
+    with open(path, "rb") as fh:
+        try:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:      # empty files cannot be mapped
+            yield b""
+            return
+        with mm:
+            yield mm
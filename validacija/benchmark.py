@@ -0,0 +1,431 @@
+#!/usr/bin/env python3
+"""
+benchmark.py
+
+Time the parsing stages of check_pads.py, output_bom.py, remove_nets.py and
+read_nets.py on synthetic inputs 1x, 10x and 100x the size of this board,
+and write the results as JSON so that runs from different commits can be
+compared.
+
+The inputs are generated from gdp.net and gdp_validacija.txt: the netlist
+and the validation file are repeated with every reference and net name
+suffixed per copy ('IC14_3', 'GND_3'), and the board is built from the
+scaled netlist (a footprint per component, a pad per pin, a track chain and
+a via per net). Nothing is downloaded; generated files are kept in --workdir
+and reused while the templates and the generator stay the same.
+
+Each stage is run --repeat times for the timings (the best run counts),
+then once more under tracemalloc for its peak Python memory.
+
+Usage:
+  python benchmark.py
+  python benchmark.py --scales 1,10 --repeat 5 --out base.json
+  python benchmark.py --compare base.json --tolerance 0.2
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, NamedTuple, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "gdp"))
+import check_pads  # noqa: E402
+import output_bom  # noqa: E402
+import remove_nets  # noqa: E402
+import sexpr  # noqa: E402
+import read_nets  # noqa: E402
+
+HERE = Path(__file__).resolve().parent
+
+# Bump whenever the generated files change, so kept inputs are rebuilt
+GENERATOR_VERSION = 1
+
+# Version of the JSON layout written by --out
+RESULTS_VERSION = 1
+
+# ---------- Synthetic inputs ----------
+
+_REF_RE = re.compile(r'\(ref "((?:[^"\\]|\\.)*)"\)')
+_NAME_RE = re.compile(r'\(name "((?:[^"\\]|\\.)*)"\)')
+_CODE_RE = re.compile(r'\(code "(\d+)"\)')
+
+
+def _block(text, head):
+    """(start, end) of the first '(head ...)' block in text."""
+    for _, start, end in sexpr.find_blocks(text, (head,)):
+        return start, end
+    raise ValueError(f"no ({head} ...) block in the template")
+
+
+def scale_netlist(text, copies):
+    """The netlist repeated `copies` times; copy c > 0 gets '_c' on refs and net names."""
+    c_start, c_end = _block(text, "components")
+    n_start, n_end = _block(text, "nets")
+    comps = text[c_start + len("(components"):c_end - 1]
+    nets = text[n_start + len("(nets"):n_end - 1]
+    codes = max((int(c) for c in _CODE_RE.findall(nets)), default=0)
+
+    comp_parts, net_parts = [], []
+    for c in range(copies):
+        if c == 0:
+            comp_parts.append(comps)
+            net_parts.append(nets)
+            continue
+        suffix = f"_{c}"
+        comp_parts.append(_REF_RE.sub(lambda m: f'(ref "{m.group(1)}{suffix}")', comps))
+        renamed = _REF_RE.sub(lambda m: f'(ref "{m.group(1)}{suffix}")', nets)
+        renamed = _NAME_RE.sub(lambda m: f'(name "{m.group(1)}{suffix}")', renamed)
+        renamed = _CODE_RE.sub(lambda m: f'(code "{int(m.group(1)) + c * codes}")', renamed)
+        net_parts.append(renamed)
+    return (text[:c_start] + "(components" + "".join(comp_parts) + ")"
+            + text[c_end:n_start] + "(nets" + "".join(net_parts) + ")" + text[n_end:])
+
+
+_SECTION_RE = re.compile(r"\((\w+)\)")
+
+
+def scale_validation(text, copies):
+    """The validation file repeated with the same renaming as scale_netlist."""
+    parts = [text if text.endswith("\n") else text + "\n"]
+    lines = parts[0].splitlines()
+    for c in range(1, copies):
+        suffix = f"_{c}"
+
+        def rename(token):
+            if token.isdecimal() or token == "NC":
+                return token
+            ref, slash, pin = token.partition("/")
+            return f"{ref}{suffix}{slash}{pin}"
+
+        out = [f"# COPY {c}"]
+        for line in lines:
+            stripped = line.strip()
+            section = _SECTION_RE.fullmatch(stripped)
+            tokens = stripped.split()
+            if section:
+                out.append(f"({section.group(1)}{suffix})")
+            elif len(tokens) == 2 and not stripped.startswith("#"):
+                out.append(" ".join(rename(t) for t in tokens))
+            else:
+                out.append(line)
+        parts.append("\n".join(out) + "\n")
+    return "".join(parts)
+
+
+# Pad shapes by footprint family: (shape of pin 1, shape of the others, size, drill)
+_PAD_STYLES = (
+    ("rect", "oval", "1.6 1.6", "0.8"),
+    ("circle", "circle", "1.6 1.6", "0.8"),
+    ("rect", "circle", "1.7 1.7", "1.0"),
+    ("oval", "oval", "1.6 2.4", "oval 0.8 1.6"),
+    ("roundrect", "roundrect", "2 2", "1.2"),
+)
+_VIA_STYLES = (("0.8", "0.4"), ("0.6", "0.3"), ("1.0", "0.5"))
+
+
+def _quote(s):
+    return '"' + s.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def synthetic_board(net_path, seed=0):
+    """A .kicad_pcb text with the components and nets of a netlist file."""
+    rng = random.Random(seed)
+    comps = {}
+    with open(net_path, "r", encoding="utf-8") as f:
+        for comp in sexpr.iter_nodes(sexpr.iter_file_tokens(f), ("export", "components", "comp")):
+            comps[read_nets._field(comp, "ref")] = (read_nets._field(comp, "value"),
+                                                    read_nets._field(comp, "footprint"))
+    names = [""]
+    pins = {}                                   # ref -> [(pin, net code)]
+    for name, _code, _class, nodes in read_nets.iter_netlist(net_path):
+        names.append(name)
+        for ref, pin, _function, _type in nodes:
+            pins.setdefault(ref, []).append((pin, len(names) - 1))
+
+    out = ["(kicad_pcb\n\t(version 20241229)\n\t(generator \"benchmark\")\n"]
+    out += [f"\t(net {code} {_quote(name)})\n" for code, name in enumerate(names)]
+    positions = {}                              # net code -> pad positions
+    cols = 60
+    for i, ref in enumerate(sorted(comps, key=output_bom.natural_key)):
+        value, footprint = comps[ref]
+        x0, y0 = (i % cols) * 25.4, (i // cols) * 25.4
+        first, other, size, drill = _PAD_STYLES[zlib.crc32(footprint.encode()) % len(_PAD_STYLES)]
+        out.append(f"\t(footprint {_quote(footprint or 'Benchmark:Unknown')}\n"
+                   f"\t\t(layer \"F.Cu\")\n\t\t(uuid \"{i:08x}-0000-4000-8000-000000000000\")\n"
+                   f"\t\t(at {x0:.2f} {y0:.2f})\n"
+                   f"\t\t(property \"Reference\" {_quote(ref)}\n\t\t\t(at 0 -2 0)\n\t\t)\n"
+                   f"\t\t(property \"Value\" {_quote(value)}\n\t\t\t(at 0 2 0)\n\t\t)\n"
+                   f"\t\t(attr through_hole)\n")
+        for k, (pin, code) in enumerate(sorted(set(pins.get(ref, ())), key=lambda p: output_bom.natural_key(p[0]))):
+            px, py = (k % 20) * 2.54, (k // 20) * 7.62
+            positions.setdefault(code, []).append((x0 + px, y0 + py))
+            out.append(f"\t\t(pad {_quote(pin)} thru_hole {first if k == 0 else other}\n"
+                       f"\t\t\t(at {px:.2f} {py:.2f})\n\t\t\t(size {size})\n\t\t\t(drill {drill})\n"
+                       f"\t\t\t(layers \"*.Cu\" \"*.Mask\")\n\t\t\t(net {code} {_quote(names[code])})\n"
+                       f"\t\t\t(uuid \"{i:08x}-0000-4000-8000-{k + 1:012x}\")\n\t\t)\n")
+        out.append("\t)\n")
+
+    n = 0
+    for code, points in positions.items():
+        for (x1, y1), (x2, y2) in zip(points, points[1:]):
+            n += 1
+            layer = "F.Cu" if n % 2 else "B.Cu"
+            out.append(f"\t(segment\n\t\t(start {x1:.2f} {y1:.2f})\n\t\t(end {x2:.2f} {y2:.2f})\n"
+                       f"\t\t(width 0.25)\n\t\t(layer \"{layer}\")\n\t\t(net {code})\n"
+                       f"\t\t(uuid \"ffffffff-0000-4000-8000-{n:012x}\")\n\t)\n")
+        if len(points) > 1:
+            n += 1
+            size, drill = _VIA_STYLES[rng.randrange(len(_VIA_STYLES))]
+            x, y = points[0]
+            out.append(f"\t(via\n\t\t(at {x + 1.27:.2f} {y + 1.27:.2f})\n\t\t(size {size})\n"
+                       f"\t\t(drill {drill})\n\t\t(layers \"F.Cu\" \"B.Cu\")\n\t\t(net {code})\n"
+                       f"\t\t(uuid \"ffffffff-0000-4000-8000-{n:012x}\")\n\t)\n")
+    out.append(")\n")
+    return "".join(out)
+
+
+class Inputs(NamedTuple):
+    scale: int
+    pcb: str
+    net: str
+    vld: str
+
+
+def _digest(*paths):
+    h = hashlib.sha256(str(GENERATOR_VERSION).encode())
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def generate(workdir, scale, net_template, vld_template):
+    """Write (or reuse) the inputs for one scale in workdir."""
+    base = os.path.join(workdir, f"x{scale}")
+    inputs = Inputs(scale, f"{base}.kicad_pcb", f"{base}.net", f"{base}.txt")
+    stamp = f"{base}.stamp"
+    digest = _digest(net_template, vld_template)
+    try:
+        with open(stamp, "r", encoding="utf-8") as f:
+            if f.read() == digest and all(os.path.exists(p) for p in inputs[1:]):
+                return inputs
+    except OSError:
+        pass
+
+    with open(net_template, "r", encoding="utf-8") as f:
+        net_text = scale_netlist(f.read(), scale)
+    with open(inputs.net, "w", encoding="utf-8") as f:
+        f.write(net_text)
+    with open(vld_template, "r", encoding="utf-8") as f:
+        vld_text = scale_validation(f.read(), scale)
+    with open(inputs.vld, "w", encoding="utf-8") as f:
+        f.write(vld_text)
+    with open(inputs.pcb, "w", encoding="utf-8") as f:
+        f.write(synthetic_board(inputs.net))
+    with open(stamp, "w", encoding="utf-8") as f:
+        f.write(digest)
+    return inputs
+
+
+# ---------- Stages ----------
+
+class Stage(NamedTuple):
+    name: str
+    input: str                          # 'pcb', 'net' or 'vld': the file whose size counts
+    prepare: Callable                   # Inputs -> args, not timed
+    run: Callable                       # *args -> result
+
+
+def _read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def _prepare_matching(inputs):
+    sch_nets = read_nets.process_kicad_file(inputs.net)
+    return sch_nets, read_nets.edges_to_nets(read_nets.compile_validation(_read(inputs.vld)))
+
+
+def _prepare_edges(inputs):
+    return (read_nets.compile_validation(_read(inputs.vld)),)
+
+
+def _remove_nets(func, pcb):
+    out = f"{pcb}.out"
+    try:
+        return func(pcb, out)
+    finally:
+        if os.path.exists(out):
+            os.unlink(out)
+
+
+def _bom(text):
+    return output_bom.collect_parts(map(output_bom.footprint_record, output_bom.iter_footprints(text)))
+
+
+STAGES = (
+    Stage("check_pads.read", "pcb", lambda i: (i.pcb,), _read),
+    Stage("check_pads.scan_file", "pcb", lambda i: (_read(i.pcb),), check_pads.scan_file),
+    Stage("output_bom.extract_footprints", "pcb", lambda i: (_read(i.pcb),),
+          lambda text: sum(1 for _ in output_bom.extract_footprints(text))),
+    Stage("output_bom.collect_parts", "pcb", lambda i: (_read(i.pcb),), _bom),
+    Stage("remove_nets.remove_nets_from_kicad_pcb", "pcb", lambda i: (remove_nets.remove_nets_from_kicad_pcb, i.pcb),
+          _remove_nets),
+    Stage("remove_nets.remove_nets_mapped", "pcb", lambda i: (remove_nets.remove_nets_mapped, i.pcb),
+          _remove_nets),
+    Stage("read_nets.process_kicad_file", "net", lambda i: (i.net,), read_nets.process_kicad_file),
+    Stage("read_nets.compile_validation", "vld", lambda i: (_read(i.vld),), read_nets.compile_validation),
+    Stage("read_nets.edges_to_nets", "vld", _prepare_edges, read_nets.edges_to_nets),
+    Stage("read_nets.find_best_matches", "vld", _prepare_matching, read_nets.find_best_matches),
+)
+
+
+def _quiet(func, *args):
+    # The tools print their results; keep that out of the benchmark output
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+
+def run_stage(stage, inputs, repeat, memory=True):
+    """Timings (seconds per run) and peak traced memory (bytes) of one stage."""
+    args = stage.prepare(inputs)
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        _quiet(stage.run, *args)
+        times.append(time.perf_counter() - t0)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            _quiet(stage.run, *args)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return times, peak
+
+
+# ---------- Results ----------
+
+def _commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def result_key(result) -> Tuple[str, int]:
+    return result["stage"], result["scale"]
+
+
+def compare(base, current, tolerance):
+    """Print run times against a previous results file; return the regressions."""
+    before = {result_key(r): r for r in base["results"]}
+    regressions = []
+    print(f"\n{'stage':45} {'scale':>5} {'base s':>9} {'now s':>9} {'ratio':>6}")
+    for r in current["results"]:
+        old = before.get(result_key(r))
+        if old is None or not old["seconds"]:
+            continue
+        ratio = r["seconds"] / old["seconds"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append(r)
+            flag = "  SLOWER"
+        print(f"{r['stage']:45} {r['scale']:>5} {old['seconds']:9.4f} {r['seconds']:9.4f} {ratio:6.2f}{flag}")
+    return regressions
+
+
+# ---------- Main ----------
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark the board, BOM and netlist tools on scaled synthetic inputs.")
+    ap.add_argument("--scales", default="1,10,100", help="Comma-separated size multiples (default: 1,10,100)")
+    ap.add_argument("--repeat", type=int, default=3, help="Timed runs per stage (default: 3)")
+    ap.add_argument("--stages", help="Only stages whose name contains one of these comma-separated words")
+    ap.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run of each stage")
+    ap.add_argument("--workdir", help="Keep generated inputs here (default: a temporary directory)")
+    ap.add_argument("--net", default=str(HERE / "gdp.net"), help="Netlist template")
+    ap.add_argument("--vld", default=str(HERE / "gdp_validacija.txt"), help="Validation file template")
+    ap.add_argument("--out", help="Write the results as JSON to this path")
+    ap.add_argument("--compare", help="Results JSON of an earlier run to compare with")
+    ap.add_argument("--tolerance", type=float, default=0.2,
+                    help="With --compare, exit 1 if a stage is slower by more than this fraction (default: 0.2)")
+    args = ap.parse_args()
+
+    scales = [int(s) for s in args.scales.split(",") if s.strip()]
+    stages = STAGES
+    if args.stages:
+        words = [w.strip() for w in args.stages.split(",") if w.strip()]
+        stages = [s for s in STAGES if any(w in s.name for w in words)]
+    workdir = args.workdir or tempfile.mkdtemp(prefix="gdp-benchmark-")
+    os.makedirs(workdir, exist_ok=True)
+
+    results, sizes = [], {}
+    try:
+        for scale in scales:
+            t0 = time.perf_counter()
+            inputs = generate(workdir, scale, args.net, args.vld)
+            sizes[scale] = {kind: os.path.getsize(getattr(inputs, kind)) for kind in ("pcb", "net", "vld")}
+            print(f"x{scale}: board {sizes[scale]['pcb'] / 1e6:.1f} MB, netlist {sizes[scale]['net'] / 1e6:.1f} MB, "
+                  f"validation {sizes[scale]['vld'] / 1e6:.1f} MB  [inputs ready in {time.perf_counter() - t0:.1f} s]")
+            for stage in stages:
+                times, peak = run_stage(stage, inputs, args.repeat, not args.no_memory)
+                best = min(times)
+                size = sizes[scale][stage.input]
+                results.append({
+                    "stage": stage.name, "scale": scale, "input_bytes": size,
+                    "seconds": best, "median_seconds": statistics.median(times), "runs": times,
+                    "mb_per_s": size / best / 1e6 if best else None, "peak_bytes": peak,
+                })
+                mem = f"{peak / 1e6:8.1f} MB" if peak is not None else ""
+                print(f"  {stage.name:45} {best * 1000:10.1f} ms  {size / best / 1e6 if best else 0:8.1f} MB/s  {mem}")
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "version": RESULTS_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "inputs": {str(k): v for k, v in sizes.items()},
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+            f.write("\n")
+        print(f"\nResults written to: {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        regressions = compare(base, report, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than {args.compare} by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+diff_nets.py
+
+Compare one or more netlists against a reference netlist in a single
+vectorized pass per netlist, using NumPy.
+
+All nets are encoded as a sparse pin-by-net incidence (COO pairs of pin id
+and net id over a shared PinTable). The shared-pin counts for every pair of
+nets are the sparse product of the two incidences; the Jaccard score and the
+best match per net follow from those counts without a per-net loop.
+
+The report has the same format as find_best_matches in read_nets.py.
+
+Inputs can be KiCad netlist exports (.net) or hand-transcribed validation
+files (.txt, the gdp_validacija.txt format). Validation files get the same
+corrections as in read_nets.py (fix_validation: swapped parts swapped back,
+removed parts dropped).
+
+Usage:
+  python diff_nets.py gdp.net rev2.net rev3.net
+  python diff_nets.py gdp.net gdp_validacija.txt --all
+"""
+
+import argparse
+
+import numpy as np
+
+from read_nets import (fix_validation, format_match, load_cached, load_validation, print_unmatched,
+                       process_kicad_file)
+
+
+class PinTable:
+    """Interns 'REF/pin' names to small integers, the rows of the incidence arrays."""
+
+    def __init__(self):
+        self._pin_ids = {}      # "IC14/10" -> pin id
+
+    def pin_id(self, name: str) -> int:
+        return self._pin_ids.setdefault(name, len(self._pin_ids))
+
+
+def load_nets(path, use_cache=True):
+    """Return (names or None, list of pin sets) for a .net or validation .txt file."""
+    if path.endswith(".txt"):
+        return None, fix_validation(load_validation(path, use_cache))
+    nets = load_cached(process_kicad_file, path, use_cache)
+    return list(nets), list(nets.values())
+
+
+def incidence(table: PinTable, nets: list[set]):
+    """Return (pin ids, net ids, net sizes) arrays for a list of pin sets."""
+    pins = []
+    owners = []
+    for n, net in enumerate(nets):
+        for name in net:
+            pins.append(table.pin_id(name))
+            owners.append(n)
+    sizes = np.array([len(net) for net in nets], dtype=np.int64)
+    return np.array(pins, dtype=np.int64), np.array(owners, dtype=np.int64), sizes
+
+
+def best_matches(ref, other):
+    """
+    For every net of `other`, find the `ref` net with the highest Jaccard score.
+    Both arguments are incidence() triples. Ties go to the lowest ref net id,
+    like the first-wins scan in find_best_matches.
+    Returns (best ref net id or -1, score) arrays indexed by `other` net id.
+    """
+    ref_pins, ref_nets, ref_sizes = ref
+    pins, nets, sizes = other
+    best = np.full(len(sizes), -1, dtype=np.int64)
+    best_score = np.zeros(len(sizes))
+    if not len(pins) or not len(ref_pins):
+        return best, best_score
+
+    # Sparse product: join both incidences on pin id
+    order = np.argsort(ref_pins, kind="stable")
+    ref_pins, ref_nets = ref_pins[order], ref_nets[order]
+    lo = np.searchsorted(ref_pins, pins, side="left")
+    hi = np.searchsorted(ref_pins, pins, side="right")
+    counts = hi - lo
+    total = int(counts.sum())
+    if not total:
+        return best, best_score
+    starts = np.repeat(lo, counts)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    b = np.repeat(nets, counts)
+    a = ref_nets[starts + offsets]
+
+    # Shared pins per (other net, ref net) pair
+    n_ref = len(ref_sizes)
+    keys, shared = np.unique(b * n_ref + a, return_counts=True)
+    b, a = keys // n_ref, keys % n_ref
+    score = shared / (sizes[b] + ref_sizes[a] - shared)
+
+    # Best score per other net, lowest ref net id on ties
+    order = np.lexsort((a, -score, b))
+    b, a, score = b[order], a[order], score[order]
+    first = np.ones(len(b), dtype=bool)
+    first[1:] = b[1:] != b[:-1]
+    best[b[first]] = a[first]
+    best_score[b[first]] = score[first]
+    return best, best_score
+
+
+def diff_report(ref_names, ref_nets, nets, best, best_score):
+    """Format results like find_best_matches and print the unmatched ref nets."""
+    sch_nets = dict(zip(ref_names, ref_nets))
+    results = []
+    matched = set()
+    for i, net in enumerate(nets):
+        j = best[i]
+        name = ref_names[j] if j >= 0 else None
+        matched.add(name)
+        results.append(format_match(i, net, name, float(best_score[i]), ref_nets[j] if j >= 0 else set()))
+    print_unmatched(sch_nets, matched)
+    return results
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare netlists against a reference netlist.")
+    ap.add_argument("reference", help="Reference KiCad netlist (.net)")
+    ap.add_argument("netlists", nargs="+", help="Netlists (.net) or validation files (.txt) to compare")
+    ap.add_argument("--all", action="store_true", help="Also print perfect matches")
+    ap.add_argument("--no-cache", action="store_true", help="Re-parse inputs instead of using .cache files")
+    args = ap.parse_args()
+
+    table = PinTable()
+    ref_names, ref_nets = load_nets(args.reference, not args.no_cache)
+    if ref_names is None:
+        ap.error("the reference must be a KiCad netlist (.net)")
+    ref = incidence(table, ref_nets)
+
+    for path in args.netlists:
+        _, nets = load_nets(path, not args.no_cache)
+        best, best_score = best_matches(ref, incidence(table, nets))
+
+        print(f"=== {path} vs {args.reference} ===")
+        results = diff_report(ref_names, ref_nets, nets, best, best_score)
+        for r in results:
+            if args.all or "Only in" in r:
+                print(r)
+        perfect = int(np.count_nonzero(best_score == 1.0))
+        print(f"{perfect} of {len(nets)} nets match perfectly\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+gerber_nets.py
+
+Rebuild the electrical connectivity of the fabricated artwork from the copper
+Gerbers and the plated drill file, and compare it with the schematic netlist.
+
+Every copper object becomes a capsule (a segment with a radius: flashes are
+zero-length capsules, draws keep their aperture radius, arcs are split into
+chords) or, for G36/G37 regions, a polygon given by its edges. Plated holes
+are capsules repeated on every copper layer, which links the layers.
+
+Candidate pairs come from a uniform grid over each layer; only objects
+sharing a grid cell are tested, with vectorized segment distances. Objects
+lying inside a region without touching its outline are found by ray casting
+against the region edges of the same grid row; the first vertex of each
+region is tested the same way, and regions whose outlines touch or cross are
+found from edge pairs sharing a cell. The pairs are merged into connected
+components.
+
+The Gerbers written for this board carry no net attributes, so pads are
+named from the .kicad_pcb: every pad centre is matched to a flash there.
+The result is a list of 'REF/pin' sets, as find_best_matches in read_nets.py
+consumes them.
+
+Approximations: rectangular and obround apertures are taken as the capsule
+along their long side, aperture macros as points; clear (LPC) objects are
+ignored.
+
+Usage:
+  python gerber_nets.py ../gdp/gerber --pcb ../gdp/gdp.kicad_pcb --net gdp.net
+  python gerber_nets.py F_Cu.gbr B_Cu.gbr PTH.drl --pcb board.kicad_pcb
+"""
+
+import argparse
+import glob
+import math
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "gdp"))
+import drill_stats  # noqa: E402
+import read_gerber  # noqa: E402
+import sexpr  # noqa: E402
+from read_nets import find_best_matches, load_cached, process_kicad_file  # noqa: E402
+
+# Objects closer than this (mm) are taken as touching
+EPS = 1e-4
+
+# ---------- Primitives ----------
+
+def _aperture_capsule(ap):
+    """(half length, radius, long side along x) of an aperture."""
+    if ap is None or not ap.params:
+        return 0.0, 0.0, True
+    if ap.shape in ("R", "O") and len(ap.params) >= 2:
+        w, h = ap.params[:2]
+        return abs(w - h) / 2, min(w, h) / 2, w >= h
+    return 0.0, ap.params[0] / 2, True     # circle, polygon (outer diameter)
+
+def _arc_chords(draws, center, mode):
+    """Split arcs into chords of at most 22.5 degrees; returns (k, 4) segments."""
+    out = []
+    for (x1, y1, x2, y2), (cx, cy), m in zip(draws, center, mode):
+        a1 = math.atan2(y1 - cy, x1 - cx)
+        a2 = math.atan2(y2 - cy, x2 - cx)
+        sweep = a2 - a1
+        if m == read_gerber.CCW and sweep <= 0:
+            sweep += 2 * math.pi
+        elif m == read_gerber.CW and sweep >= 0:
+            sweep -= 2 * math.pi
+        n = max(1, math.ceil(abs(sweep) / (math.pi / 8)))
+        r = math.hypot(x1 - cx, y1 - cy)
+        t = a1 + sweep * np.arange(n + 1) / n
+        px, py = cx + r * np.cos(t), cy + r * np.sin(t)
+        px[0], py[0], px[-1], py[-1] = x1, y1, x2, y2
+        out.append(np.column_stack((px[:-1], py[:-1], px[1:], py[1:])))
+    return np.concatenate(out) if out else np.zeros((0, 4))
+
+def layer_primitives(layer):
+    """
+    Capsules (k, 5: x1 y1 x2 y2 r) and region edges (e, 4) with the index of
+    their contour (e,) for the dark objects of one layer.
+    """
+    caps = []
+    flashes = layer.flashes[layer.flash_dark]
+    codes = layer.flash_aperture[layer.flash_dark]
+    for code in np.unique(codes):
+        half, r, along_x = _aperture_capsule(layer.apertures.get(int(code)))
+        xy = flashes[codes == code]
+        dx, dy = (half, 0.0) if along_x else (0.0, half)
+        caps.append(np.column_stack((xy[:, 0] - dx, xy[:, 1] - dy, xy[:, 0] + dx, xy[:, 1] + dy,
+                                     np.full(len(xy), r))))
+
+    dark = layer.draw_dark
+    lines = dark & (layer.draw_mode == read_gerber.LINEAR)
+    arcs = dark & ~lines
+    for code in np.unique(layer.draw_aperture[dark]):
+        r = _aperture_capsule(layer.apertures.get(int(code)))[1]
+        sel = layer.draw_aperture == code
+        segs = [layer.draws[lines & sel],
+                _arc_chords(layer.draws[arcs & sel], layer.draw_center[arcs & sel], layer.draw_mode[arcs & sel])]
+        for seg in segs:
+            caps.append(np.column_stack((seg, np.full(len(seg), r))))
+    caps = np.concatenate(caps) if caps else np.zeros((0, 5))
+
+    # Region outlines: each contour is closed back to its first vertex
+    v, off = layer.regions, layer.region_offsets
+    keep = np.flatnonzero(layer.region_dark)
+    edges, owner = [], []
+    for k in keep:
+        pts = v[off[k]:off[k + 1]]
+        if len(pts) < 3:
+            continue
+        edges.append(np.hstack((pts, np.roll(pts, -1, axis=0))))
+        owner.append(np.full(len(pts), len(owner)))
+    if edges:
+        return caps, np.concatenate(edges), np.concatenate(owner)
+    return caps, np.zeros((0, 4)), np.zeros(0, dtype=np.int64)
+
+# ---------- Geometry ----------
+
+def _point_segment(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    den = dx * dx + dy * dy
+    t = np.where(den > 0, ((px - x1) * dx + (py - y1) * dy) / np.where(den > 0, den, 1), 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+def segment_distance(a, b):
+    """Distances between the segments a[i] and b[i] (rows of x1 y1 x2 y2)."""
+    ax1, ay1, ax2, ay2 = a.T
+    bx1, by1, bx2, by2 = b.T
+    d = np.minimum.reduce([
+        _point_segment(ax1, ay1, bx1, by1, bx2, by2),
+        _point_segment(ax2, ay2, bx1, by1, bx2, by2),
+        _point_segment(bx1, by1, ax1, ay1, ax2, ay2),
+        _point_segment(bx2, by2, ax1, ay1, ax2, ay2),
+    ])
+    d1 = (bx2 - bx1) * (ay1 - by1) - (by2 - by1) * (ax1 - bx1)
+    d2 = (bx2 - bx1) * (ay2 - by1) - (by2 - by1) * (ax2 - bx1)
+    d3 = (ax2 - ax1) * (by1 - ay1) - (ay2 - ay1) * (bx1 - ax1)
+    d4 = (ax2 - ax1) * (by2 - ay1) - (ay2 - ay1) * (bx2 - ax1)
+    d[(d1 * d2 < 0) & (d3 * d4 < 0)] = 0.0
+    return d
+
+# ---------- Grid index ----------
+
+def _cells(boxes, cell):
+    """(item, cell key) for every grid cell each box (x0 y0 x1 y1) covers."""
+    lo = np.floor(boxes[:, :2] / cell).astype(np.int64)
+    hi = np.floor(boxes[:, 2:] / cell).astype(np.int64)
+    nx = hi[:, 0] - lo[:, 0] + 1
+    count = nx * (hi[:, 1] - lo[:, 1] + 1)
+    item = np.repeat(np.arange(len(boxes)), count)
+    k = np.arange(len(item)) - np.repeat(np.cumsum(count) - count, count)
+    cx = lo[item, 0] + k % nx[item]
+    cy = lo[item, 1] + k // nx[item]
+    return item, (cy << 32) + cx
+
+def grid_pairs(boxes, first, cell, group=None):
+    """
+    Pairs (i, j) of boxes sharing a grid cell, where i is one of the first
+    `first` boxes and j is any later box. Each pair is reported once. With
+    `group` (a label per box), only boxes of different groups are paired.
+    """
+    if not len(boxes) or not first:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    item, key = _cells(boxes, cell)
+    order = np.lexsort((item, key))
+    item, key = item[order], key[order]
+    new = np.ones(len(key), dtype=bool)
+    new[1:] = key[1:] != key[:-1]
+    if group is not None:
+        # Drop the cells holding a single group before pairing their boxes
+        start = np.flatnonzero(new)
+        label = group[item]
+        mixed = np.minimum.reduceat(label, start) != np.maximum.reduceat(label, start)
+        keep = mixed[np.cumsum(new) - 1]
+        item, key = item[keep], key[keep]
+        new = new[keep]
+    group_end = np.append(np.flatnonzero(new)[1:], len(key))[np.cumsum(new) - 1]
+    # Within a cell, items of the first kind pair with every later item
+    left = np.flatnonzero(item < first)
+    count = group_end[left] - left - 1
+    i = np.repeat(left, count)
+    j = i + 1 + np.arange(len(i)) - np.repeat(np.cumsum(count) - count, count)
+    i, j = item[i], item[j]
+    if group is not None:
+        other = group[i] != group[j]
+        i, j = i[other], j[other]
+    pairs = np.unique(np.minimum(i, j) * len(boxes) + np.maximum(i, j))
+    return pairs // len(boxes), pairs % len(boxes)
+
+def points_in_polygons(points, edges, owner, cell):
+    """
+    (point, contour) pairs for points lying inside a contour (even-odd rule),
+    found by casting a ray towards +x through the edges of the same grid row.
+    """
+    if not len(points) or not len(edges):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    ey0 = np.minimum(edges[:, 1], edges[:, 3])
+    ey1 = np.maximum(edges[:, 1], edges[:, 3])
+    lo = np.floor(ey0 / cell).astype(np.int64)
+    n = np.floor(ey1 / cell).astype(np.int64) - lo + 1
+    e = np.repeat(np.arange(len(edges)), n)
+    row = lo[e] + np.arange(len(e)) - np.repeat(np.cumsum(n) - n, n)
+    order = np.argsort(row, kind="stable")
+    e, row = e[order], row[order]
+
+    prow = np.floor(points[:, 1] / cell).astype(np.int64)
+    start = np.searchsorted(row, prow, side="left")
+    count = np.searchsorted(row, prow, side="right") - start
+    p = np.repeat(np.arange(len(points)), count)
+    e = e[np.repeat(start, count) + np.arange(len(p)) - np.repeat(np.cumsum(count) - count, count)]
+
+    px, py = points[p, 0], points[p, 1]
+    x1, y1, x2, y2 = edges[e].T
+    spans = (y1 > py) != (y2 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xc = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    hit = spans & (xc > px)
+    keys, crossings = np.unique(p[hit] * (owner.max() + 1) + owner[e[hit]], return_counts=True)
+    inside = keys[crossings % 2 == 1]
+    return inside // (owner.max() + 1), inside % (owner.max() + 1)
+
+# ---------- Connectivity ----------
+
+def components(n, a, b):
+    """Connected component label (smallest member id) of n items linked by pairs (a, b)."""
+    label = np.arange(n)
+    while len(a):
+        la, lb = label[a], label[b]
+        if np.array_equal(la, lb):
+            break
+        low = np.minimum(la, lb)
+        np.minimum.at(label, la, low)
+        np.minimum.at(label, lb, low)
+        while True:
+            nxt = label[label]
+            if np.array_equal(nxt, label):
+                break
+            label = nxt
+    return label
+
+def _layer_links(caps, edges, owner, cell):
+    """Touching pairs within one layer: ids are capsules first, then contours."""
+    ncap = len(caps)
+    r = caps[:, 4:5]
+    boxes = np.vstack((
+        np.hstack((np.minimum(caps[:, 0:2], caps[:, 2:4]) - r, np.maximum(caps[:, 0:2], caps[:, 2:4]) + r)),
+        np.hstack((np.minimum(edges[:, 0:2], edges[:, 2:4]), np.maximum(edges[:, 0:2], edges[:, 2:4]))),
+    )) + np.array([-EPS, -EPS, EPS, EPS])
+    i, j = grid_pairs(boxes, ncap, cell)
+
+    # Capsule-capsule and capsule-edge contacts; edges have radius 0
+    segs = np.vstack((caps[:, :4], edges))
+    radius = np.concatenate((caps[:, 4], np.zeros(len(edges))))
+    touch = segment_distance(segs[i], segs[j]) <= radius[i] + radius[j] + EPS
+    i, j = i[touch], j[touch]
+    edge = j >= ncap
+    j[edge] = ncap + owner[j[edge] - ncap]
+    links = [(i, j)]
+
+    if len(edges):
+        # Capsules lying inside a region without touching its outline
+        p, c = points_in_polygons(caps[:, :2], edges, owner, cell)
+        links.append((p, ncap + c))
+        # Regions whose outlines touch or cross
+        e, f = grid_pairs(boxes[ncap:], len(edges), cell, owner)
+        touch = segment_distance(edges[e], edges[f]) <= EPS
+        links.append((ncap + owner[e[touch]], ncap + owner[f[touch]]))
+        # Regions lying wholly inside other regions
+        first = np.unique(owner, return_index=True)[1]
+        p, c = points_in_polygons(edges[first, :2], edges, owner, cell)
+        links.append((ncap + owner[first][p], ncap + c))
+    return np.concatenate([l[0] for l in links]), np.concatenate([l[1] for l in links])
+
+class Copper:
+    """Connectivity of a set of copper layers and plated holes."""
+
+    def __init__(self, layers, holes, cell=1.0):
+        self.flashes = []               # per layer: (k, 2) flash centres and their ids
+        a_all, b_all = [], []
+        base = 0
+        hole_ids = []
+        for layer in layers:
+            caps, edges, owner = layer_primitives(layer)
+            caps = np.vstack((caps, holes))
+            ncontour = int(owner.max()) + 1 if len(owner) else 0
+            a, b = _layer_links(caps, edges, owner, cell)
+            a_all.append(a + base)
+            b_all.append(b + base)
+            nflash = int(layer.flash_dark.sum())
+            self.flashes.append((caps[:nflash, :2] + caps[:nflash, 2:4]) / 2)
+            self.flashes[-1] = (self.flashes[-1], base + np.arange(nflash))
+            hole_ids.append(base + len(caps) - len(holes) + np.arange(len(holes)))
+            base += len(caps) + ncontour
+        # A plated hole joins its copies on every layer
+        for ids in hole_ids[1:]:
+            a_all.append(hole_ids[0])
+            b_all.append(ids)
+        a = np.concatenate(a_all) if a_all else np.zeros(0, dtype=np.int64)
+        b = np.concatenate(b_all) if b_all else np.zeros(0, dtype=np.int64)
+        self.label = components(base, a.astype(np.int64), b.astype(np.int64))
+
+    def net_at(self, x, y, tol=0.01):
+        """Component label of the flash centred at (x, y) on any layer, or None."""
+        for centres, ids in self.flashes:
+            if not len(centres):
+                continue
+            d = np.abs(centres[:, 0] - x) + np.abs(centres[:, 1] - y)
+            k = int(np.argmin(d))
+            if d[k] <= tol:
+                return int(self.label[ids[k]])
+        return None
+
+def plated_holes(paths):
+    """Zero-length capsules (k, 5) of the plated holes and slots in drill files."""
+    caps = []
+    for path in paths:
+        drill = drill_stats.parse_drill(path)
+        if drill.plated is False:
+            continue
+        for t, xy in drill.hits.items():
+            r = drill.tools.get(t, 0.0) / 2
+            caps.append(np.column_stack((xy, xy, np.full(len(xy), r))))
+        for t, seg in drill.slots.items():
+            caps.append(np.column_stack((seg, np.full(len(seg), drill.tools.get(t, 0.0) / 2))))
+    return np.concatenate(caps) if caps else np.zeros((0, 5))
+
+# ---------- Pads ----------
+
+def pad_positions(pcb_path):
+    """Yield ('REF/pin', x, y) for every named copper pad, in Gerber coordinates (y up)."""
+    with sexpr.map_file(pcb_path) as buf:
+        for _, start, end in sexpr.find_blocks(buf, ("footprint", "module")):
+            node = sexpr.parse(buf[start:end].decode("utf-8"))
+            at = sexpr.find(node, "at") or ["at", "0", "0"]
+            fx, fy = float(at[1]), float(at[2])
+            angle = math.radians(float(at[3])) if len(at) > 3 else 0.0
+            ref = ""
+            for prop in sexpr.find_all(node, "property"):
+                if len(prop) > 2 and prop[1] == "Reference":
+                    ref = prop[2]
+            for text in sexpr.find_all(node, "fp_text"):
+                if len(text) > 2 and text[1] == "reference":
+                    ref = text[2]
+            c, s = math.cos(angle), math.sin(angle)
+            for pad in sexpr.find_all(node, "pad"):
+                if len(pad) < 3 or not pad[1] or pad[2] == "np_thru_hole":
+                    continue
+                pat = sexpr.find(pad, "at") or ["at", "0", "0"]
+                px, py = float(pat[1]), float(pat[2])
+                # KiCad rotates counter-clockwise on screen, with y pointing down
+                x = fx + px * c + py * s
+                y = fy - px * s + py * c
+                yield f"{ref}/{pad[1]}", x, -y
+
+def copper_nets(copper, pads):
+    """Group pad names by the copper component under them; returns (nets, unplaced pads)."""
+    groups = {}
+    missing = []
+    for name, x, y in pads:
+        label = copper.net_at(x, y)
+        if label is None:
+            missing.append(name)
+        else:
+            groups.setdefault(label, set()).add(name)
+    nets = sorted(groups.values(), key=lambda net: min(net))
+    return nets, missing
+
+# ---------- Main ----------
+
+def expand_inputs(specs):
+    """Directories contribute their *_Cu.gbr and *.drl files; other paths are kept."""
+    paths = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            paths.extend(sorted(glob.glob(os.path.join(spec, "*_Cu.gbr"))))
+            paths.extend(sorted(glob.glob(os.path.join(spec, "*.drl"))))
+        else:
+            paths.append(spec)
+    return list(dict.fromkeys(paths))
+
+def main():
+    ap = argparse.ArgumentParser(description="Extract nets from copper Gerbers and drill files.")
+    ap.add_argument("inputs", nargs="+", help="Copper .gbr and .drl files, or a directory holding them")
+    ap.add_argument("--pcb", required=True, help="Board file giving the pad positions and names")
+    ap.add_argument("--net", help="KiCad netlist (.net) to compare against")
+    ap.add_argument("--cell", type=float, default=1.0, help="Grid cell size in mm (default: 1)")
+    ap.add_argument("--no-cache", action="store_true", help="Re-parse the netlist instead of using its .cache file")
+    args = ap.parse_args()
+
+    paths = expand_inputs(args.inputs)
+    layers = [read_gerber.read_gerber(p) for p in paths if not p.endswith(".drl")]
+    holes = plated_holes([p for p in paths if p.endswith(".drl")])
+    if not layers:
+        ap.error("no copper layers given")
+
+    copper = Copper(layers, holes, args.cell)
+    nets, missing = copper_nets(copper, pad_positions(args.pcb))
+    print(f"{len(nets)} nets from {len(layers)} copper layers and {len(holes)} plated holes", file=sys.stderr)
+    if missing:
+        print(f"No flash found under {len(missing)} pads: {', '.join(sorted(missing))}", file=sys.stderr)
+
+    if not args.net:
+        for net in nets:
+            print(" ".join(sorted(net)))
+        return
+    sch_nets = load_cached(process_kicad_file, args.net, not args.no_cache)
+    for r in find_best_matches(sch_nets, nets):
+        if "Only in" in r:
+            print(r)
+
+if __name__ == "__main__":
+    main()
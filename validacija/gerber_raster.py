@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""
+gerber_raster.py
+
+Rasterize copper Gerber layers into bitmaps and compare them with a reference
+image of the board: a photo or scan such as ../doc/front.jpg and
+../doc/back_flipped.jpg, or the traced GND layer in gdp_gnd_kicad.psd.
+
+Copper is drawn from the same primitives as in gerber_nets.py: capsules for
+flashes and draws, polygons for G36/G37 regions (filled even-odd per
+contour). The bitmap is filled one tile, a band of --tile pixel rows, at a
+time. For every row of a tile, each capsule and each pair of region edge
+crossings covers one span of pixels; the spans of all objects are computed
+at once with NumPy and summed into the tile as +1/-1 steps, so memory grows
+with the board width and the tile height, not with the whole bitmap.
+
+The reference is registered with --point pairs, a board position in mm (as
+in the Gerbers) and the image pixel (column, row) showing it. Two pairs give
+a similarity transform of the board as seen from the front (y up on the
+board, down in the image); three or more an affine transform fitted by least
+squares, which also takes mirrored or skewed images. Each bitmap pixel
+samples the nearest reference pixel, which counts as copper above the
+threshold (Otsu's method unless --threshold is given; --invert for dark
+copper). The score is the share of the compared pixels where the two
+disagree; --heatmap writes that share per --cell, --diff the full image.
+
+Approximations: as in gerber_nets.py, rectangular and obround apertures are
+capsules along their long side and clear (LPC) objects are ignored.
+
+Bitmaps are written as PNG or .npy. References are read as PGM/PPM or .npy;
+other formats (JPEG, PNG, PSD) need Pillow.
+
+Usage:
+  python gerber_raster.py ../gdp/gerber/gdp-In1_Cu.gbr --dpi 600 --png in1.png
+  python gerber_raster.py ../gdp/gerber/gdp-B_Cu.gbr --dpi 1200 --ref ../doc/back_flipped.jpg \\
+      --point 12.7,-20.3,410,388 --point 190.5,-140.9,7035,4875 --point 12.7,-140.9,402,4880 \\
+      --heatmap heat.png --diff diff.png
+"""
+
+import argparse
+import math
+import struct
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "gdp"))
+import read_gerber  # noqa: E402
+from gerber_nets import layer_primitives  # noqa: E402
+
+MM_PER_INCH = 25.4
+
+# ---------- Raster ----------
+
+class Grid(NamedTuple):
+    """Pixel grid over the board: pixel (row, col) is centred at x0 + (col + 0.5) * pitch, y0 - (row + 0.5) * pitch."""
+    x0: float           # left edge, mm
+    y0: float           # top edge, mm
+    pitch: float        # mm per pixel
+    width: int
+    height: int
+
+    def columns(self):
+        return self.x0 + (np.arange(self.width) + 0.5) * self.pitch
+
+    def rows(self, start, stop):
+        return self.y0 - (np.arange(start, stop) + 0.5) * self.pitch
+
+class Copper(NamedTuple):
+    caps: np.ndarray    # (k, 5) x1 y1 x2 y2 r
+    edges: np.ndarray   # (e, 4) x1 y1 x2 y2
+    owner: np.ndarray   # (e,) contour of each edge
+
+def load_copper(paths) -> Copper:
+    """Primitives of the dark objects of one or more Gerber layers, merged."""
+    caps, edges, owner = [], [], []
+    contours = 0
+    for path in paths:
+        c, e, o = layer_primitives(read_gerber.read_gerber(path))
+        caps.append(c)
+        edges.append(e)
+        owner.append(o + contours)
+        contours += int(o.max()) + 1 if len(o) else 0
+    return Copper(np.concatenate(caps), np.concatenate(edges), np.concatenate(owner).astype(np.int64))
+
+def board_grid(copper, dpi, margin=1.0) -> Grid:
+    """Grid at dpi over the extent of the copper, widened by margin mm on every side."""
+    r = copper.caps[:, 4:5]
+    lo = np.vstack((np.minimum(copper.caps[:, 0:2], copper.caps[:, 2:4]) - r, copper.edges[:, 0:2], copper.edges[:, 2:4]))
+    hi = np.vstack((np.maximum(copper.caps[:, 0:2], copper.caps[:, 2:4]) + r, copper.edges[:, 0:2], copper.edges[:, 2:4]))
+    if not len(lo):
+        raise ValueError("no copper to rasterize")
+    (xmin, ymin), (xmax, ymax) = lo.min(axis=0) - margin, hi.max(axis=0) + margin
+    pitch = MM_PER_INCH / dpi
+    return Grid(float(xmin), float(ymax), pitch,
+                int(math.ceil((xmax - xmin) / pitch)), int(math.ceil((ymax - ymin) / pitch)))
+
+def _row_pairs(grid, start, stop, ylo, yhi):
+    """(object, row) for every tile row whose centre may lie in [ylo, yhi], one row of slack each way."""
+    first = np.floor((grid.y0 - yhi) / grid.pitch - 0.5).astype(np.int64) - 1
+    last = np.ceil((grid.y0 - ylo) / grid.pitch - 0.5).astype(np.int64) + 1
+    first = np.clip(first, start, stop)
+    n = np.maximum(np.clip(last + 1, start, stop) - first, 0)
+    obj = np.repeat(np.arange(len(n)), n)
+    row = first[obj] + np.arange(len(obj)) - np.repeat(np.cumsum(n) - n, n)
+    return obj, row
+
+def capsule_spans(caps, y):
+    """x extent [a, b] of capsule caps[i] on the line at height y[i]; a > b where it misses."""
+    x1, y1, x2, y2, r = caps.T
+    a = np.full(len(y), np.inf)
+    b = np.full(len(y), -np.inf)
+    # The end disks
+    for cx, cy in ((x1, y1), (x2, y2)):
+        h = r * r - (y - cy) ** 2
+        hit = h >= 0
+        s = np.sqrt(np.where(hit, h, 0.0))
+        a = np.where(hit, np.minimum(a, cx - s), a)
+        b = np.where(hit, np.maximum(b, cx + s), b)
+    # The rectangle swept between them: 0 <= (p - p1).d <= |d|^2 and |(p - p1) x d| <= r |d|
+    dx, dy = x2 - x1, y2 - y1
+    length = np.hypot(dx, dy)
+    ey = y - y1
+    along, across = ey * dy, ey * dx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t1, t2 = -along / dx, (length * length - along) / dx
+        inside = (along >= 0) & (along <= length * length)
+        lo = np.where(dx != 0, np.minimum(t1, t2), np.where(inside, -np.inf, np.inf))
+        hi = np.where(dx != 0, np.maximum(t1, t2), np.where(inside, np.inf, -np.inf))
+        u1, u2 = (across - r * length) / dy, (across + r * length) / dy
+        inside = np.abs(across) <= r * length
+        lo = np.maximum(lo, np.where(dy != 0, np.minimum(u1, u2), np.where(inside, -np.inf, np.inf)))
+        hi = np.minimum(hi, np.where(dy != 0, np.maximum(u1, u2), np.where(inside, np.inf, -np.inf)))
+    hit = (length > 0) & (lo <= hi)
+    # A capsule is convex, so its line section is the hull of the three parts
+    a = np.where(hit, np.minimum(a, x1 + lo), a)
+    b = np.where(hit, np.maximum(b, x1 + hi), b)
+    return a, b
+
+def region_spans(edges, owner, rows, y):
+    """
+    Inside spans (row, a, b) of the regions, from the crossings of edges[i]
+    with the line y[i] in row rows[i]: even-odd per contour, an edge counting
+    on [lower end, upper end) so that shared vertices cross once.
+    """
+    x1, y1, x2, y2 = edges.T
+    cross = (y1 <= y) != (y2 <= y)
+    x1, y1, x2, y2, y = x1[cross], y1[cross], x2[cross], y2[cross], y[cross]
+    x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    key = owner[cross] * (int(rows.max()) + 1) + rows[cross]
+    order = np.lexsort((x, key))
+    key, x = key[order], x[order]
+    # Pair the 1st and 2nd crossing of each (contour, row), the 3rd and 4th, ...
+    n = np.arange(len(key))
+    first = np.ones(len(key), dtype=bool)
+    first[1:] = key[1:] != key[:-1]
+    rank = n - np.maximum.accumulate(np.where(first, n, 0))
+    start = np.flatnonzero((rank % 2 == 0) & np.append(~first[1:], False))
+    return key[start] % (int(rows.max()) + 1), x[start], x[start + 1]
+
+def render_tile(copper, grid, start, stop, caps=None, edges=None):
+    """
+    Copper bitmap (stop - start, width) of rows start..stop. caps and edges
+    are index arrays of the objects that may reach the tile (all if None).
+    """
+    height = stop - start
+    ys = grid.rows(start, stop)
+    rows_out, a_out, b_out = [], [], []
+
+    c = copper.caps if caps is None else copper.caps[caps]
+    r = c[:, 4]
+    obj, row = _row_pairs(grid, start, stop, np.minimum(c[:, 1], c[:, 3]) - r, np.maximum(c[:, 1], c[:, 3]) + r)
+    a, b = capsule_spans(c[obj], ys[row - start])
+    rows_out.append(row)
+    a_out.append(a)
+    b_out.append(b)
+
+    if len(copper.edges):
+        e = copper.edges if edges is None else copper.edges[edges]
+        o = copper.owner if edges is None else copper.owner[edges]
+        obj, row = _row_pairs(grid, start, stop, np.minimum(e[:, 1], e[:, 3]), np.maximum(e[:, 1], e[:, 3]))
+        if len(obj):
+            row, a, b = region_spans(e[obj], o[obj], row, ys[row - start])
+            rows_out.append(row)
+            a_out.append(a)
+            b_out.append(b)
+
+    row, a, b = np.concatenate(rows_out), np.concatenate(a_out), np.concatenate(b_out)
+    # Pixels whose centres lie in [a, b], as +1 at the first and -1 after the last
+    with np.errstate(invalid="ignore"):
+        c0 = np.ceil((a - grid.x0) / grid.pitch - 0.5)
+        c1 = np.floor((b - grid.x0) / grid.pitch - 0.5)
+    keep = (c0 <= c1) & (c1 >= 0) & (c0 < grid.width)
+    row = row[keep] - start
+    c0 = np.clip(c0[keep], 0, grid.width).astype(np.int64)
+    c1 = np.clip(c1[keep] + 1, 0, grid.width).astype(np.int64)
+    size = height * (grid.width + 1)
+    steps = (np.bincount(row * (grid.width + 1) + c0, minlength=size)
+             - np.bincount(row * (grid.width + 1) + c1, minlength=size))
+    return np.cumsum(steps.reshape(height, grid.width + 1), axis=1)[:, :grid.width] > 0
+
+def tiles(copper, grid, tile=256):
+    """Yield (first row, bitmap) for successive bands of tile rows."""
+    r = copper.caps[:, 4]
+    cap_top = np.maximum(copper.caps[:, 1], copper.caps[:, 3]) + r
+    cap_bottom = np.minimum(copper.caps[:, 1], copper.caps[:, 3]) - r
+    # A contour reaches a tile if any of its edges does; take them whole
+    if len(copper.edges):
+        ncontour = int(copper.owner.max()) + 1
+        top = np.full(ncontour, -np.inf)
+        bottom = np.full(ncontour, np.inf)
+        np.maximum.at(top, copper.owner, np.maximum(copper.edges[:, 1], copper.edges[:, 3]))
+        np.minimum.at(bottom, copper.owner, np.minimum(copper.edges[:, 1], copper.edges[:, 3]))
+        edge_top, edge_bottom = top[copper.owner], bottom[copper.owner]
+    for start in range(0, grid.height, tile):
+        stop = min(start + tile, grid.height)
+        y_hi = grid.y0 - (start - 1) * grid.pitch
+        y_lo = grid.y0 - (stop + 1) * grid.pitch
+        caps = np.flatnonzero((cap_top >= y_lo) & (cap_bottom <= y_hi))
+        edges = None
+        if len(copper.edges):
+            edges = np.flatnonzero((edge_top >= y_lo) & (edge_bottom <= y_hi))
+        yield start, render_tile(copper, grid, start, stop, caps, edges)
+
+def rasterize(copper, grid, tile=256) -> np.ndarray:
+    """The whole bitmap (height, width), True on copper."""
+    out = np.zeros((grid.height, grid.width), dtype=bool)
+    for start, bits in tiles(copper, grid, tile):
+        out[start:start + len(bits)] = bits
+    return out
+
+# ---------- Images ----------
+
+class PngWriter:
+    """8-bit grey or RGB PNG written a band of rows at a time."""
+
+    def __init__(self, path, width, height, rgb=False):
+        self.f = open(path, "wb")
+        self.z = zlib.compressobj(1)
+        self.f.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2 if rgb else 0, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self.f.write(struct.pack(">I", len(data)) + kind + data)
+        self.f.write(struct.pack(">I", zlib.crc32(kind + data)))
+
+    def write(self, rows):
+        """rows: uint8 (n, width) or (n, width, 3)."""
+        rows = rows.reshape(len(rows), -1)
+        data = np.hstack((np.zeros((len(rows), 1), dtype=np.uint8), rows)).tobytes()
+        out = self.z.compress(data)
+        if out:
+            self._chunk(b"IDAT", out)
+
+    def close(self):
+        self._chunk(b"IDAT", self.z.flush())
+        self._chunk(b"IEND", b"")
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _read_netpbm(path):
+    """Binary PGM (P5) or PPM (P6) with 8-bit samples."""
+    data = Path(path).read_bytes()
+    fields, pos = [], 0
+    while len(fields) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b"#":
+            pos = data.index(b"\n", pos)
+            continue
+        end = pos
+        while not data[end:end + 1].isspace():
+            end += 1
+        fields.append(data[pos:end])
+        pos = end
+    magic, width, height, maxval = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+    if magic not in (b"P5", b"P6") or maxval > 255:
+        raise ValueError(f"{path}: only 8-bit binary PGM/PPM is supported")
+    channels = 3 if magic == b"P6" else 1
+    pixels = np.frombuffer(data, dtype=np.uint8, count=width * height * channels, offset=pos + 1)
+    return pixels.reshape(height, width, channels) if channels == 3 else pixels.reshape(height, width)
+
+def read_image(path) -> np.ndarray:
+    """Reference image as 8-bit grey (height, width)."""
+    ext = Path(path).suffix.lower()
+    if ext == ".npy":
+        img = np.load(path)
+    elif ext in (".pgm", ".ppm", ".pnm"):
+        img = _read_netpbm(path)
+    else:
+        try:
+            from PIL import Image
+        except ImportError:
+            raise ImportError(f"reading {ext} images needs Pillow (pip install pillow); "
+                              "convert the image to PGM to do without it") from None
+        Image.MAX_IMAGE_PIXELS = None
+        with Image.open(path) as im:
+            img = np.asarray(im.convert("L"))
+    if img.ndim == 3:
+        img = img[:, :, :3] @ np.array([0.299, 0.587, 0.114])
+    if img.dtype == bool:
+        return img.astype(np.uint8) * 255
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+def otsu_threshold(img) -> int:
+    """Grey level splitting the histogram of img into two classes of least spread."""
+    hist = np.bincount(img.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    w0 = np.cumsum(hist)
+    w1 = w0[-1] - w0
+    m0 = np.cumsum(hist * levels)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = w0 * w1 * (m0 / w0 - (m0[-1] - m0) / w1) ** 2
+    return int(np.nanargmax(between)) + 1
+
+# ---------- Registration ----------
+
+def fit_transform(board, image) -> np.ndarray:
+    """
+    (2, 3) matrix taking board mm to image pixels. Two point pairs give a
+    similarity with the y axis flipped, three or more a least squares affine.
+    """
+    board, image = np.asarray(board, dtype=float), np.asarray(image, dtype=float)
+    if len(board) < 2:
+        raise ValueError("at least two registration points are needed")
+    if len(board) == 2:
+        z = board[:, 0] - 1j * board[:, 1]
+        w = image[:, 0] + 1j * image[:, 1]
+        if z[0] == z[1]:
+            raise ValueError("the two registration points coincide")
+        s = (w[1] - w[0]) / (z[1] - z[0])
+        t = w[0] - s * z[0]
+        # w = s * conj(x + iy) + t
+        return np.array([[s.real, s.imag, t.real], [s.imag, -s.real, t.imag]])
+    design = np.column_stack((board, np.ones(len(board))))
+    m, _, rank, _ = np.linalg.lstsq(design, image, rcond=None)
+    if rank < 3:
+        raise ValueError("the registration points lie on one line")
+    return m.T
+
+def residuals(m, board, image) -> np.ndarray:
+    """Distance in image pixels between each registration point and where m puts it."""
+    board = np.asarray(board, dtype=float)
+    return np.hypot(*(board @ m[:, :2].T + m[:, 2] - np.asarray(image, dtype=float)).T)
+
+# ---------- Comparison ----------
+
+# Difference image colour per pixel class: copper in neither, only in the
+# Gerbers, only in the reference, in both; then outside the reference without
+# and with copper in the Gerbers.
+DIFF_COLOURS = np.array([(0, 0, 0), (255, 0, 0), (0, 160, 255), (255, 255, 255),
+                         (48, 48, 48), (128, 128, 128)], dtype=np.uint8)
+OUTSIDE = 4
+
+class Score(NamedTuple):
+    compared: int       # pixels with a reference pixel under them
+    copper_only: int    # copper in the Gerbers, not in the reference
+    reference_only: int
+
+    @property
+    def mismatch(self):
+        return (self.copper_only + self.reference_only) / self.compared if self.compared else 0.0
+
+def compare(copper, grid, ref, m, threshold, invert=False, tile=256, cell=None,
+            png=None, diff=None, npy=None):
+    """
+    Rasterize and compare tile by tile with the reference ref registered by m.
+    Writes the bitmap (png, npy) and the difference image (diff) as it goes.
+    Returns the Score and, if cell is given, the mismatch share per cell of
+    cell x cell pixels (NaN where nothing was compared).
+    """
+    cols = grid.columns()
+    out_png = PngWriter(png, grid.width, grid.height) if png else None
+    out_diff = PngWriter(diff, grid.width, grid.height, rgb=True) if diff else None
+    out_npy = np.lib.format.open_memmap(npy, mode="w+", dtype=bool, shape=(grid.height, grid.width)) if npy else None
+    if ref is not None:
+        flat = ref.ravel()
+        copper_level = np.arange(256) < threshold if invert else np.arange(256) >= threshold
+    if cell:
+        ncx = -(-grid.width // cell)
+        cell_col = np.arange(grid.width) // cell
+        counts = np.zeros((-(-grid.height // cell) * ncx, len(DIFF_COLOURS)), dtype=np.int64)
+        tile = max(cell, tile // cell * cell)
+    total = np.zeros(len(DIFF_COLOURS), dtype=np.int64)
+    try:
+        for start, bits in tiles(copper, grid, tile):
+            if out_png:
+                out_png.write(bits.astype(np.uint8) * 255)
+            if out_npy is not None:
+                out_npy[start:start + len(bits)] = bits
+            if ref is None:
+                continue
+            ys = grid.rows(start, start + len(bits))[:, None]
+            u = m[0, 0] * cols + (m[0, 1] * ys + m[0, 2])
+            v = m[1, 0] * cols + (m[1, 1] * ys + m[1, 2])
+            np.rint(u, out=u)
+            np.rint(v, out=v)
+            seen = (u >= 0) & (u < ref.shape[1]) & (v >= 0) & (v < ref.shape[0])
+            np.clip(u, 0, ref.shape[1] - 1, out=u)
+            np.clip(v, 0, ref.shape[0] - 1, out=v)
+            v *= ref.shape[1]
+            v += u
+            theirs = copper_level[flat.take(v.astype(np.intp))]
+            # Class of each pixel, see DIFF_COLOURS
+            code = bits.view(np.uint8) + 2 * theirs.view(np.uint8)
+            code[~seen] = (OUTSIDE + bits[~seen]).astype(np.uint8)
+            total += [np.count_nonzero(code == k) for k in range(len(DIFF_COLOURS))]
+            if out_diff:
+                out_diff.write(np.take(DIFF_COLOURS, code, axis=0))
+            if cell:
+                first = start // cell * ncx
+                ids = (np.arange(len(bits)) // cell * ncx)[:, None] + cell_col
+                n = -(-len(bits) // cell) * ncx
+                counts[first:first + n] += np.bincount((ids * len(DIFF_COLOURS) + code).ravel(),
+                                                       minlength=n * len(DIFF_COLOURS)).reshape(n, -1)
+    finally:
+        for out in (out_png, out_diff):
+            if out:
+                out.close()
+        if out_npy is not None:
+            out_npy.flush()
+    score = Score(int(total[:OUTSIDE].sum()), int(total[1]), int(total[2]))
+    if not cell:
+        return score, None
+    bad, seen = counts[:, 1] + counts[:, 2], counts[:, :OUTSIDE].sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return score, np.where(seen > 0, bad / seen, np.nan).reshape(-1, ncx)
+
+def write_heatmap(path, share):
+    """Mismatch share per cell as black (none) through red and yellow to white (all); grey where not compared."""
+    stops = np.array([0.0, 1 / 3, 2 / 3, 1.0])
+    x = np.nan_to_num(share, nan=0.0)
+    rgb = np.stack([np.interp(x, stops, channel) for channel in
+                    ((0, 255, 255, 255), (0, 0, 255, 255), (0, 0, 0, 255))], axis=-1).astype(np.uint8)
+    rgb[np.isnan(share)] = (64, 64, 64)
+    with PngWriter(path, rgb.shape[1], rgb.shape[0], rgb=True) as out:
+        out.write(rgb)
+
+# ---------- Main ----------
+
+def _point(text):
+    try:
+        x, y, u, v = (float(f) for f in text.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected X,Y,COL,ROW, got {text!r}") from None
+    return (x, y), (u, v)
+
+def main():
+    ap = argparse.ArgumentParser(description="Rasterize copper Gerbers and compare them with a board image.")
+    ap.add_argument("gerbers", nargs="+", help="Copper .gbr files; several are drawn into one bitmap")
+    ap.add_argument("--dpi", type=float, default=600, help="Resolution (default: 600)")
+    ap.add_argument("--margin", type=float, default=1.0, help="Border around the copper in mm (default: 1)")
+    ap.add_argument("--tile", type=int, default=256, help="Pixel rows rendered at a time (default: 256)")
+    ap.add_argument("--png", help="Write the bitmap as PNG")
+    ap.add_argument("--npy", help="Write the bitmap as a .npy bool array")
+    ap.add_argument("--ref", help="Reference image to compare with")
+    ap.add_argument("--point", action="append", type=_point, default=[], metavar="X,Y,COL,ROW",
+                    help="Board position in mm and the reference pixel showing it (two or more)")
+    ap.add_argument("--threshold", type=int, help="Grey level from which a reference pixel is copper (default: Otsu)")
+    ap.add_argument("--invert", action="store_true", help="Copper is dark in the reference")
+    ap.add_argument("--diff", help="Write the difference image as PNG: red only in the Gerbers, blue only in the reference")
+    ap.add_argument("--heatmap", help="Write the mismatch share per cell as PNG")
+    ap.add_argument("--cell", type=float, default=1.0, help="Heatmap cell size in mm (default: 1)")
+    args = ap.parse_args()
+
+    if args.ref and len(args.point) < 2:
+        ap.error("--ref needs at least two --point registration pairs")
+    if (args.diff or args.heatmap) and not args.ref:
+        ap.error("--diff and --heatmap need --ref")
+
+    t0 = time.perf_counter()
+    copper = load_copper(args.gerbers)
+    grid = board_grid(copper, args.dpi, args.margin)
+    print(f"{len(copper.caps)} capsules, {len(copper.edges)} region edges; "
+          f"{grid.width} x {grid.height} pixels at {args.dpi:g} DPI", file=sys.stderr)
+
+    ref = m = threshold = None
+    if args.ref:
+        try:
+            ref = read_image(args.ref)
+        except (ImportError, ValueError) as e:
+            sys.exit(f"Cannot read {args.ref}: {e}")
+        board, image = zip(*args.point)
+        try:
+            m = fit_transform(board, image)
+        except ValueError as e:
+            ap.error(str(e))
+        err = residuals(m, board, image)
+        threshold = otsu_threshold(ref) if args.threshold is None else args.threshold
+        print(f"Reference {ref.shape[1]} x {ref.shape[0]}, threshold {threshold}, "
+              f"registration residual max {err.max():.1f} px", file=sys.stderr)
+
+    cell = max(1, round(args.cell / grid.pitch)) if args.heatmap else None
+    score, share = compare(copper, grid, ref, m, threshold, args.invert, args.tile, cell,
+                           png=args.png, diff=args.diff, npy=args.npy)
+    if share is not None:
+        write_heatmap(args.heatmap, share)
+    print(f"Done in {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+
+    if ref is not None:
+        n = score.compared or 1
+        print(f"Mismatch: {score.mismatch:.2%} of {score.compared} compared pixels "
+              f"(Gerber only {score.copper_only / n:.2%}, reference only {score.reference_only / n:.2%})")
+        if score.compared < grid.width * grid.height:
+            print(f"{grid.width * grid.height - score.compared} pixels fall outside the reference")
+
+if __name__ == "__main__":
+    main()
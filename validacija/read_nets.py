@@ -1,123 +1,326 @@
+import argparse
+import hashlib
+import os
+import pickle
 import re
-
-
-def extract_nets(file_content):
-    # Match whole net blocks: starts with (net ...) and continues with indented lines
-    net_pattern = re.compile(
-        r'\(net\s+\(code\s+".*?"\)\s+\(name\s+"(.*?)"\).*?(?:\n {6}.*)+', re.MULTILINE
-    )
-    return net_pattern.findall(file_content), net_pattern.finditer(file_content)
-
-
-def extract_nodes(net_block):
-    # Extract all (node ...) entries and their ref/pin
-    return re.findall(r'\(node\s+\(ref\s+"([^"]+)"\)\s+\(pin\s+"([^"]+)"\)', net_block)
+import struct
+import sys
+from array import array
+from collections import Counter
+from pathlib import Path
+
+# The shared S-expression reader lives next to the board scripts
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "gdp"))
+import perf  # noqa: E402
+import sexpr  # noqa: E402
+
+
+def _field(node, head):
+    # Value of a (head "value") child, or "" if absent
+    child = sexpr.find(node, head)
+    return child[1] if child and len(child) > 1 else ""
+
+
+# Fields of a netlist export, in the order Eeschema writes them. A quoted
+# value is captured without its quotes (escapes still in).
+_QUOTED = r'"([^"\\]*(?:\\.[^"\\]*)*)"'
+_NET_HEAD_RE = re.compile(
+    r'\(net\s+\(code\s+' + _QUOTED + r'\)\s*\(name\s+' + _QUOTED + r'\)(?:\s*\(class\s+' + _QUOTED + r'\))?')
+_NET_HEAD_RE_B = re.compile(_NET_HEAD_RE.pattern.encode())
+_PIN_FIELDS = r'\(node\s+\(ref\s+' + _QUOTED + r'\)\s*\(pin\s+' + _QUOTED + r'\)'
+_NODE_RE = re.compile(_PIN_FIELDS + r'(?:\s*\(pinfunction\s+' + _QUOTED + r'\))?(?:\s*\(pintype\s+' + _QUOTED + r'\))?')
+_PIN_RE = re.compile(_PIN_FIELDS)
+
+
+def _unescape(value):
+    return sexpr.unquote(f'"{value}"') if "\\" in value else value
+
+
+def _net_blocks(filename):
+    """
+    Yield (head match, text) for every (net ...) block of a netlist export;
+    a block runs up to the next net head. The file is memory-mapped and only
+    one block is decoded at a time.
+    """
+    with sexpr.map_file(filename) as buf:
+        starts = [m.start() for m in _NET_HEAD_RE_B.finditer(buf)]
+        starts.append(len(buf))
+        for start, end in zip(starts, starts[1:]):
+            block = buf[start:end].decode("utf-8")
+            yield _NET_HEAD_RE.match(block), block
+
+
+def iter_netlist(filename):
+    """
+    Stream (net_name, code, class, nodes) records from a KiCad netlist export.
+    nodes is a list of (ref, pin, pinfunction, pintype); missing fields are "".
+    """
+    for head, block in _net_blocks(filename):
+        code, name, net_class = (_unescape(v or "") for v in head.groups())
+        nodes = [tuple(_unescape(v) for v in node) for node in _NODE_RE.findall(block, head.end())]
+        yield name, code, net_class, nodes
 
 
 def process_kicad_file(filename):
-    with open(filename, "r", encoding="utf-8") as f:
-        content = f.read()
-
-    names, net_matches = extract_nets(content)
-
     net_dict = {}
 
-    for name, match in zip(names, net_matches):
-        net_block = match.group()
-        nodes = extract_nodes(net_block)
-        node_set = {f"{ref}/{pin}" for ref, pin in nodes}
-        net_dict[name] = node_set
+    for head, block in _net_blocks(filename):
+        pins = _PIN_RE.findall(block, head.end())
+        if "\\" in block:
+            pins = [(_unescape(ref), _unescape(pin)) for ref, pin in pins]
+        net_dict[_unescape(head.group(2))] = {f"{ref}/{pin}" for ref, pin in pins}
 
     return net_dict
 
 
-def parse_lines_to_sets(lines):
-    networks = []
+# One validation-file line: a comment, a '(REF)' section head, an 'a b' pair,
+# or anything else (a blank line, or an error)
+_VLD_LINE_RE = re.compile(
+    r"^[ \t]*(?:#.*?|\((\w+)\)|(\S+)[ \t]+(\S+)|(.*?))[ \t\r\f\v]*$", re.M)
+
+
+class EdgeList:
+    """
+    A compiled validation file: interned names and the pairs joining them
+    (two name ids per pair, in file order), plus the problems found while
+    parsing as (line number, message).
+    """
+
+    MAGIC = b"VLDE\x01"
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.edges = array("I")
+        self.errors = []
+
+    def name_id(self, name: str) -> int:
+        nid = self.ids.get(name)
+        if nid is None:
+            nid = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return nid
+
+    def save(self, path: str):
+        """
+        Write a compact binary copy: header, newline-separated names, then
+        the pairs as little-endian uint16 (uint32 beyond 65536 names).
+        """
+        names = "\n".join(self.names).encode("utf-8")
+        edges = array("H" if len(self.names) <= 0x10000 else "I", self.edges)
+        if sys.byteorder != "little":
+            edges.byteswap()
+        with open(path, "wb") as f:
+            f.write(self.MAGIC)
+            f.write(struct.pack("<IIIB", len(self.names), len(names), len(edges) // 2, edges.itemsize))
+            f.write(names)
+            f.write(edges.tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> "EdgeList":
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(cls.MAGIC):
+            raise ValueError(f"{path}: not a compiled validation file")
+        pos = len(cls.MAGIC)
+        count, size, pairs, itemsize = struct.unpack_from("<IIIB", data, pos)
+        pos += struct.calcsize("<IIIB")
+        self = cls()
+        self.names = data[pos:pos + size].decode("utf-8").split("\n") if count else []
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        edges = array("H" if itemsize == 2 else "I")
+        edges.frombytes(data[pos + size:pos + size + 2 * pairs * itemsize])
+        if sys.byteorder != "little":
+            edges.byteswap()
+        self.edges = array("I", edges)
+        return self
+
+
+def compile_validation(text: str) -> EdgeList:
+    """
+    Parse a hand-transcribed validation file in one pass:
+      # comment
+      (IC7)             following bare pin numbers belong to IC7
+      3 IC8/5           IC7/3 and IC8/5 are connected
+      4 NC              ignored
+    Malformed lines are recorded in .errors and skipped.
+    """
+    out = EdgeList()
+    edges = out.edges
+    name_id = out.name_id
+    errors = out.errors
     default_ref = None
 
-    for line in lines:
-        line = line.strip()
-
-        if line.startswith("#"):
-            continue
-
-        # Check for default ref line like: (IC7)
-        m = re.match(r"^\((\w+)\)$", line)
-        if m:
-            default_ref = m.group(1)
-            continue
-
-        parts = line.split()
-        if len(parts) != 2:
-            print(parts)
-            assert False
-            # continue
-
-        a, b = parts
-
-        if b == "NC":
-            continue
-
-        # If a is just a number, prepend default_ref
-        if re.fullmatch(r"\d+", a) and default_ref:
-            a = f"{default_ref}/{a}"
-        if re.fullmatch(r"\d+", b) and default_ref:
-            b = f"{default_ref}/{b}"
-
-        networks.append(set([a, b]))
-
-    return networks
-
-
-def merge_networks(networks):
-    """Merge all networks that share at least one element."""
-    merged = []
-    while networks:
-        base = networks.pop()
-        changed = True
-        while changed:
-            changed = False
-            i = 0
-            while i < len(networks):
-                if base & networks[i]:  # If intersection is not empty
-                    base |= networks.pop(i)
-                    changed = True
+    for lineno, m in enumerate(_VLD_LINE_RE.finditer(text), 1):
+        ref, a, b, other = m.groups()
+        if ref is not None:
+            default_ref = ref
+        elif a is not None:
+            if b == "NC":
+                continue
+            if a.isdecimal() or b.isdecimal():
+                if default_ref:
+                    if a.isdecimal():
+                        a = f"{default_ref}/{a}"
+                    if b.isdecimal():
+                        b = f"{default_ref}/{b}"
                 else:
-                    i += 1
-        merged.append(base)
-    return merged
+                    errors.append((lineno, f"pin number before any (REF) line: {m.group().strip()!r}"))
+            edges.append(name_id(a))
+            edges.append(name_id(b))
+        elif other:
+            errors.append((lineno, f"expected 'a b', '(REF)' or '# comment', got {other!r}"))
+    return out
+
+
+class DisjointSet:
+    """Union-find over the ids 0..n-1 with path compression and union by rank."""
+
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+        self.rank = [0] * n
+
+    def find(self, item):
+        parent = self.parent
+        if parent[item] == item:
+            return item
+        root = item
+        while parent[root] != root:
+            root = parent[root]
+        # Path compression: point everything on the way directly at the root
+        while parent[item] != root:
+            parent[item], item = root, parent[item]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        rank = self.rank
+        if rank[ra] < rank[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        if rank[ra] == rank[rb]:
+            rank[ra] += 1
+        return ra
+
+
+def edges_to_nets(edges: EdgeList) -> list[set]:
+    """
+    Merge the pairs of a compiled validation file into nets of pins (names
+    with a '/'). The net holding the last pair of the file comes first, then
+    the one holding the last pair of the rest, and so on.
+    """
+    dsu = DisjointSet(len(edges.names))
+    pairs = edges.edges
+    for k in range(0, len(pairs), 2):
+        dsu.union(pairs[k], pairs[k + 1])
+
+    find = dsu.find
+    last_pair = {}
+    for k in range(0, len(pairs), 2):
+        last_pair[find(pairs[k])] = k
+    groups = {}
+    for nid, name in enumerate(edges.names):
+        if "/" in name:
+            groups.setdefault(find(nid), set()).add(name)
+    return [groups[root] for root in sorted(groups, key=last_pair.__getitem__, reverse=True)]
 
 
 def process_file(filepath):
-    with open(filepath, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    initial_sets = parse_lines_to_sets(lines)
-    merged_sets = merge_networks(initial_sets)
-
-    # Now, strip out anything that's not a pin (i.e., doesn't contain a '/')
-    final_nets = [
-        {item for item in net if "/" in item}
-        for net in merged_sets
-        if any("/" in i for i in net)
-    ]
-
-    return final_nets
-
-
-def find_best_matches(sch_nets: dict[str, set], vld_nets: list[set]):
+    """
+    Nets of a validation file (.txt, or a binary copy written by
+    EdgeList.save), and the problems found while parsing it as
+    (line number, message); the rest of the file is still used.
+    """
+    with open(filepath, "rb") as f:
+        compiled = f.read(len(EdgeList.MAGIC)) == EdgeList.MAGIC
+    if compiled:
+        edges = EdgeList.load(filepath)
+    else:
+        with open(filepath, "r", encoding="utf-8") as f:
+            edges = compile_validation(f.read())
+    return edges_to_nets(edges), edges.errors
+
+
+# Bump whenever a parser changes what it returns, so stale caches are ignored
+PARSER_VERSION = 3
+
+
+def load_cached(parse, filepath, use_cache=True):
+    """
+    Return parse(filepath), reusing '<filepath>.cache' when it was written by
+    the same parser and parser version for the same file content (SHA-256).
+    """
+    if not use_cache:
+        return parse(filepath)
+
+    with open(filepath, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    key = (PARSER_VERSION, parse.__name__, digest)
+    cache_path = f"{filepath}.cache"
+
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, data = pickle.load(f)
+        if cached_key == key:
+            return data
+    except (OSError, EOFError, ValueError, TypeError, AttributeError, pickle.UnpicklingError):
+        pass
+
+    data = parse(filepath)
+    try:
+        tmp_path = f"{cache_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((key, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # a read-only checkout just runs without a cache
+    return data
+
+
+def load_validation(filepath, use_cache=True) -> list[set]:
+    """Nets of a validation file through load_cached; parse problems are printed on stderr with their line numbers."""
+    nets, errors = load_cached(process_file, filepath, use_cache)
+    for lineno, message in errors:
+        print(f"{filepath}:{lineno}: {message}", file=sys.stderr)
+    return nets
+
+
+def build_pin_index(sch_nets: dict[str, set]) -> dict[str, list]:
+    """Map every pin (e.g. 'IC14/10') to the names of the schematic nets that contain it."""
+    index = {}
+    for name, sch_set in sch_nets.items():
+        for pin in sch_set:
+            index.setdefault(pin, []).append(name)
+    return index
+
+
+def find_best_matches(sch_nets: dict[str, set], vld_nets: list[set], pin_index: dict[str, list] = None):
     results = []
     matched = set()
 
+    if pin_index is None:
+        pin_index = build_pin_index(sch_nets)
+    # Ties go to the schematic net listed first, as with a full scan of sch_nets
+    order = {name: n for n, name in enumerate(sch_nets)}
+
     for i, vld_net in enumerate(vld_nets):
         best_match_name = None
         best_match_score = 0
         best_match_sch_set = set()
 
-        for name, sch_set in sch_nets.items():
-            intersection = vld_net & sch_set
-            union = vld_net | sch_set
-            score = len(intersection) / len(union) if union else 0
+        # Only nets sharing at least one pin can score above zero
+        shared = Counter()
+        for pin in vld_net:
+            for name in pin_index.get(pin, ()):
+                shared[name] += 1
+
+        for name in sorted(shared, key=order.__getitem__):
+            sch_set = sch_nets[name]
+            intersection = shared[name]
+            union = len(vld_net) + len(sch_set) - intersection
+            score = intersection / union
 
             if score > best_match_score:
                 best_match_score = score
@@ -125,88 +328,172 @@ def find_best_matches(sch_nets: dict[str, set], vld_nets: list[set]):
                 best_match_sch_set = sch_set
 
         matched.add(best_match_name)
-        if best_match_score == 1.0:
-            result = f"vld_net[{i}] PERFECT MATCH with sch_net '{best_match_name}'\n"
-        else:
-            only_in_vld = vld_net - best_match_sch_set
-            only_in_sch = best_match_sch_set - vld_net
-            result = f"vld_net[{i}] best match: '{best_match_name}' ({best_match_score:.2%} overlap)\n"
-            if only_in_vld:
-                result += f"  Only in vld_net[{i}]: {only_in_vld}\n"
-            if only_in_sch:
-                result += f"  Only in sch_net['{best_match_name}']: {only_in_sch}\n"
-            if only_in_vld or only_in_sch:
-                result += f"  vld_net: {vld_net}\n"
-                result += f"  sch_net: {best_match_sch_set}\n"
-
-        results.append(result)
+        results.append(format_match(i, vld_net, best_match_name, best_match_score, best_match_sch_set))
+
+    print_unmatched(sch_nets, matched)
+
+    return results
+
 
+def format_match(i: int, vld_net: set, best_match_name, best_match_score: float, best_match_sch_set: set) -> str:
+    if best_match_score == 1.0:
+        result = f"vld_net[{i}] PERFECT MATCH with sch_net '{best_match_name}'\n"
+    else:
+        only_in_vld = vld_net - best_match_sch_set
+        only_in_sch = best_match_sch_set - vld_net
+        result = f"vld_net[{i}] best match: '{best_match_name}' ({best_match_score:.2%} overlap)\n"
+        if only_in_vld:
+            result += f"  Only in vld_net[{i}]: {only_in_vld}\n"
+        if only_in_sch:
+            result += f"  Only in sch_net['{best_match_name}']: {only_in_sch}\n"
+        if only_in_vld or only_in_sch:
+            result += f"  vld_net: {vld_net}\n"
+            result += f"  sch_net: {best_match_sch_set}\n"
+    return result
+
+
+def print_unmatched(sch_nets: dict[str, set], matched: set):
     print("We didn't match against:")
     print({item for item in (sch_nets.keys() - matched) if "unconnected" not in item})
     print()
 
-    return results
-
 
-def swap(name: str, vld_nets: list[set]):
-    for net in vld_nets:
-        for pin in list(net):  # use list to avoid modifying set during iteration
-            if pin.startswith(name + "/"):
-                net.remove(pin)
-                parts = pin.split("/")
-                assert len(parts) == 2
-                pin_number = parts[1]
-                if pin_number == "1":
-                    other_pin_number = "2"
-                elif pin_number == "2":
-                    other_pin_number = "1"
-                else:
-                    assert False
-                new_pin = f"{parts[0]}/{other_pin_number}"
-                net.add(new_pin)
+def _nets_by_ref(vld_nets: list[set]) -> dict[str, set]:
+    """Reference designator -> indices of the nets holding one of its pins."""
+    by_ref = {}
+    for i, net in enumerate(vld_nets):
+        for pin in net:
+            by_ref.setdefault(pin.partition("/")[0], set()).add(i)
+    return by_ref
+
+
+def swap(name: str, vld_nets: list[set], by_ref: dict[str, set]):
+    """
+    Exchange pins 1 and 2 of a two-pin part. One of them may be missing (not
+    connected pins are not listed); a part with other pins is reported and left alone.
+    """
+    nets = [vld_nets[i] for i in by_ref.get(name, ())]
+    numbers = {pin.partition("/")[2] for net in nets for pin in net if pin.partition("/")[0] == name}
+    if not numbers or not numbers <= {"1", "2"}:
+        found = ", ".join(sorted(numbers)) or "none"
+        print(f"Cannot swap {name}: expected pins 1 and 2, found {found}", file=sys.stderr)
+        return
+    one, two = f"{name}/1", f"{name}/2"
+    for net in nets:
+        has_one, has_two = one in net, two in net
+        net.difference_update((one, two))
+        if has_one:
+            net.add(two)
+        if has_two:
+            net.add(one)
+
+
+def rmv(name: str, vld_nets: list[set], by_ref: dict[str, set]):
+    prefix = name + "/"
+    for i in by_ref.pop(name, ()):
+        vld_nets[i] = {pin for pin in vld_nets[i] if not pin.startswith(prefix)}
+
+
+# incorrect pin assignment for resistors and capacitors
+SWAPPED_PARTS = (
+    "CK40",
+    "CK52",
+    "CK55",
+    "R8",
+    "R9",
+    "R10",
+    "R11",
+    "R12",
+    "R13",
+    "R14",
+    "R15",
+    "R21",
+    "R25",
+    "R27",
+    "R29",
+    "R30",
+    "R37",
+    "R39",
+    "R40",
+    "R43",
+    "R46",
+    "R47",
+    "R48",
+    "O1",
+)
+REMOVED_PARTS = ("SH3",)
+
+
+def fix_validation(vld_nets: list[set]) -> list[set]:
+    """Validation nets with the known mistakes undone: SWAPPED_PARTS swapped back, REMOVED_PARTS dropped."""
+    vld_nets = [set(net) for net in vld_nets]
+    by_ref = _nets_by_ref(vld_nets)
+    for comp in SWAPPED_PARTS:
+        swap(comp, vld_nets, by_ref)
+    for comp in REMOVED_PARTS:
+        rmv(comp, vld_nets, by_ref)
+    return vld_nets
+
+
+def print_differences(sch_nets: dict[str, set], vld_nets: list[set]):
+    """Print the schematic nets nobody matched and the pins found only on one side."""
+    for r in find_best_matches(sch_nets, vld_nets):
+        if "Only in" in r:
+            print(r)
 
 
-def rmv(name: str, vld_nets: list[set]):
-    for net in vld_nets:
-        for pin in list(net):
-            if pin.startswith(name + "/"):
-                net.remove(pin)
+def _size(*paths: str) -> int:
+    return sum(os.path.getsize(p) for p in paths if os.path.exists(p))
+
+
+def run(args, stats: perf.Stats):
+    use_cache = not args.no_cache
+    if args.save_edges:
+        with stats.stage("compile edges", _size("gdp_validacija.txt")):
+            with open("gdp_validacija.txt", "r", encoding="utf-8") as f:
+                compile_validation(f.read()).save("gdp_validacija.edges")
+        print("Compiled gdp_validacija.txt to gdp_validacija.edges", file=sys.stderr)
+    if args.sch:
+        # Build the netlist from the schematic sheets instead of the Eeschema export
+        from sch_nets import process_schematic
+        with stats.stage("schematic nets") as st:
+            sch_nets = process_schematic("../gdp/gdp.kicad_sch", use_cache=use_cache)
+            st.blocks = len(sch_nets)
+    else:
+        with stats.stage("netlist", _size("gdp.net")) as st:
+            sch_nets = load_cached(process_kicad_file, "gdp.net", use_cache)
+            st.blocks = len(sch_nets)
+    with stats.stage("validation", _size("gdp_validacija.txt")) as st:
+        vld_nets = load_validation("gdp_validacija.txt", use_cache)
+        st.blocks = len(vld_nets)
+    with stats.stage("fix-ups"):
+        vld_nets = fix_validation(vld_nets)
+    with stats.stage("match") as st:
+        print_differences(sch_nets, vld_nets)
+        st.blocks = len(vld_nets)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare the validation nets (gdp_validacija.txt) with the schematic netlist (gdp.net).")
+    ap.add_argument("--no-cache", action="store_true", help="Re-parse the inputs instead of using their .cache files")
+    ap.add_argument("--save-edges", action="store_true",
+                    help="Also compile gdp_validacija.txt to the binary gdp_validacija.edges")
+    ap.add_argument("--sch", action="store_true", help="Build the netlist from ../gdp/gdp.kicad_sch instead of gdp.net")
+    ap.add_argument("--stats", action="store_true",
+                    help="Print time, bytes, blocks, throughput and peak RSS per stage on stderr")
+    ap.add_argument("--stats-json", metavar="PATH", help="Write the per-stage statistics as JSON")
+    ap.add_argument("--profile", metavar="PATH",
+                    help="Run under cProfile; save pstats to PATH (hot functions as JSON if PATH ends in .json)")
+    args = ap.parse_args()
+
+    stats = perf.Stats()
+    with perf.profiled(args.profile):
+        run(args, stats)
+    if args.stats:
+        stats.report()
+    if args.stats_json:
+        stats.write_json(args.stats_json)
 
 
 if __name__ == "__main__":
-    sch_nets = process_kicad_file("gdp.net")
-    vld_nets = process_file("gdp_validacija.txt")
-    # incorrect pin assignment for resistors and capacitors
-    for comp in {
-        "CK40",
-        "CK52",
-        "CK55",
-        "R8",
-        "R9",
-        "R10",
-        "R11",
-        "R12",
-        "R13",
-        "R14",
-        "R15",
-        "R21",
-        "R25",
-        "R27",
-        "R29",
-        "R30",
-        "R37",
-        "R39",
-        "R40",
-        "R43",
-        "R46",
-        "R47",
-        "R48",
-        "O1",
-    }:
-        swap(comp, vld_nets)
-    for comp in {"SH3"}:
-        rmv(comp, vld_nets)
-    results = find_best_matches(sch_nets, vld_nets)
-    for r in results:
-        if "Only in" in r:
-            print(r)
+    main()
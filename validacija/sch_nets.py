@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+sch_nets.py
+
+Build the netlist straight from the .kicad_sch sheets, without exporting
+gdp.net from Eeschema first. The result has the shape process_kicad_file in
+read_nets.py returns: {net name: {"REF/pin", ...}}.
+
+Per sheet instance, wire end points, pins, labels, sheet pins and junctions
+are hashed by their coordinates (rounded to 1e-4 mm), and everything on the
+same point is joined. Junctions and labels also join the wires they lie
+inside, found through the horizontal and vertical wires indexed by their row
+and column; a wire merely ending on another one (no junction) does not, as
+in Eeschema. Across the hierarchy, nets are then
+joined by name: local labels within their sheet instance, hierarchical
+labels with the matching sheet pin of the parent, global labels, power
+symbols and hidden power input pins everywhere.
+
+Net names follow Eeschema: the strongest driver wins (global label, power
+pin, local label, hierarchical label, sheet pin, symbol pin), local names
+get their sheet path ('/2/NAME'), and nets named only by a pin are called
+'Net-(REF-PIN)', or 'unconnected-(REF-PIN-PadN)' for a pin on its own.
+Buses and bus entries are not followed; bus members connect through their
+labels.
+
+Usage:
+  python sch_nets.py ../gdp/gdp.kicad_sch
+  python sch_nets.py ../gdp/gdp.kicad_sch --net gdp.net
+"""
+
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "gdp"))
+import schematic  # noqa: E402
+
+# Driver priorities, weakest first, as Eeschema ranks them
+PIN, SHEET_PIN, HIER_LABEL, LOCAL_LABEL, POWER_PIN, GLOBAL = range(1, 7)
+
+# Bus labels: a vector 'D[0..7]' (optionally with a suffix) or a group '{...}'.
+# A brace after '~', '^' or '_' is text markup (overbar, super-, subscript).
+_VECTOR_RE = re.compile(r"([^\[\]{}\s]*)\[(\d+)\.\.(\d+)\]([^\[\]{}\s]*)")
+_GROUP_RE = re.compile(r"((?:[^{}\s]*[^{}\s~^_])?)\{(.*)\}")
+
+
+def _key(x, y):
+    return round(x * 1e4), round(y * 1e4)
+
+
+class _Nodes:
+    """Union-find over connectable items, with a naming candidate per item."""
+
+    def __init__(self):
+        self.parent = []
+        self.drivers = []           # (priority, name to rank by, net name) or None
+        self.pins = []              # "REF/pin" or None
+        self.named = {}             # join key -> first node with that key
+
+    def add(self, driver=None, pin=None):
+        self.parent.append(len(self.parent))
+        self.drivers.append(driver)
+        self.pins.append(pin)
+        return len(self.parent) - 1
+
+    def find(self, a):
+        parent = self.parent
+        root = a
+        while parent[root] != root:
+            root = parent[root]
+        while parent[a] != root:
+            parent[a], a = root, parent[a]
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+    def join_name(self, key, node):
+        first = self.named.setdefault(key, node)
+        if first != node:
+            self.union(first, node)
+
+
+def bus_members(name):
+    """
+    Net names carried by a bus label: 'D[0..7]' gives D0 to D7, a group
+    '{A B[0..1]}' its members, a named group 'X{A B}' X.A and X.B. Empty for
+    a plain net label.
+    """
+    m = _VECTOR_RE.fullmatch(name)
+    if m:
+        first, last = int(m.group(2)), int(m.group(3))
+        step = 1 if last >= first else -1
+        return [f"{m.group(1)}{i}{m.group(4)}" for i in range(first, last + step, step)]
+    m = _GROUP_RE.fullmatch(name)
+    if not m:
+        return []
+    prefix = f"{m.group(1)}." if m.group(1) else ""
+    members = []
+    for item in m.group(2).split():
+        members += [prefix + n for n in bus_members(item) or [item]]
+    return members
+
+
+def _unit_letter(unit):
+    letters = ""
+    while unit > 0:
+        unit, rest = divmod(unit - 1, 26)
+        letters = chr(ord("A") + rest) + letters
+    return letters
+
+
+def _pin_label(symbol, pin, ref, force_pad):
+    """
+    Eeschema's default net name part for a pin: 'REF-NAME' or, for a pin
+    without its own name, 'REF-PadN'. Named pins get the unit letter of a
+    multi-unit symbol, and '-PadN' when forced or when the name is shared.
+    """
+    name = "" if pin.name in ("~", pin.number) else pin.name
+    if not name:
+        return f"{ref}-Pad{pin.number}"
+    if symbol.units > 1:
+        ref += _unit_letter(symbol.unit)
+    shared = any(p.name == pin.name and p.number != pin.number for p in symbol.pins)
+    if force_pad or shared:
+        return f"{ref}-{name}-Pad{pin.number}"
+    return f"{ref}-{name}"
+
+
+class _WireIndex:
+    """Wires of one sheet, indexed so that points inside a wire are found by hash lookups."""
+
+    def __init__(self, wires, nodes):
+        self.rows = {}              # y key -> [(x1 key, x2 key, node)]
+        self.cols = {}              # x key -> [(y1 key, y2 key, node)]
+        self.slanted = []           # (x1, y1, x2, y2, node)
+        for (x1, y1, x2, y2), node in zip(wires, nodes):
+            (a, b), (c, d) = _key(x1, y1), _key(x2, y2)
+            if b == d:
+                self.rows.setdefault(b, []).append((min(a, c), max(a, c), node))
+            elif a == c:
+                self.cols.setdefault(a, []).append((min(b, d), max(b, d), node))
+            else:
+                self.slanted.append((x1, y1, x2, y2, node))
+
+    def through(self, key, x, y):
+        """Nodes of the wires passing through a point, end points included."""
+        kx, ky = key
+        found = [n for lo, hi, n in self.rows.get(ky, ()) if lo <= kx <= hi]
+        found += [n for lo, hi, n in self.cols.get(kx, ()) if lo <= ky <= hi]
+        for x1, y1, x2, y2, n in self.slanted:
+            if (min(x1, x2) - 1e-4 <= x <= max(x1, x2) + 1e-4
+                    and min(y1, y2) - 1e-4 <= y <= max(y1, y2) + 1e-4
+                    and abs((x2 - x1) * (y - y1) - (y2 - y1) * (x - x1))
+                    <= 1e-4 * max(abs(x2 - x1), abs(y2 - y1))):
+                found.append(n)
+        return found
+
+
+def _connect_sheet(nodes, inst, prefix, sheet):
+    """
+    Add the items of one sheet instance and join what touches. prefix is the
+    sheet name path used for local names, e.g. '/2/'.
+    """
+    at = {}                         # coordinate key -> nodes on that point
+    loose = []                      # (key, x, y, node) that also join wires they lie inside
+
+    def place(x, y, node, inside=False):
+        key = _key(x, y)
+        at.setdefault(key, []).append(node)
+        if inside:
+            loose.append((key, x, y, node))
+
+    wire_nodes = []
+    for x1, y1, x2, y2 in sheet.wires:
+        node = nodes.add()
+        wire_nodes.append(node)
+        place(x1, y1, node)
+        place(x2, y2, node)
+    for x, y in sheet.junctions:
+        place(x, y, nodes.add(), True)
+
+    for label in sheet.labels:
+        members = bus_members(label.name)
+        if members:
+            # A bus label gives its members the label's scope; wires join a
+            # member through a net label of the same name on this sheet
+            for name in members:
+                if label.kind == "global":
+                    node = nodes.add((GLOBAL, name, name))
+                    nodes.join_name(("global", name), node)
+                elif label.kind == "hierarchical":
+                    node = nodes.add((HIER_LABEL, name, prefix + name))
+                    nodes.join_name(("sheet", inst, name), node)
+                else:
+                    continue
+                nodes.join_name(("local", inst, name), node)
+            continue
+        if label.kind == "global":
+            node = nodes.add((GLOBAL, label.name, label.name))
+            nodes.join_name(("global", label.name), node)
+        elif label.kind == "local":
+            node = nodes.add((LOCAL_LABEL, label.name, prefix + label.name))
+            nodes.join_name(("local", inst, label.name), node)
+        else:
+            node = nodes.add((HIER_LABEL, label.name, prefix + label.name))
+            nodes.join_name(("sheet", inst, label.name), node)
+        place(label.x, label.y, node, True)
+
+    for link in sheet.sheets:
+        for pin in link.pins:
+            members = bus_members(pin.name)
+            for name in members:
+                node = nodes.add((SHEET_PIN, name, prefix + name))
+                nodes.join_name(("sheet", f"{inst}/{link.uuid}", name), node)
+                nodes.join_name(("local", inst, name), node)
+            if not members:
+                node = nodes.add((SHEET_PIN, pin.name, prefix + pin.name))
+                nodes.join_name(("sheet", f"{inst}/{link.uuid}", pin.name), node)
+                place(pin.x, pin.y, node)
+
+    for symbol in sheet.symbols:
+        ref = schematic.reference(symbol, inst)
+        netlisted = symbol.on_board and not ref.startswith("#")
+        for pin in symbol.pins:
+            pin_id = f"{ref}/{pin.number}" if netlisted else None
+            if symbol.power:
+                node = nodes.add((POWER_PIN, symbol.value, symbol.value), pin_id)
+                nodes.join_name(("global", symbol.value), node)
+            elif pin.type == "power_in" and pin.hidden:
+                node = nodes.add((POWER_PIN, pin.name, pin.name), pin_id)
+                nodes.join_name(("global", pin.name), node)
+            else:
+                node = nodes.add((PIN, symbol, ref, pin), pin_id)
+            place(pin.x, pin.y, node)
+
+    for group in at.values():
+        for node in group[1:]:
+            nodes.union(group[0], node)
+    if sheet.wires:
+        wires = _WireIndex(sheet.wires, wire_nodes)
+        for key, x, y, node in loose:
+            for wire in wires.through(key, x, y):
+                nodes.union(node, wire)
+
+
+def _net_name(nodes, members):
+    """Name of a net from its strongest driver, ties broken as Eeschema does."""
+    best = None
+    pin_count = sum(1 for n in members if nodes.pins[n] is not None)
+    for n in members:
+        driver = nodes.drivers[n]
+        if driver is None:
+            continue
+        if driver[0] == PIN:
+            _, symbol, ref, pin = driver
+            lonely = pin_count == 1 or pin.type == "no_connect"
+            label = _pin_label(symbol, pin, ref, lonely)
+            name = f"unconnected-({label})" if lonely else f"Net-({label})"
+            rank = (PIN, "-Pad" in name, name)
+        else:
+            priority, rank_name, name = driver
+            rank = (priority, "-Pad" in rank_name, rank_name)
+        # Highest priority, then names without '-Pad', then the smallest name
+        if best is None or (-rank[0], rank[1], rank[2]) < (-best[0][0], best[0][1], best[0][2]):
+            best = (rank, name)
+    return best[1] if best else None
+
+
+def process_schematic(root, jobs=None, use_cache=True):
+    """Netlist of a hierarchical schematic as {net name: {"REF/pin"}}."""
+    return schematic_nets(schematic.load_schematic(root, jobs, use_cache))
+
+
+def schematic_nets(sch):
+    """Netlist of a loaded schematic.Schematic, as process_schematic returns it."""
+    nodes = _Nodes()
+    prefixes = {}
+    for inst, link, sheet in schematic.walk(sch):
+        parent = inst.rsplit("/", 1)[0]
+        prefixes[inst] = f"{prefixes[parent]}{link.name}/" if parent in prefixes else "/"
+        _connect_sheet(nodes, inst, prefixes[inst], sheet)
+
+    groups = {}
+    for n in range(len(nodes.parent)):
+        groups.setdefault(nodes.find(n), []).append(n)
+
+    net_dict = {}
+    for members in groups.values():
+        pins = {nodes.pins[n] for n in members if nodes.pins[n] is not None}
+        if not pins:
+            continue
+        name = _net_name(nodes, members)
+        net_dict.setdefault(name, set()).update(pins)
+    return net_dict
+
+
+def compare_netlists(built, exported):
+    """Lines describing where two {name: pins} netlists differ; empty if they agree."""
+    lines = []
+    by_pins = {frozenset(pins): name for name, pins in exported.items()}
+    for name, pins in sorted(built.items()):
+        other = by_pins.pop(frozenset(pins), None)
+        if other is None:
+            lines.append(f"Only in schematic: {name} {sorted(pins)}")
+        elif other != name:
+            lines.append(f"Named differently: {name} (exported: {other})")
+    for pins, name in sorted(by_pins.items(), key=lambda item: item[1]):
+        lines.append(f"Only in netlist:   {name} {sorted(pins)}")
+    return lines
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the netlist of a KiCad schematic from its sheets.")
+    ap.add_argument("root", help="Root .kicad_sch file")
+    ap.add_argument("--net", help="Exported KiCad netlist to compare with (e.g. gdp.net)")
+    ap.add_argument("--jobs", type=int, default=None, help="Worker processes for parsing sheets")
+    ap.add_argument("--no-cache", action="store_true", help="Parse every sheet instead of using .cache files")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    nets = process_schematic(args.root, args.jobs, not args.no_cache)
+    dt = time.perf_counter() - t0
+    pins = sum(len(p) for p in nets.values())
+    print(f"{len(nets)} nets, {pins} pins in {dt * 1000:.0f} ms", file=sys.stderr)
+
+    if not args.net:
+        for name in sorted(nets):
+            print(f"{name}: {' '.join(sorted(nets[name]))}")
+        return
+
+    from read_nets import load_cached, process_kicad_file
+    differences = compare_netlists(nets, load_cached(process_kicad_file, args.net, not args.no_cache))
+    for line in differences:
+        print(line)
+    if differences:
+        sys.exit(1)
+    print(f"Netlist matches {args.net}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+watch.py
+
+Keep the netlist, the validation file and the board parsed in memory and
+re-emit the net differences (read_nets.py), the pad and via statistics
+(check_pads.py) and the BOM (output_bom.py) whenever one of them is saved.
+
+Only the file that changed is read again. On the board, only the top-level
+items (footprints, vias, ...) whose text changed are parsed again; with
+--sch the netlist is built from the schematic sheets and only the changed
+sheets are parsed again. The first report is printed in full, after that only the lines that
+changed since the previous report (--full prints every report in full).
+
+Files are polled for a new modification time or size every --interval
+seconds, so this works the same on Windows and Linux. A change is handled
+once the file has stayed the same for one interval, so a save that is still
+being written is not picked up halfway.
+
+Usage:
+  python watch.py --pcb ../gdp/gdp.kicad_pcb
+  python watch.py --sch
+  python watch.py --once
+"""
+
+import argparse
+import contextlib
+import difflib
+import glob
+import hashlib
+import io
+import os
+import re
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "gdp"))
+import check_pads  # noqa: E402
+import output_bom  # noqa: E402
+import schematic  # noqa: E402
+import read_nets  # noqa: E402
+import sch_nets  # noqa: E402
+
+HERE = Path(__file__).resolve().parent
+
+# Start of a top-level board item. KiCad writes them one indent level deep (a
+# tab, or two spaces before v7), as check_pads.split_points relies on too; a
+# board written otherwise is one item and simply always parsed again.
+_ITEM_RE = re.compile(r'\n(?:\t| {2})\(')
+
+SECTIONS = ("nets", "pads", "bom")
+
+
+def _captured(report, *args) -> list[str]:
+    """Lines a report function prints on stdout."""
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        report(*args)
+    return out.getvalue().splitlines()
+
+
+def _stamp(path):
+    """(mtime, size) of a file, None if it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+# ---------- Board ----------
+
+class Board:
+    """Pad and via counts and BOM records of a board, cached per top-level item."""
+
+    def __init__(self):
+        self.blocks = {}        # item digest -> (pad counts, via counts, BOM record or None)
+        self.pads = {}
+        self.vias = {}
+        self.by_value = {}
+        self.ic_pins = {}
+
+    @staticmethod
+    def _parse(item):
+        pads, vias = check_pads.scan_file(item)
+        record = output_bom.parse_footprint(item) if item.lstrip().startswith("(footprint") else None
+        return pads, vias, record
+
+    def update(self, path):
+        """Re-read the board; returns (items parsed, items in the board)."""
+        text = Path(path).read_text(encoding="utf-8", errors="ignore")
+        cuts = [0] + [m.start() for m in _ITEM_RE.finditer(text)] + [len(text)]
+        blocks = {}
+        pads, vias = Counter(), Counter()
+        records = []
+        parsed = 0
+        for start, end in zip(cuts, cuts[1:]):
+            item = text[start:end]
+            digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+            entry = blocks.get(digest) or self.blocks.get(digest)
+            if entry is None:
+                entry = self._parse(item)
+                parsed += 1
+            blocks[digest] = entry
+            item_pads, item_vias, record = entry
+            if item_pads:
+                pads.update(item_pads)
+            if item_vias:
+                vias.update(item_vias)
+            if record is not None:
+                records.append(record)
+        self.blocks = blocks
+        self.pads, self.vias = dict(pads), dict(vias)
+        self.by_value, self.ic_pins = output_bom.collect_parts(records)
+        return parsed, len(cuts) - 1
+
+    def pad_report(self) -> list[str]:
+        return _captured(check_pads.print_report, self.pads, self.vias)
+
+    def bom_report(self) -> list[str]:
+        # report() sorts the reference lists in place
+        by_value = {value: list(refs) for value, refs in self.by_value.items()}
+        return _captured(output_bom.report, by_value, self.ic_pins)
+
+
+# ---------- Watcher ----------
+
+class Watcher:
+    def __init__(self, args):
+        self.args = args
+        self.root = os.path.abspath(args.root)
+        self.net = os.path.abspath(args.net)
+        self.vld = os.path.abspath(args.vld)
+        self.pcb = os.path.abspath(args.pcb) if args.pcb else None
+        self.use_cache = not args.no_cache
+        self.board = Board()
+        self.sheets = {}        # absolute path -> schematic.Sheet, with --sch
+        self.sch_nets = None
+        self.vld_nets = None
+        self.reports = {}       # section -> lines of the last report
+
+    def files(self) -> list[str]:
+        """Files to watch; with --sch every sheet next to the root, so new sheets are seen too."""
+        files = [self.vld]
+        if self.args.sch:
+            pattern = os.path.join(glob.escape(os.path.dirname(self.root)), "*.kicad_sch")
+            files += sorted(os.path.abspath(p) for p in glob.glob(pattern))
+        else:
+            files.append(self.net)
+        if self.pcb:
+            files.append(self.pcb)
+        return files
+
+    def _load(self, path) -> Optional[str]:
+        """Re-read one changed file; returns a note on what was parsed, None for a sheet."""
+        if path == self.pcb:
+            parsed, count = self.board.update(path)
+            return f"{parsed} of {count} board items parsed"
+        if path == self.vld:
+            self.vld_nets = read_nets.fix_validation(read_nets.load_validation(path, self.use_cache))
+            return f"{len(self.vld_nets)} validation nets"
+        if path == self.net:
+            self.sch_nets = read_nets.load_cached(read_nets.process_kicad_file, path, self.use_cache)
+            return f"{len(self.sch_nets)} nets"
+        # A schematic sheet: forget it, it is parsed again with the hierarchy
+        self.sheets.pop(path, None)
+        return None
+
+    def _load_schematic(self) -> str:
+        parsed = []
+        sch = schematic.load_schematic(self.root, jobs=1, use_cache=self.use_cache,
+                                       parsed=parsed, known=self.sheets)
+        self.sheets = dict(sch.sheets)
+        self.sch_nets = sch_nets.schematic_nets(sch)
+        return f"{len(parsed)} of {len(self.sheets)} sheets parsed, {len(self.sch_nets)} nets"
+
+    def refresh(self, changed):
+        """Re-read the changed files; returns (notes, sections to report again)."""
+        notes = []
+        dirty = set()
+        sheets_changed = False
+        for path in changed:
+            name = os.path.basename(path)
+            try:
+                note = self._load(path)
+            except Exception as e:     # a half-saved file; keep the previous state
+                notes.append(f"{name}: {type(e).__name__}: {e}")
+                continue
+            if note is None:
+                sheets_changed = True
+                continue
+            notes.append(f"{name}: {note}")
+            dirty.update(("pads", "bom") if path == self.pcb else ("nets",))
+        if sheets_changed:
+            try:
+                notes.append(f"{os.path.basename(self.root)}: {self._load_schematic()}")
+                dirty.add("nets")
+            except Exception as e:
+                notes.append(f"{os.path.basename(self.root)}: {type(e).__name__}: {e}")
+        return notes, dirty
+
+    def report(self, section) -> list[str]:
+        if section == "nets":
+            if self.sch_nets is None or self.vld_nets is None:
+                return []
+            return _captured(read_nets.print_differences, self.sch_nets, self.vld_nets)
+        if section == "pads":
+            return self.board.pad_report()
+        return self.board.bom_report()
+
+    def emit(self, changed, full):
+        t0 = time.perf_counter()
+        notes, dirty = self.refresh(changed)
+        new = {section: self.report(section) for section in SECTIONS if section in dirty}
+        ms = (time.perf_counter() - t0) * 1000
+
+        print(f"[{time.strftime('%H:%M:%S')}] {'; '.join(notes)} ({ms:.0f} ms)")
+        for section in SECTIONS:
+            if section not in new:
+                continue
+            old, lines = self.reports.get(section), new[section]
+            self.reports[section] = lines
+            if full or old is None:
+                print(f"=== {section} ({len(lines)} lines) ===")
+                for line in lines:
+                    print(line)
+                continue
+            diff = [line for line in difflib.unified_diff(old, lines, n=0, lineterm="")
+                    if line[:1] in "+-" and not line.startswith(("+++", "---"))]
+            if diff:
+                print(f"=== {section}: {len(diff)} lines changed ===")
+                for line in diff:
+                    print(line)
+            else:
+                print(f"=== {section}: no change ===")
+        sys.stdout.flush()
+
+    def run(self):
+        handled = {}            # path -> stamp when last read
+        previous = {}           # path -> stamp at the previous poll
+        first = True
+        while True:
+            stamps = {path: _stamp(path) for path in self.files()}
+            if first:
+                ready = [path for path, stamp in stamps.items() if stamp is not None]
+            else:
+                # Changed since it was read, and the same as one interval ago
+                ready = [path for path, stamp in stamps.items()
+                         if stamp is not None and stamp != handled.get(path) and stamp == previous.get(path)]
+            if ready:
+                self.emit(ready, self.args.full)
+                for path in ready:
+                    handled[path] = stamps[path]
+            if first:
+                missing = [os.path.basename(p) for p, stamp in stamps.items() if stamp is None]
+                if missing:
+                    print(f"Waiting for: {', '.join(missing)}", file=sys.stderr)
+                if self.args.once:
+                    return
+                first = False
+            previous = stamps
+            time.sleep(self.args.interval)
+
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Re-run the net, pad and BOM reports whenever the netlist, validation file or board is saved.")
+    ap.add_argument("--pcb", default=str(HERE.parent / "gdp" / "gdp.kicad_pcb"),
+                    help="Board for the pad and BOM reports (default: ../gdp/gdp.kicad_pcb)")
+    ap.add_argument("--net", default=str(HERE / "gdp.net"), help="Exported KiCad netlist (default: gdp.net)")
+    ap.add_argument("--vld", default=str(HERE / "gdp_validacija.txt"),
+                    help="Validation file (default: gdp_validacija.txt)")
+    ap.add_argument("--sch", action="store_true",
+                    help="Build the netlist from the schematic sheets instead of --net")
+    ap.add_argument("--root", default=str(HERE.parent / "gdp" / "gdp.kicad_sch"),
+                    help="Root schematic sheet for --sch (default: ../gdp/gdp.kicad_sch)")
+    ap.add_argument("--interval", type=float, default=0.5, help="Seconds between polls (default: 0.5)")
+    ap.add_argument("--full", action="store_true", help="Print every report in full, not only the changes")
+    ap.add_argument("--once", action="store_true", help="Print the reports once and exit")
+    ap.add_argument("--no-cache", action="store_true", help="Do not use or write .cache files")
+    args = ap.parse_args()
+
+    try:
+        Watcher(args).run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()